@@ -1,78 +1,168 @@
+import asyncio
+import importlib
 import uuid
-import gradio as gr
+
+from source.startup import startup
+
+with startup.phase("import_gradio"):
+    import gradio as gr
 
 from source.config import (
     NEO4J_URI,
     NEO4J_USER,
     NEO4J_PASSWORD,
     DEFAULT_SYSTEM_PROMPT,
+    CHAT_MODEL,
+    SESSION_IDLE_TIMEOUT,
+    MAX_SESSIONS,
+    SESSION_BACKEND,
+    SESSION_PATH,
+    STREAM_COALESCE_WINDOW,
+    STREAM_COALESCE_CHARS,
+    SERVER_HOST,
+    SERVER_PORT,
+    WARMUP_ON_STARTUP,
+    CONSOLIDATION_INTERVAL,
+    INGESTION_MODE,
+    API_ENABLED,
+    API_BATCH_CONCURRENCY,
+    API_BATCH_MAX_TURNS,
+    HEALTH_CHECK_INTERVAL,
+    HEALTH_PROBE_TIMEOUT,
+    RECONNECT_BACKOFF_INITIAL,
+    RECONNECT_BACKOFF_MAX,
+    SHUTDOWN_DRAIN_TIMEOUT,
+    PERSONA_PAGE_SIZE,
 )
-from source.service import GraphitiService
-from source.graph import AgentRunner
+# graphiti_core, langgraph and langchain_openai are imported on first use (or by the
+# startup warmup) so the UI can be served before they have loaded
+from source.lifecycle import ServiceLifecycle, ServiceUnavailable
+from source.sessions import create_session_registry
+from source.streaming import coalesce
+from source.tracing import tracer
+
 
+_sessions = create_session_registry(SESSION_BACKEND, SESSION_PATH, idle_timeout=SESSION_IDLE_TIMEOUT, max_sessions=MAX_SESSIONS)
 
-_service = None
-_agent = None
-_current_persona = None
 
+async def _create_service():
+    with startup.phase("import_service"):
+        from source.service import GraphitiService
+    return await GraphitiService.create(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
 
-async def _ensure_service():
-    global _service
-    if _service is None:
-        _service = await GraphitiService.create(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
-    return _service
 
+async def _create_agent(service):
+    with startup.phase("import_agent"):
+        from source.graph import AgentRunner
+    with startup.phase("agent_init"):
+        return AgentRunner(service, model=CHAT_MODEL)
 
-async def _create_agent_with_persona(persona_uuid: str):
-    global _agent, _current_persona
-    service = await _ensure_service()
-    _current_persona = await service.get_persona_by_uuid(persona_uuid)
-    _agent = AgentRunner(service, model="gpt-4.1")
-    return _agent
+
+lifecycle = ServiceLifecycle(
+    _create_service,
+    _create_agent,
+    probe_timeout=HEALTH_PROBE_TIMEOUT,
+    check_interval=HEALTH_CHECK_INTERVAL,
+    backoff_initial=RECONNECT_BACKOFF_INITIAL,
+    backoff_max=RECONNECT_BACKOFF_MAX,
+    drain_timeout=SHUTDOWN_DRAIN_TIMEOUT,
+)
 
 
-async def _start_session(user_name: str, system_prompt: str):
-    service = await _ensure_service()
-    user_uuid = await service.get_or_create_user_uuid(user_name)
-    return user_uuid, uuid.uuid4().hex
+async def _warmup():
+    """Connect to the graph and load the agent in the background while the UI is served"""
+    try:
+        # Imported off the event loop so requests keep being served meanwhile
+        with startup.phase("import_background"):
+            for module in ("source.service", "source.graph"):
+                await asyncio.to_thread(importlib.import_module, module)
+        await lifecycle.ensure_agent()
+        with startup.phase("persona_catalog"):
+            await lifecycle.service.get_all_personas()
+        startup.milestone("warm")
+    except Exception as e:
+        print(f"Error warming up: {e}")
+    print(startup.render())
 
 
-async def _chat(history, user_input, user_name, system_prompt, user_uuid, thread_id):
-    global _agent, _current_persona
-    if _agent is None or _current_persona is None:
+async def _consolidate():
+    """Periodic memory consolidation; serve.py runs it in its drainer instead of in every worker"""
+    service = await lifecycle.ensure_service()
+    try:
+        consolidator = service.consolidator()
+    except RuntimeError as e:
+        print(f"Error starting consolidation: {e}")
+        return
+    await consolidator.run(CONSOLIDATION_INTERVAL)
+
+
+async def _activate_persona(session_key: str, persona_uuid: str, user_name: str = "") -> dict:
+    service = await lifecycle.ensure_service()
+    await lifecycle.ensure_agent()
+    persona = await service.get_persona_by_uuid(persona_uuid)
+    if persona:
+        _sessions.set_persona(session_key, persona)
+        if user_name:
+            # User and persona are both known now, so the group's index loads before the first turn
+            service.warm_memory(user_name, persona_uuid)
+    return persona
+
+
+async def _start_session() -> str:
+    """A new conversation thread; the user's node is resolved per persona by the agent"""
+    await lifecycle.ensure_service()
+    return uuid.uuid4().hex
+
+
+async def _chat(history, user_input, user_name, system_prompt, thread_id, session_key):
+    persona = _sessions.get(session_key).persona
+    agent = lifecycle.agent
+    if agent is None or not persona:
         # Use yield instead of return for async generators
         yield history + [{"role": "assistant", "content": "❌ Please create and select an agent persona first using the controls above."}]
         return  # Use return without a value to exit the generator
     
-    # Get AI name from current persona
-    ai_name = _current_persona.get("full_name", _current_persona.get("name", "AI friend"))
+    # Get AI name from the session's persona
+    ai_name = persona.get("full_name", persona.get("name", "AI friend"))
     
     state = {
         "messages": [{"role": "user", "content": user_input}],
         "user_name": user_name,
-        "user_node_uuid": user_uuid,
         "system_prompt": system_prompt,
-        "ai_persona": _current_persona,
+        "ai_persona": persona,
     }
 
     # Create initial history entry with messages format
-    history_with_user = history + [{"role": "user", "content": user_input}]
-    yield history_with_user
+    history.append({"role": "user", "content": user_input})
+    yield history
     
-    # Stream the response
-    async for partial_response in _agent.astream_response(state, thread_id=thread_id, ai_name=ai_name):
-        # Update the last message to include assistant response
-        history_with_user = history + [
-            {"role": "user", "content": user_input},
-            {"role": "assistant", "content": partial_response}
-        ]
-        yield history_with_user
+    # Stream the response, growing the last message in place
+    assistant_message = {"role": "assistant", "content": ""}
+    history.append(assistant_message)
+    # Already loaded together with the agent
+    from source.scheduler import SchedulerOverloaded
+
+    try:
+        # Shutdown waits for the turn to finish streaming
+        async with lifecycle.turn():
+            deltas = agent.astream_response(state, thread_id=thread_id, ai_name=ai_name, deltas=True)
+            async for text in coalesce(deltas, window=STREAM_COALESCE_WINDOW, max_chars=STREAM_COALESCE_CHARS):
+                assistant_message["content"] += text
+                yield history
+    except SchedulerOverloaded as e:
+        print(f"Error streaming response: {e}")
+        assistant_message["content"] += "\n\n⚠️ The assistant is busy right now, please try again in a moment."
+        yield history
+    except ServiceUnavailable as e:
+        print(f"Error streaming response: {e}")
+        assistant_message["content"] += "\n\n⚠️ The assistant is restarting, please try again in a moment."
+        yield history
 
 
 async def create_persona(name, surname, age, profession, hobbies, additional_info):
     """Create a new agent persona"""
     try:
-        service = await _ensure_service()
+        service = await lifecycle.ensure_service()
         print(f"Debug: Creating persona - {name} {surname}, {age}, {profession}")
         uuid = await service.create_agent_persona(name, surname, age, profession, hobbies, additional_info)
         print(f"Debug: Created persona with UUID: {uuid}")
@@ -94,18 +184,25 @@ async def create_persona(name, surname, age, profession, hobbies, additional_inf
         return gr.update(), f"❌ Error: {str(e)}", name, surname, str(age), profession, hobbies, additional_info
 
 
-async def load_personas():
-    """Load all existing personas for the dropdown"""
+async def _persona_choices(query: str, page: int, after: str = "", refresh: bool = False) -> tuple[list, bool]:
+    """One page of (label, uuid) choices and whether another page follows"""
+    service = await lifecycle.ensure_service()
+    if refresh:
+        await service.get_all_personas(refresh=True)
+    # One extra persona tells whether there is a next page. Without a query the page starts
+    # after the last persona of the previous one, so later pages cost as much as the first
+    personas = await service.search_personas(query, page * PERSONA_PAGE_SIZE, PERSONA_PAGE_SIZE + 1, after)
+    print(f"Debug: Retrieved {len(personas)} personas")
+    from source.service import persona_display
+    # Labels are shown, uuids are what the selection hands back
+    return [(persona_display(p), p['uuid']) for p in personas[:PERSONA_PAGE_SIZE]], len(personas) > PERSONA_PAGE_SIZE
+
+
+async def load_personas(refresh: bool = False, query: str = "", page: int = 0):
+    """Load the first page of the personas matching the search for the selector"""
     try:
-        service = await _ensure_service()
-        personas = await service.get_all_personas()
-        print(f"Debug: Retrieved {len(personas) if personas else 0} personas")
-        
-        if personas:
-            choices = [f"{p['name']} {p['surname']} - {p['profession']}" for p in personas]
-            return gr.update(choices=choices, value=None)  # Set to None instead of empty string
-        else:
-            return gr.update(choices=[], value=None)
+        choices, _ = await _persona_choices(query, page, refresh=refresh)
+        return gr.update(choices=choices, value=None)  # Set to None instead of empty string
     except Exception as e:
         print(f"Error loading personas: {e}")
         import traceback
@@ -113,25 +210,38 @@ async def load_personas():
         return gr.update(choices=[], value=None)
 
 
-async def select_persona(persona_choice):
+async def browse_personas(query: str, page: int, cursors: list, step: int = 0, refresh: bool = False):
+    """Move the selector to another page of the search results.
+
+    cursors[i] is the uuid of the last persona shown before page i, the keyset page i starts after.
+    """
+    page = max(0, page + step)
+    cursors = (cursors or [""])[:page + 1]
+    try:
+        choices, has_more = await _persona_choices(query, page, cursors[page] if page < len(cursors) else "", refresh)
+    except Exception as e:
+        print(f"Error loading personas: {e}")
+        choices, has_more = [], False
+    if choices:
+        cursors.append(choices[-1][1])
+    return (
+        gr.update(choices=choices, value=None),
+        page,
+        cursors,
+        gr.update(interactive=page > 0),
+        gr.update(interactive=has_more),
+    )
+
+
+async def select_persona(persona_uuid, user_name, request: gr.Request):
     """Select a persona and initialize the agent"""
     try:
-        if not persona_choice:
+        if not persona_uuid:
             return "Please select a persona", gr.update(interactive=False), gr.update(value="No agent selected")
         
-        service = await _ensure_service()
-        personas = await service.get_all_personas()
-        
-        # Find the selected persona
-        selected_persona = None
-        for persona in personas:
-            persona_display = f"{persona['name']} {persona['surname']} - {persona['profession']}"
-            if persona_display == persona_choice:
-                selected_persona = persona
-                break
+        selected_persona = await _activate_persona(request.session_hash, persona_uuid, user_name)
         
         if selected_persona:
-            await _create_agent_with_persona(selected_persona['uuid'])
             persona_info = f"""**Selected Agent:** {selected_persona['name']} {selected_persona['surname']}
 **Age:** {selected_persona['age']} | **Profession:** {selected_persona['profession']}
 **Hobbies:** {selected_persona['hobbies']}"""
@@ -145,6 +255,16 @@ async def select_persona(persona_choice):
         error_msg = f"❌ Error selecting persona: {str(e)}"
         return error_msg, gr.update(interactive=False), gr.update(value="Error selecting agent")
 
+async def on_send(message, name, prompt, tid, history, request: gr.Request):
+    if not tid:
+        tid = await _start_session()
+
+    yield history, "", tid
+
+    async for updated_history in _chat(history, message, name, prompt, tid, request.session_hash):
+        yield updated_history, "", tid
+
+
 def build_app():
     with gr.Blocks(title="Graphiti Memory Chat with Agent Personas") as demo:
         gr.Markdown("# Graphiti Memory Chat with Agent Personas")
@@ -164,6 +284,7 @@ def build_app():
                         gr.Markdown("### 1. Select & Activate Agent")
                         load_btn = gr.Button("🔄 Refresh Agents List", variant="secondary")
                         select_btn = gr.Button("✅ Activate Agent & Start Chat", variant="primary")
+                        persona_search = gr.Textbox(label="Search agents", placeholder="Name, profession or hobby")
                         with gr.Column(elem_classes="scrollable-list"):
                             persona_list = gr.Radio( 
                                 label="Select Agent",
@@ -171,6 +292,11 @@ def build_app():
                                 value=None,
                                 interactive=True,
                             )
+                        with gr.Row():
+                            prev_page_btn = gr.Button("◀ Previous", variant="secondary", interactive=False, size="sm")
+                            next_page_btn = gr.Button("Next ▶", variant="secondary", interactive=False, size="sm")
+                        persona_page = gr.State(0)
+                        persona_cursors = gr.State([""])
 
                     # --- Persona Creation Section (Right Column) ---
                     with gr.Column(scale=1):
@@ -213,19 +339,34 @@ def build_app():
             send = gr.Button("Send", variant="primary", interactive=False)
             clear = gr.Button("New Session", variant="secondary")
 
-        user_uuid = gr.State("")
         thread_id = gr.State("")
 
         # --- Event Handlers for the Modal Pop-up ---
 
+        # The selector shows one page of the personas matching the search box
+        page_outputs = [persona_list, persona_page, persona_cursors, prev_page_btn, next_page_btn]
+
+        async def first_page(query):
+            return await browse_personas(query, 0, [""])
+
+        async def reload_first_page(query):
+            return await browse_personas(query, 0, [""], refresh=True)
+
+        async def previous_page(query, page, cursors):
+            return await browse_personas(query, page, cursors, -1)
+
+        async def next_page(query, page, cursors):
+            return await browse_personas(query, page, cursors, 1)
+
         # Open Modal
         manage_agents_btn.click(
             lambda: gr.update(visible=True),
             inputs=None,
             outputs=[agent_manager_modal]
         ).then(
-            load_personas,
-            outputs=[persona_list] # Changed from persona_dropdown
+            first_page,
+            inputs=[persona_search],
+            outputs=page_outputs,
         )
 
         # Close Modal
@@ -236,7 +377,10 @@ def build_app():
         )
 
         # --- Event Handlers for Agent Management ---
-        load_btn.click(load_personas, outputs=[persona_list]) # Changed from persona_dropdown
+        load_btn.click(reload_first_page, inputs=[persona_search], outputs=page_outputs)
+        persona_search.change(first_page, inputs=[persona_search], outputs=page_outputs, show_progress="hidden", trigger_mode="always_last")
+        prev_page_btn.click(previous_page, inputs=[persona_search, persona_page, persona_cursors], outputs=page_outputs)
+        next_page_btn.click(next_page, inputs=[persona_search, persona_page, persona_cursors], outputs=page_outputs)
 
         create_btn.click(
             create_persona,
@@ -247,7 +391,7 @@ def build_app():
         # Selection now also closes the modal automatically
         select_btn.click(
             select_persona,
-            inputs=[persona_list], # Changed from persona_dropdown
+            inputs=[persona_list, user_name], # Changed from persona_dropdown
             outputs=[persona_info, msg, agent_status]
         ).then(
             lambda: gr.update(visible=False),
@@ -262,34 +406,107 @@ def build_app():
             outputs=[send]
         )
 
-        async def on_mount():
-            uid, tid = await _start_session(user_name.value, system_prompt.value)
-            return {user_uuid: uid, thread_id: tid}
-
-        demo.load(on_mount, inputs=None, outputs=[user_uuid, thread_id])
+        # Start retrieval while the user is still typing; the runner debounces it
+        async def on_typing(message, name, tid, request: gr.Request):
+            persona = _sessions.get(request.session_hash).persona
+            if lifecycle.agent is not None and persona and tid:
+                lifecycle.agent.prefetch(tid, name, persona, message)
 
-        async def on_send(message, name, prompt, uid, tid, history):
-            if not uid:
-                uid, tid = await _start_session(name, prompt)
+        msg.change(
+            on_typing,
+            inputs=[msg, user_name, thread_id],
+            outputs=None,
+            queue=False,
+            show_progress="hidden",
+            trigger_mode="always_last",
+        )
 
-            yield history, "", uid, tid
+        async def on_mount():
+            return {thread_id: await _start_session()}
 
-            async for updated_history in _chat(history, message, name, prompt, uid, tid):
-                yield updated_history, "", uid, tid
+        demo.load(on_mount, inputs=None, outputs=[thread_id])
 
         send.click(
             on_send,
-            inputs=[msg, user_name, system_prompt, user_uuid, thread_id, chatbot],
-            outputs=[chatbot, msg, user_uuid, thread_id],
+            inputs=[msg, user_name, system_prompt, thread_id, chatbot],
+            outputs=[chatbot, msg, thread_id],
         )
 
-        async def on_clear(name, prompt):
-            uid, tid = await _start_session(name, prompt)
-            return [], uid, tid
+        async def on_clear():
+            return [], await _start_session()
+
+        clear.click(on_clear, inputs=None, outputs=[chatbot, thread_id])
+
+        def on_unload(request: gr.Request):
+            _sessions.drop(request.session_hash)
 
-        clear.click(on_clear, inputs=[user_name, system_prompt], outputs=[chatbot, user_uuid, thread_id])
+        demo.unload(on_unload)
 
     return demo 
+
+
+def create_server():
+    """Serve the Gradio UI together with the /metrics and /health endpoints"""
+    from contextlib import asynccontextmanager
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse, PlainTextResponse
+
+    @asynccontextmanager
+    async def lifespan(app):
+        startup.milestone("serving")
+        lifecycle.start()
+        warmup = asyncio.create_task(_warmup()) if WARMUP_ON_STARTUP else None
+        consolidation = None
+        if CONSOLIDATION_INTERVAL > 0 and INGESTION_MODE != "spool":
+            consolidation = asyncio.create_task(_consolidate())
+        yield
+        # uvicorn turns SIGTERM into this shutdown once open connections have closed
+        # (or SHUTDOWN_DRAIN_TIMEOUT passed); turns still running are drained here
+        for task in (warmup, consolidation):
+            if task is not None and not task.done():
+                task.cancel()
+        await lifecycle.drain()
+
+    server = FastAPI(lifespan=lifespan)
+
+    @server.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        service = lifecycle.service
+        if service is not None:
+            tracer.gauge("sessions_active", len(_sessions))
+            tracer.gauge("ingestion_queue_depth", service.ingestion_metrics()["queue_depth"])
+            tracer.gauge("retrieval_cache_bytes", service.cache_metrics()["size_bytes"])
+            if service.local_index is not None:
+                tracer.gauge("local_index_groups", service.local_index_metrics()["groups"])
+        return tracer.render_prometheus()
+
+    @server.get("/health/live")
+    async def live():
+        report = lifecycle.liveness()
+        return JSONResponse(report, status_code=200 if report["live"] else 503)
+
+    @server.get("/health/ready")
+    async def ready():
+        report = await lifecycle.readiness()
+        return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+    if API_ENABLED:
+        from source.api import create_api
+
+        # Registered before the UI mount at / so these paths are not shadowed
+        server.include_router(create_api(
+            lifecycle,
+            default_system_prompt=DEFAULT_SYSTEM_PROMPT,
+            batch_concurrency=API_BATCH_CONCURRENCY,
+            batch_max_turns=API_BATCH_MAX_TURNS,
+        ), prefix="/api")
+
+    with startup.phase("build_ui"):
+        demo = build_app().queue()
+    return gr.mount_gradio_app(server, demo, path="/")
+
+
 if __name__ == "__main__":
-    app = build_app()
-    app.queue().launch()
\ No newline at end of file
+    import uvicorn
+
+    uvicorn.run(create_server(), host=SERVER_HOST, port=SERVER_PORT, timeout_graceful_shutdown=SHUTDOWN_DRAIN_TIMEOUT)
@@ -0,0 +1,73 @@
+"""serve.py's front end and workers on fake backends, started by `bench.load --workers`.
+
+    python -m bench.cluster front    # front end, worker pool and spool drainer
+    python -m bench.cluster worker   # one app.py worker, started by the pool
+
+Both read the load test's arguments from BENCH_ARGS.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+import uvicorn
+
+from bench.fakes import FakeGraphiti
+from bench.load import _setup
+from source.checkpoint import create_store
+from source.config import (
+    CHECKPOINT_BACKEND,
+    CHECKPOINT_PATH,
+    LLM_MAX_CONCURRENCY,
+    SERVER_PORT,
+    SHUTDOWN_DRAIN_TIMEOUT,
+)
+
+
+def _fake_graph(args) -> FakeGraphiti:
+    return FakeGraphiti(
+        search_latency=args.search_latency,
+        ingest_latency=args.ingest_latency,
+        query_latency=args.query_latency,
+    )
+
+
+def run_front(args) -> None:
+    from serve import create_front
+    from source.service import GraphitiService
+
+    async def create_service():
+        return GraphitiService(_fake_graph(args))
+
+    front = create_front(args.workers, args.base_port + 1, [sys.executable, "-m", "bench.cluster", "worker"], create_service)
+    uvicorn.run(front, host="127.0.0.1", port=args.base_port, log_level="warning")
+
+
+async def run_worker(args) -> None:
+    import app
+
+    # The pool gave this worker its share of the LLM concurrency
+    args.llm_concurrency = LLM_MAX_CONCURRENCY
+    # History goes to the checkpoint file all workers share, as in a real deployment
+    service, runner, _ = await _setup(args, store=create_store(CHECKPOINT_BACKEND, CHECKPOINT_PATH))
+    app.lifecycle.attach(service, runner)
+    config = uvicorn.Config(
+        app.create_server(),
+        host="127.0.0.1",
+        port=SERVER_PORT,
+        log_level="warning",
+        timeout_graceful_shutdown=SHUTDOWN_DRAIN_TIMEOUT,
+    )
+    await uvicorn.Server(config).serve()
+
+
+if __name__ == "__main__":
+    role = sys.argv[1] if len(sys.argv) > 1 else ""
+    args = argparse.Namespace(**json.loads(os.environ["BENCH_ARGS"]))
+    if role == "front":
+        run_front(args)
+    elif role == "worker":
+        asyncio.run(run_worker(args))
+    else:
+        sys.exit("usage: python -m bench.cluster front|worker")
@@ -0,0 +1,380 @@
+"""In-memory stand-ins for the chat model and the Graphiti client used by the load harness"""
+import asyncio
+import hashlib
+import re
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from graphiti_core.search.search_config import EdgeReranker, NodeReranker
+from langchain_core.messages import AIMessage
+
+from source import config
+
+
+@dataclass
+class FakeMessage:
+    content: str
+
+
+class FakeChatModel:
+    """Deterministic streaming chat model with configurable latency"""
+
+    def __init__(self, tokens: int = 60, first_token_latency: float = 0.2, token_latency: float = 0.01):
+        self.tokens = tokens
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.calls = 0
+
+    def _reply(self, messages) -> list[str]:
+        last = messages[-1] if isinstance(messages, list) and messages else messages
+        text = last.get("content", "") if isinstance(last, dict) else getattr(last, "content", str(last))
+        seed = hashlib.sha256(text.encode()).hexdigest()
+        return [f"{seed[i % len(seed)]}{i} " for i in range(self.tokens)]
+
+    async def astream(self, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.first_token_latency)
+        for i, token in enumerate(self._reply(messages)):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            yield FakeMessage(token)
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.first_token_latency + self.token_latency * self.tokens)
+        # The LangGraph path stores the reply in its message state, which needs a real message type
+        return AIMessage(content="".join(self._reply(messages)))
+
+
+def _words(text: str) -> set[str]:
+    return set(re.findall(r"\w+", text.lower()))
+
+
+class FakeResult:
+    def __init__(self, records: list[dict]):
+        self._records = records
+
+    async def data(self) -> list[dict]:
+        return self._records
+
+    async def single(self):
+        return self._records[0] if self._records else None
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for record in self._records:
+            yield record
+
+
+class FakeSession:
+    def __init__(self, driver: "FakeDriver"):
+        self.driver = driver
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def run(self, query: str, parameters: dict | None = None, **kwargs) -> FakeResult:
+        await asyncio.sleep(self.driver.query_latency)
+        params = {**(parameters or {}), **kwargs}
+        handler = self.driver.handlers.get(query)
+        return FakeResult(handler(params) if handler else [])
+
+    async def execute_read(self, work, *args, **kwargs):
+        # The session doubles as its own transaction
+        return await work(self, *args, **kwargs)
+
+    execute_write = execute_read
+
+
+class FakeDriver:
+    """Answers the service's own Cypher constants from in-memory tables"""
+
+    def __init__(self, graph: "FakeGraphiti", query_latency: float = 0.002):
+        self.graph = graph
+        self.query_latency = query_latency
+        self.personas: list[dict] = []
+        self.handlers = {
+            config.AGENT_CREATOR: self._create_persona,
+            config.GET_PERSONAS: lambda p: [{'a': a} for a in reversed(self.personas)],
+            config.GET_PERSONAS_PAGE: self._personas_page,
+            config.GET_PERSONAS_PAGE_AFTER: self._personas_page,
+            config.GET_PERSONA: lambda p: [{'a': a} for a in self.personas if a['uuid'] == p['uuid']],
+            config.PERSONA_IMPORTER: self._import_personas,
+            config.SEARCH_PERSONAS: self._search_personas,
+            config.GET_USER: self._get_user,
+            config.MERGE_USER: self._merge_user,
+            config.CONSOLIDATION_GROUPS: self._consolidation_groups,
+            config.GRAPH_SIZE: self._graph_size,
+            config.MERGE_DUPLICATE_FACTS: self._merge_duplicate_facts,
+            config.PRUNE_EXPIRED_FACTS: lambda p: [{'pruned': 0}],
+            config.GET_OLD_EPISODES: self._old_episodes,
+            config.REPLACE_EPISODES: self._replace_episodes,
+            config.RELINK_FACT_EPISODES: self._relink_fact_episodes,
+            config.GROUP_FACTS: self._group_facts,
+            config.GROUP_ENTITIES: self._group_entities,
+            config.GROUP_EPISODES: self._group_episodes,
+        }
+
+    def session(self, **kwargs) -> FakeSession:
+        return FakeSession(self)
+
+    async def close(self):
+        pass
+
+    def _create_persona(self, params: dict) -> list[dict]:
+        self.personas.append(dict(params))
+        return [{'uuid': params['uuid']}]
+
+    def _import_personas(self, params: dict) -> list[dict]:
+        existing = {a['uuid']: a for a in self.personas}
+        for persona in params['personas']:
+            if persona['uuid'] in existing:
+                existing[persona['uuid']].update(persona)
+            else:
+                existing[persona['uuid']] = dict(persona)
+                self.personas.append(existing[persona['uuid']])
+        return [{'imported': len(params['personas'])}]
+
+    def _search_personas(self, params: dict) -> list[dict]:
+        # Every "word*" term of the Lucene query must prefix a word of the indexed fields
+        prefixes = [term.rstrip('*') for term in params['query'].split(' AND ')]
+        matches = []
+        for a in reversed(self.personas):
+            words = _words(f"{a['full_name']} {a['profession']} {a['hobbies']}")
+            if all(any(w.startswith(prefix) for w in words) for prefix in prefixes):
+                matches.append({'a': a})
+        return matches[params['offset']:params['offset'] + params['limit']]
+
+    def _personas_page(self, params: dict) -> list[dict]:
+        newest_first = list(reversed(self.personas))
+        start = 0
+        if params.get('after'):
+            uuids = [a['uuid'] for a in newest_first]
+            start = uuids.index(params['after']) + 1 if params['after'] in uuids else len(newest_first)
+        return [{'a': a} for a in newest_first[start:start + params['limit']]]
+
+    def _get_user(self, params: dict) -> list[dict]:
+        user = self.graph.entities.get((params['name'], params['group_id']))
+        return [{'uuid': user.uuid}] if user else []
+
+    def _merge_user(self, params: dict) -> list[dict]:
+        user = self.graph.entity_node(params['name'], params['group_id'], params['name_embedding'])
+        return [{'uuid': user.uuid}]
+
+    def _consolidation_groups(self, params: dict) -> list[dict]:
+        counts: dict[str, int] = {}
+        for episode in self.graph.episodes:
+            counts[episode.group_id] = counts.get(episode.group_id, 0) + 1
+        groups = sorted(g for g, n in counts.items() if g > params['after'] and n > params['keep_recent'])
+        return [{'group_id': g} for g in groups[:params['limit']]]
+
+    def _graph_size(self, params: dict) -> list[dict]:
+        def scoped(items):
+            return sum(1 for i in items if params['group_id'] is None or i.group_id == params['group_id'])
+        return [{
+            'episodes': scoped(self.graph.episodes),
+            'entities': scoped(self.graph.entities.values()),
+            'facts': scoped(self.graph.edges),
+        }]
+
+    def _merge_duplicate_facts(self, params: dict) -> list[dict]:
+        kept: dict[tuple, SimpleNamespace] = {}
+        merged = 0
+        for edge in list(self.graph.edges):
+            if edge.group_id != params['group_id']:
+                continue
+            key = (edge.source_node_uuid, edge.target_node_uuid, edge.fact.strip().lower())
+            if key in kept:
+                kept[key].episodes += [e for e in edge.episodes if e not in kept[key].episodes]
+                self.graph.edges.remove(edge)
+                merged += 1
+            else:
+                kept[key] = edge
+        return [{'merged': merged}]
+
+    def _old_episodes(self, params: dict) -> list[dict]:
+        raw = [e for e in self.graph.episodes if e.group_id == params['group_id'] and e.source_description != params['summary_source']]
+        old = sorted(raw, key=lambda e: e.valid_at, reverse=True)[params['keep_recent']:]
+        return [{'uuid': e.uuid, 'content': e.content} for e in sorted(old, key=lambda e: e.valid_at)[:params['limit']]]
+
+    def _replace_episodes(self, params: dict) -> list[dict]:
+        replaced = [e for e in self.graph.episodes if e.uuid in params['episode_uuids']]
+        self.graph.episodes = [e for e in self.graph.episodes if e.uuid not in params['episode_uuids']]
+        self.graph.episodes.append(SimpleNamespace(
+            uuid=params['uuid'],
+            name=params['name'],
+            content=params['content'],
+            group_id=params['group_id'],
+            source_description=params['summary_source'],
+            created_at=datetime.now(timezone.utc),
+            valid_at=max(e.valid_at for e in replaced),
+        ))
+        return [{'uuid': params['uuid']}]
+
+    def _relink_fact_episodes(self, params: dict) -> list[dict]:
+        for edge in self.graph.edges:
+            if edge.group_id == params['group_id'] and set(edge.episodes) & set(params['episode_uuids']):
+                edge.episodes = [e for e in edge.episodes if e not in params['episode_uuids']] + [params['uuid']]
+        return []
+
+    def _group_facts(self, params: dict) -> list[dict]:
+        return [{
+            'uuid': e.uuid, 'fact': e.fact, 'embedding': e.fact_embedding, 'created_at': e.created_at,
+            'valid_at': e.valid_at, 'source_node_uuid': e.source_node_uuid, 'target_node_uuid': e.target_node_uuid,
+        } for e in self.graph.edges if e.group_id == params['group_id']][:params['limit']]
+
+    def _group_entities(self, params: dict) -> list[dict]:
+        return [{
+            'uuid': n.uuid, 'name': n.name, 'summary': n.summary, 'embedding': n.name_embedding, 'created_at': n.created_at,
+        } for n in self.graph.entities.values() if n.group_id == params['group_id']][:params['limit']]
+
+    def _group_episodes(self, params: dict) -> list[dict]:
+        return [{
+            'uuid': e.uuid, 'content': e.content, 'created_at': e.created_at, 'valid_at': e.valid_at,
+        } for e in self.graph.episodes if e.group_id == params['group_id']][:params['limit']]
+
+
+class FakeEmbedder:
+    """Hashed bag of words, so texts sharing words have a positive cosine"""
+
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+
+    def embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.dim
+        for word in _words(text):
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        return vector
+
+    async def create(self, input_data):
+        text = input_data[0] if isinstance(input_data, list) else input_data
+        return self.embed(text)
+
+
+class FakeLLMClient:
+    """Graphiti-side LLM for the consolidation job: a summary is the first line of each excerpt"""
+
+    def __init__(self, latency: float = 0.2):
+        self.latency = latency
+        self.calls = 0
+
+    async def generate_response(self, messages, response_model=None, max_tokens=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        excerpts = messages[-1].content.split("Excerpts:", 1)[-1].split("\n---\n")
+        return {'summary': "\n".join(e.strip().splitlines()[0] for e in excerpts if e.strip())}
+
+
+class FakeGraphiti:
+    """Stand-in for graphiti_core.Graphiti: word-overlap search and simulated extraction latency"""
+
+    def __init__(self, search_latency: float = 0.03, ingest_latency: float = 0.5, query_latency: float = 0.002):
+        self.search_latency = search_latency
+        self.ingest_latency = ingest_latency
+        self.driver = FakeDriver(self, query_latency)
+        self.llm_client = FakeLLMClient()
+        self.embedder = FakeEmbedder()
+        # Keyed by (name, group_id): Graphiti extracts an entity once per conversation group
+        self.entities: dict[tuple[str, str], SimpleNamespace] = {}
+        self.edges: list[SimpleNamespace] = []
+        self.episodes: list[SimpleNamespace] = []
+        self.episode_writes = 0
+
+    def entity_node(self, name: str, group_id: str = "", name_embedding: list[float] | None = None) -> SimpleNamespace:
+        key = (name, group_id)
+        if key not in self.entities:
+            self.entities[key] = SimpleNamespace(
+                uuid=str(uuid.uuid4()),
+                name=name,
+                group_id=group_id,
+                summary=f"{name} takes part in the chat",
+                created_at=datetime.now(timezone.utc),
+                name_embedding=name_embedding or self.embedder.embed(name),
+            )
+        return self.entities[key]
+
+    async def build_indices_and_constraints(self, *args, **kwargs):
+        pass
+
+    async def close(self):
+        pass
+
+    async def add_episode(self, name: str, episode_body: str, source_description: str, reference_time: datetime, source=None, group_id: str | None = None, **kwargs):
+        await asyncio.sleep(self.ingest_latency)
+        return self._record_episode(name, episode_body, reference_time, group_id)
+
+    def _record_episode(self, name: str, episode_body: str, reference_time: datetime, group_id: str | None):
+        self.episode_writes += 1
+        episode = SimpleNamespace(
+            uuid=str(uuid.uuid4()),
+            name=name,
+            content=episode_body,
+            group_id=group_id or "",
+            source_description="",
+            created_at=datetime.now(timezone.utc),
+            valid_at=reference_time,
+        )
+        self.episodes.append(episode)
+        user_name, _, ai_name = name.removeprefix("Chat: ").partition(" with ")
+        user = self.entity_node(user_name, group_id or "")
+        ai = self.entity_node(ai_name, group_id or "")
+        edges = []
+        for line in episode_body.splitlines():
+            # Each line becomes a fact about its speaker
+            speaker = user if line.startswith("User ") else ai
+            edge = SimpleNamespace(
+                uuid=str(uuid.uuid4()),
+                fact=line,
+                group_id=group_id or "",
+                source_node_uuid=speaker.uuid,
+                target_node_uuid=str(uuid.uuid4()),
+                created_at=episode.created_at,
+                valid_at=None,
+                expired_at=None,
+                episodes=[episode.uuid],
+                fact_embedding=self.embedder.embed(line),
+            )
+            edges.append(edge)
+        self.edges.extend(edges)
+        return SimpleNamespace(episode=episode, nodes=[user, ai], edges=edges)
+
+    async def add_episode_bulk(self, bulk_episodes: list, group_id: str | None = None, **kwargs):
+        # One extraction pass for the whole batch, like the real bulk path
+        await asyncio.sleep(self.ingest_latency)
+        results = [self._record_episode(raw.name, raw.content, raw.reference_time, group_id) for raw in bulk_episodes]
+        return SimpleNamespace(
+            episodes=[r.episode for r in results],
+            nodes=[n for r in results for n in r.nodes],
+            edges=[e for r in results for e in r.edges],
+        )
+
+    async def search_(self, query: str, config=None, group_ids: list[str] | None = None, center_node_uuid: str | None = None, **kwargs):
+        await asyncio.sleep(self.search_latency)
+        limit = getattr(config, "limit", 10)
+        words = _words(query)
+        linked = {e.target_node_uuid for e in self.edges if e.source_node_uuid == center_node_uuid}
+        linked |= {e.source_node_uuid for e in self.edges if e.target_node_uuid == center_node_uuid}
+
+        def distance(node_uuid: str) -> int:
+            return 0 if node_uuid == center_node_uuid else 1 if node_uuid in linked else 2
+
+        def top(items, text, search_config=None, node_uuid=None):
+            scoped = [i for i in items if not group_ids or i.group_id in group_ids]
+            scored = sorted(scoped, key=lambda i: len(words & _words(text(i))), reverse=True)
+            # Like Graphiti's node_distance reranker: hops from the center, search order on ties
+            if getattr(search_config, "reranker", None) in (EdgeReranker.node_distance, NodeReranker.node_distance):
+                scored.sort(key=lambda i: distance(node_uuid(i)))
+            return scored[:limit]
+
+        return SimpleNamespace(
+            edges=top(self.edges, lambda e: e.fact, getattr(config, "edge_config", None), lambda e: e.source_node_uuid),
+            nodes=top(list(self.entities.values()), lambda n: n.summary, getattr(config, "node_config", None), lambda n: n.uuid),
+            episodes=top(self.episodes, lambda e: e.content),
+        )
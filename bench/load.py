@@ -0,0 +1,452 @@
+"""Offline load test: N concurrent chat sessions against fake LLM and graph backends.
+
+    python -m bench.load --sessions 50 --turns 5
+    python -m bench.load --sessions 50 --mode app
+    python -m bench.load --sessions 50 --mode api      # or batch
+    python -m bench.load --sessions 400 --workers 4   # serve.py with fake-backed workers
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import httpx
+
+from bench.fakes import FakeChatModel, FakeGraphiti
+from source.cache import ResponseCache
+from source.checkpoint import ConversationStore, MemoryConversationStore
+from source.fact_index import LocalIndex
+from source.graph import AgentRunner
+from source.scheduler import LLMScheduler
+from source.service import GraphitiService, group_id_for
+from source.tracing import InMemorySink, tracer
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Recorder:
+    def __init__(self):
+        self.ttft: list[float] = []
+        self.turn_seconds: list[float] = []
+        self.tokens = 0
+        self.errors = 0
+
+    def summary(self, elapsed: float) -> dict:
+        return {
+            "turns": len(self.turn_seconds),
+            "errors": self.errors,
+            "elapsed_s": round(elapsed, 3),
+            "turns_per_s": round(len(self.turn_seconds) / elapsed, 2) if elapsed else 0.0,
+            "tokens_per_s": round(self.tokens / elapsed, 1) if elapsed else 0.0,
+            "ttft_p50_ms": round(percentile(self.ttft, 50) * 1000, 1),
+            "ttft_p95_ms": round(percentile(self.ttft, 95) * 1000, 1),
+            "ttft_p99_ms": round(percentile(self.ttft, 99) * 1000, 1),
+            "turn_mean_ms": round(statistics.fmean(self.turn_seconds) * 1000, 1) if self.turn_seconds else 0.0,
+        }
+
+    def report(self, elapsed: float, service: GraphitiService, extra: dict | None = None) -> dict:
+        ingestion = service.ingestion_metrics()
+        return {
+            **self.summary(elapsed),
+            "ingestion_max_lag_s": ingestion["max_lag_seconds"],
+            "ingestion_processed": ingestion["processed"],
+            "episode_writes": service.client.episode_writes,
+            "retrieval_cache_hit_rate": service.cache_metrics()["hit_rate"],
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            **(extra or {}),
+        }
+
+
+def bench_personas(count: int) -> list[dict]:
+    # Fixed uuids, so separate worker processes agree on them
+    return [{
+        "uuid": f"agent_bench{i}",
+        "name": f"Persona{i}",
+        "surname": "Bench",
+        "full_name": f"Persona{i} Bench",
+        "age": 30 + i,
+        "profession": "Tester",
+        "hobbies": "benchmarks",
+        "additional_info": "Synthetic persona",
+    } for i in range(count)]
+
+
+async def _setup(args, store: ConversationStore | None = None) -> tuple[GraphitiService, AgentRunner, list[str]]:
+    client = FakeGraphiti(
+        search_latency=args.search_latency,
+        ingest_latency=args.ingest_latency,
+        query_latency=args.query_latency,
+    )
+    service = GraphitiService(client)
+    if args.local_index:
+        service.local_index = LocalIndex(service.store, client.embedder)
+    llm = FakeChatModel(
+        tokens=args.tokens,
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+    )
+    scheduler = LLMScheduler(max_concurrency=args.llm_concurrency, queue_size=args.sessions)
+    response_cache = ResponseCache() if args.response_cache else None
+    runner = AgentRunner(service, model="fake", llm=llm, store=store or MemoryConversationStore(), scheduler=scheduler, response_cache=response_cache)
+    personas = bench_personas(args.personas)
+    await service.import_personas(personas)
+    return service, runner, [persona["uuid"] for persona in personas]
+
+
+def _message(args, turn: int, user_name: str) -> str:
+    if turn == 0 and args.first_message:
+        return args.first_message
+    return f"Message {turn} from {user_name} about hobby {turn % 3}"
+
+
+async def _runner_session(index: int, args, service, runner, persona_uuids, recorder: Recorder):
+    await asyncio.sleep(args.ramp * index / max(1, args.sessions))
+    user_name = f"user{index}"
+    persona = await service.get_persona_by_uuid(persona_uuids[index % len(persona_uuids)])
+    thread_id = f"thread{index}"
+
+    for turn in range(args.turns):
+        state = {
+            "messages": [{"role": "user", "content": _message(args, turn, user_name)}],
+            "user_name": user_name,
+            "system_prompt": "You are a benchmark persona.",
+            "ai_persona": persona,
+        }
+        started = time.perf_counter()
+        first = None
+        try:
+            async for _ in runner.astream_response(state, thread_id=thread_id, ai_name=persona['full_name'], deltas=True):
+                if first is None:
+                    first = time.perf_counter() - started
+                recorder.tokens += 1
+        except Exception as e:
+            recorder.errors += 1
+            print(f"Error in session {index}: {e}")
+            continue
+        recorder.ttft.append(first or 0.0)
+        recorder.turn_seconds.append(time.perf_counter() - started)
+
+
+async def _app_session(index: int, args, app, persona_uuids, recorder: Recorder):
+    await asyncio.sleep(args.ramp * index / max(1, args.sessions))
+    request = SimpleNamespace(session_hash=f"session{index}")
+    await app.load_personas()
+    await app.select_persona(persona_uuids[index % len(persona_uuids)], f"user{index}", request)
+
+    tid, history = "", []
+    for turn in range(args.turns):
+        started = time.perf_counter()
+        first = None
+        previous = ""
+        # The handler appends the user message and then the reply it streams into
+        reply_index = len(history) + 1
+        async for chat, _, thread_id in app.on_send(_message(args, turn, f"user{index}"), f"user{index}", "You are a benchmark persona.", tid, history, request):
+            content = chat[reply_index]["content"] if len(chat) > reply_index else ""
+            if content and first is None:
+                first = time.perf_counter() - started
+            recorder.tokens += len(content[len(previous):].split())
+            previous = content
+        history, tid = chat, thread_id
+        recorder.ttft.append(first or 0.0)
+        recorder.turn_seconds.append(time.perf_counter() - started)
+
+
+async def _serve_api(args, service, runner):
+    """The headless API on an ephemeral local port, so streaming is measured over real HTTP"""
+    import uvicorn
+    from fastapi import FastAPI
+    from source.api import create_api
+    from source.lifecycle import ServiceLifecycle
+
+    lifecycle = ServiceLifecycle(None, None)
+    lifecycle.attach(service, runner)
+    api = FastAPI()
+    api.include_router(create_api(lifecycle, batch_concurrency=args.sessions, batch_max_turns=args.sessions), prefix="/api")
+    server = uvicorn.Server(uvicorn.Config(api, host="127.0.0.1", port=0, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+async def _api_session(index: int, args, client, persona_uuids, recorder: Recorder):
+    await asyncio.sleep(args.ramp * index / max(1, args.sessions))
+    for turn in range(args.turns):
+        body = {
+            "user_name": f"user{index}",
+            "persona_uuid": persona_uuids[index % len(persona_uuids)],
+            "message": _message(args, turn, f"user{index}"),
+            "system_prompt": "You are a benchmark persona.",
+            "thread_id": f"thread{index}",
+        }
+        started = time.perf_counter()
+        first = None
+        event = ""
+        # The thread id in the query string pins the conversation to one worker behind serve.py
+        async with client.stream("POST", "/api/chat/stream", json=body, params={"thread_id": body["thread_id"]}) as response:
+            if response.status_code != 200:
+                recorder.errors += 1
+                continue
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: ") and event == "delta":
+                    if first is None:
+                        first = time.perf_counter() - started
+                    recorder.tokens += 1
+                elif line.startswith("data: ") and event == "error":
+                    recorder.errors += 1
+        recorder.ttft.append(first or 0.0)
+        recorder.turn_seconds.append(time.perf_counter() - started)
+
+
+async def _api_batches(args, client, persona_uuids, recorder: Recorder):
+    """Every session's turn t in one batch request, one request per turn"""
+    indexes = range(args.sessions)
+    for turn in range(args.turns):
+        turns = [{
+            "user_name": f"user{i}",
+            "persona_uuid": persona_uuids[i % len(persona_uuids)],
+            "message": _message(args, turn, f"user{i}"),
+            "system_prompt": "You are a benchmark persona.",
+            "thread_id": f"thread{i}",
+        } for i in indexes]
+        started = time.perf_counter()
+        response = await client.post("/api/chat/batch", json={"turns": turns})
+        elapsed = time.perf_counter() - started
+        results = response.json()["results"] if response.status_code == 200 else []
+        if len(results) != len(turns):
+            recorder.errors += len(turns)
+            continue
+        for i, result in zip(indexes, results):
+            # Results must come back in request order
+            if result["error"] or result["thread_id"] != f"thread{i}":
+                recorder.errors += 1
+                continue
+            recorder.tokens += len(result["reply"].split())
+            recorder.ttft.append(elapsed)
+            recorder.turn_seconds.append(elapsed)
+
+
+async def run(args, recorder: Recorder | None = None) -> dict:
+    service, runner, persona_uuids = await _setup(args)
+    recorder = recorder or Recorder()
+
+    if args.mode == "app":
+        import app
+        app.lifecycle.attach(service, runner)
+        sessions = [_app_session(i, args, app, persona_uuids, recorder) for i in range(args.sessions)]
+    elif args.mode in ("api", "batch"):
+        server, server_task, base_url = await _serve_api(args, service, runner)
+        client = httpx.AsyncClient(base_url=base_url, timeout=None, limits=httpx.Limits(max_connections=None))
+        if args.mode == "api":
+            sessions = [_api_session(i, args, client, persona_uuids, recorder) for i in range(args.sessions)]
+        else:
+            sessions = [_api_batches(args, client, persona_uuids, recorder)]
+    else:
+        sessions = [_runner_session(i, args, service, runner, persona_uuids, recorder) for i in range(args.sessions)]
+
+    started = time.perf_counter()
+    await asyncio.gather(*sessions)
+    elapsed = time.perf_counter() - started
+    if args.mode in ("api", "batch"):
+        await client.aclose()
+        server.should_exit = True
+        await server_task
+
+    # Ingestion lag only means something once the queue has drained
+    drain_started = time.perf_counter()
+    await service.close()
+    drain_seconds = time.perf_counter() - drain_started
+    extra = {}
+    if args.consolidate:
+        # The fake graph stays readable after close, so the pass runs on the drained graph
+        extra["consolidation"] = await _consolidation_report(service, persona_uuids)
+    extra.update(await _distance_rerank_report(service, persona_uuids))
+    extra["llm_queue_wait_ms"] = runner.scheduler.metrics()["interactive"]["avg_wait_ms"]
+    sink = tracer.find_sink(InMemorySink)
+    searches = [span.duration * 1000 for span in sink.spans if span.name == "retrieve_informations.search"] if sink else []
+    extra["memory_search_p50_ms"] = round(percentile(searches, 50), 2)
+    if service.local_index is not None:
+        extra["local_index"] = service.local_index_metrics()
+    if runner.response_cache is not None:
+        extra["response_cache_hit_rate"] = runner.response_cache.metrics()["hit_rate"]
+    return recorder.report(elapsed, service, {
+        **extra,
+        "mode": args.mode,
+        "sessions": args.sessions,
+        "ingestion_drain_s": round(drain_seconds, 3),
+    })
+
+
+async def _consolidation_report(service: GraphitiService, persona_uuids: list[str]) -> dict:
+    """Graph size and search time for one session's memory before and after a consolidation pass"""
+    group_ids = [group_id_for("user0", persona_uuids[0])]
+
+    async def search_ms() -> float:
+        service.retrieval_cache.invalidate_group(group_ids[0])
+        started = time.perf_counter()
+        await service.retrieve_informations("", "Message about hobby 1", group_ids=group_ids)
+        return round((time.perf_counter() - started) * 1000, 2)
+
+    before_ms = await search_ms()
+    report = await service.consolidator(keep_recent=5, batch_size=10, pause=0, state_path="").run_once()
+    return {**report, "search_ms_before": before_ms, "search_ms_after": await search_ms()}
+
+
+def _counter(text: str, name: str) -> dict[str, float]:
+    """One counter of a Prometheus text page, by label string"""
+    values = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        metric, _, labels = series.partition("{")
+        if metric.endswith(f"_{name}"):
+            values[labels.rstrip("}")] = float(value)
+    return values
+
+
+async def _distance_rerank_report(service: GraphitiService, persona_uuids: list[str]) -> dict:
+    """Share of one session's top facts that are the user's own, searched without and with
+    the user node as node_distance center. The query is one of the assistant's replies, so
+    plain search ranks the assistant's facts first"""
+    group_id = group_id_for("user0", persona_uuids[0])
+    center_uuid = await service.get_or_create_user_uuid("user0", persona_uuids[0])
+    replies = [e.fact for e in service.client.edges if e.group_id == group_id and e.source_node_uuid != center_uuid]
+    if not replies:
+        return {}
+    shares = {}
+    for name, centered in (("plain", False), ("centered", True)):
+        results = await service.client.search_(
+            replies[0],
+            config=service._search_config(3, 0, 0, centered=centered),
+            group_ids=[group_id],
+            center_node_uuid=center_uuid if centered else None,
+        )
+        own = sum(edge.source_node_uuid == center_uuid for edge in results.edges)
+        shares[f"user_fact_share_top3_{name}"] = round(own / max(1, len(results.edges)), 2)
+    return shares
+
+
+async def _run_cluster(args, directory: str) -> dict:
+    env = {
+        **os.environ,
+        "BENCH_ARGS": json.dumps(vars(args)),
+        "INGESTION_SPOOL_PATH": os.path.join(directory, "ingestion.db"),
+        "SESSION_PATH": os.path.join(directory, "sessions.db"),
+        "CHECKPOINT_PATH": os.path.join(directory, "checkpoints.db"),
+        "CONSOLIDATION_INTERVAL": "0",
+        "API_ENABLED": "true",
+        "TRACING_SINKS": "memory,prometheus",
+        # serve.py splits the provider's limit between the workers
+        "LLM_MAX_CONCURRENCY": str(args.llm_concurrency),
+    }
+    front = subprocess.Popen([sys.executable, "-m", "bench.cluster", "front"], env=env)
+    recorder = Recorder()
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.base_port}", timeout=None, limits=httpx.Limits(max_connections=None)) as client:
+            # The front end starts listening once every worker answers its liveness probe
+            while True:
+                if front.poll() is not None:
+                    raise RuntimeError(f"serve.py front end exited with {front.returncode}")
+                try:
+                    await client.get("/front/metrics")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.25)
+
+            persona_uuids = [persona["uuid"] for persona in bench_personas(args.personas)]
+            started = time.perf_counter()
+            await asyncio.gather(*(_api_session(i, args, client, persona_uuids, recorder) for i in range(args.sessions)))
+            elapsed = time.perf_counter() - started
+
+            # Every finished turn was spooled by its worker; wait for the drainer to write them all
+            drain_started = time.perf_counter()
+            while True:
+                metrics = (await client.get("/front/metrics")).text
+                written = _counter(metrics, "ingestion_exchanges_total")
+                settled = written.get('result="ok"', 0) + written.get('result="dead_letter"', 0)
+                if settled >= len(recorder.turn_seconds) or time.perf_counter() - drain_started > 120:
+                    break
+                await asyncio.sleep(0.1)
+            drain_seconds = time.perf_counter() - drain_started
+    finally:
+        front.terminate()
+        front.wait()
+
+    requests = _counter(metrics, "proxy_requests_total")
+    return {
+        **recorder.summary(elapsed),
+        "ingestion_drain_s": round(drain_seconds, 3),
+        "ingestion_written": int(written.get('result="ok"', 0)),
+        "ingestion_failed": int(written.get('result="failed"', 0)),
+        "requests_per_worker": [int(requests.get(f'worker="{i}"', 0)) for i in range(args.workers)],
+        "mode": "api",
+        "sessions": args.sessions,
+        "workers": args.workers,
+    }
+
+
+def run_workers(args) -> dict:
+    """serve.py's front end, worker pool, shared SQLite files and spool drainer, each process
+    on fake backends; the sessions stream through the front end's /api/chat/stream"""
+    with tempfile.TemporaryDirectory() as directory:
+        return asyncio.run(_run_cluster(args, directory))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test with fake LLM and graph backends")
+    parser.add_argument("--mode", choices=["runner", "app", "api", "batch"], default="runner", help="drive AgentRunner directly, the Gradio handlers, or the /api stream or batch endpoints")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--personas", type=int, default=3)
+    parser.add_argument("--tokens", type=int, default=60, help="tokens per fake reply")
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--search-latency", type=float, default=0.03)
+    parser.add_argument("--ingest-latency", type=float, default=0.5)
+    parser.add_argument("--query-latency", type=float, default=0.002)
+    parser.add_argument("--llm-concurrency", type=int, default=1024, help="in-flight LLM calls across all workers")
+    parser.add_argument("--local-index", action="store_true", help="search active users' memory in-process")
+    parser.add_argument("--consolidate", action="store_true", help="run a consolidation pass after the load and report its effect")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which the sessions start")
+    parser.add_argument("--response-cache", action="store_true", help="reuse first-turn replies across sessions")
+    parser.add_argument("--first-message", default="", help="shared opening message, e.g. 'hi, who are you?'")
+    parser.add_argument("--workers", type=int, default=1, help="run serve.py with this many fake-backed workers and stream through it")
+    parser.add_argument("--base-port", type=int, default=18700, help="serve.py's port with --workers; the workers take the ports after it")
+    parser.add_argument("--json", default="", help="also write the report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_workers(args) if args.workers > 1 else asyncio.run(run(args))
+    for key, value in report.items():
+        print(f"{key:>26}: {value}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Consolidate the knowledge graph without the web app.
+
+    python consolidate.py                    # one pass
+    python consolidate.py --interval 3600    # a pass every hour
+
+Progress is checkpointed per group, so an interrupted pass resumes where it stopped.
+"""
+import argparse
+import asyncio
+
+from source.config import (
+    NEO4J_URI,
+    NEO4J_USER,
+    NEO4J_PASSWORD,
+    CONSOLIDATION_KEEP_RECENT,
+    CONSOLIDATION_BATCH,
+    CONSOLIDATION_PRUNE_AFTER_DAYS,
+    CONSOLIDATION_PAUSE,
+    CONSOLIDATION_STATE_PATH,
+)
+from source.service import GraphitiService
+
+
+async def consolidate(args) -> None:
+    service = await GraphitiService.create(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
+    try:
+        try:
+            consolidator = service.consolidator(
+                keep_recent=args.keep_recent,
+                batch_size=args.batch_size,
+                prune_after_days=args.prune_after_days,
+                pause=args.pause,
+                state_path=args.state,
+            )
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            return
+        if consolidator.state.after:
+            print(f"Resuming after group {consolidator.state.after}")
+        if args.interval > 0:
+            await consolidator.run(args.interval)
+        else:
+            await consolidator.run_once()
+    finally:
+        await service.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Merge duplicate facts, prune expired ones and summarize old episodes")
+    parser.add_argument("--interval", type=float, default=0, help="seconds between passes (default: run once)")
+    parser.add_argument("--keep-recent", type=int, default=CONSOLIDATION_KEEP_RECENT, help="newest episodes per group left as they are")
+    parser.add_argument("--batch-size", type=int, default=CONSOLIDATION_BATCH, help="episodes per summary")
+    parser.add_argument("--prune-after-days", type=float, default=CONSOLIDATION_PRUNE_AFTER_DAYS)
+    parser.add_argument("--pause", type=float, default=CONSOLIDATION_PAUSE, help="seconds to sleep between groups and batches")
+    parser.add_argument("--state", default=CONSOLIDATION_STATE_PATH, help="progress file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(consolidate(parse_args()))
@@ -0,0 +1,150 @@
+"""Bulk import agent personas without the web app.
+
+    python import_personas.py personas.jsonl
+    python import_personas.py personas.csv --batch-size 1000
+
+Each JSONL line or CSV row is one persona with the fields name, surname, age, profession,
+hobbies and additional_info (hobbies may be a list in JSONL). Rows with a uuid update that
+persona, so rerunning an import with uuids does not create duplicates. Rows are validated
+as they are read; invalid ones are reported with their line number and skipped. A chunk
+whose write fails is reported with its lines and the import goes on; --start-line resumes
+an interrupted import.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import re
+import time
+
+from source.config import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, PERSONA_IMPORT_BATCH
+from source.service import GraphitiService, new_persona_uuid
+
+TEXT_FIELDS = ("surname", "profession", "hobbies", "additional_info")
+MAX_FIELD_LENGTH = 2000
+# Errors printed before the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+def persona_from_row(row: dict) -> dict:
+    """Validate one input row into the importer's parameters, raising ValueError when it is unusable"""
+    name = str(row.get("name") or "").strip()
+    if not name:
+        raise ValueError("name is missing")
+    persona = {"name": name}
+    for field in TEXT_FIELDS:
+        value = row.get(field) or ""
+        if isinstance(value, list):
+            value = ", ".join(str(v) for v in value)
+        persona[field] = str(value).strip()
+    for field, value in persona.items():
+        if len(value) > MAX_FIELD_LENGTH:
+            raise ValueError(f"{field} is longer than {MAX_FIELD_LENGTH} characters")
+    try:
+        age = int(float(row.get("age")))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"age is not a number: {row.get('age')!r}")
+    # Same range as the persona form in the UI
+    if not 1 <= age <= 150:
+        raise ValueError(f"age is out of range: {age}")
+    persona["age"] = age
+    persona_uuid = str(row.get("uuid") or "").strip()
+    if persona_uuid and not re.fullmatch(r"[A-Za-z0-9_-]+", persona_uuid):
+        # The uuid ends up in conversation group ids, which only allow these characters
+        raise ValueError(f"uuid has characters other than letters, digits, _ and -: {persona_uuid!r}")
+    persona["uuid"] = persona_uuid or new_persona_uuid()
+    persona["full_name"] = f"{persona['name']} {persona['surname']}"
+    return persona
+
+
+def read_rows(path: str):
+    """Yield (line number, raw row) from a JSONL or CSV file without loading it whole"""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            reader = csv.DictReader(f)
+            for row in reader:
+                # Quoted fields may span lines, so report the line the row ended on
+                yield reader.line_num, row
+            return
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, e
+                continue
+            yield line_no, row if isinstance(row, dict) else ValueError("not a JSON object")
+
+
+def read_personas(path: str, report, start_line: int = 1):
+    """Yield (line number, persona) for valid rows from start_line on; invalid rows are handed to report(line number, error)"""
+    for line_no, row in read_rows(path):
+        if line_no < start_line:
+            continue
+        if isinstance(row, Exception):
+            report(line_no, row)
+            continue
+        try:
+            yield line_no, persona_from_row(row)
+        except ValueError as e:
+            report(line_no, e)
+
+
+async def import_file(args) -> None:
+    service = await GraphitiService.create(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
+    invalid = 0
+    imported = 0
+    failed = 0
+    # Last line of the newest chunk that was written
+    last_line = 0
+    started = time.monotonic()
+
+    def report(line_no: int, error: Exception) -> None:
+        nonlocal invalid
+        invalid += 1
+        if invalid <= MAX_REPORTED_ERRORS:
+            print(f"Skipping line {line_no}: {error}")
+
+    async def write(chunk: list[dict], lines: list[int]) -> None:
+        nonlocal imported, failed, last_line
+        try:
+            imported += await service.import_personas(chunk)
+        except Exception as e:
+            # One bad chunk does not stop the rest of the file
+            failed += len(chunk)
+            print(f"Error importing lines {lines[0]}-{lines[-1]}: {e}")
+            return
+        last_line = lines[-1]
+        print(f"{imported} personas imported through line {last_line}, {imported / (time.monotonic() - started):.0f}/s")
+
+    try:
+        chunk: list[dict] = []
+        lines: list[int] = []
+        for line_no, persona in read_personas(args.path, report, args.start_line):
+            chunk.append(persona)
+            lines.append(line_no)
+            if len(chunk) >= args.batch_size:
+                await write(chunk, lines)
+                chunk, lines = [], []
+        if chunk:
+            await write(chunk, lines)
+    finally:
+        await service.close()
+        if last_line:
+            print(f"Last line written: {last_line}, resume after it with --start-line {last_line + 1}")
+
+    elapsed = time.monotonic() - started
+    print(f"Done: {imported} personas in {elapsed:.1f}s, {invalid} invalid rows skipped, {failed} failed to import")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import agent personas from a JSONL or CSV file")
+    parser.add_argument("path", help="JSONL (one persona per line) or .csv file with a header row")
+    parser.add_argument("--batch-size", type=int, default=PERSONA_IMPORT_BATCH, help="personas per write")
+    parser.add_argument("--start-line", type=int, default=1, help="skip the rows before this line, to resume an import")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(import_file(parse_args()))
@@ -0,0 +1,172 @@
+"""Backfill conversation transcripts into the knowledge graph without the web app.
+
+Each JSONL line is one exchange. Field names are configurable, e.g.
+
+    python ingest.py transcripts.jsonl
+    python ingest.py requests.jsonl --user-field request_id --message-field title --reply-field body
+
+Progress is checkpointed, so rerunning the same command resumes where it stopped. A chunk
+whose write fails is reported and skipped, and the checkpoint stays before it so the rerun
+retries it.
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from source.config import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD
+from source.ingestion import Exchange
+from source.service import GraphitiService, group_id_for
+
+
+def read_exchanges(path: str, args, start_line: int):
+    """Yield (line number, exchange) for every valid line after start_line"""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if line_no <= start_line or not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                user_name = str(record[args.user_field])
+                ai_name = str(record.get(args.persona_field) or args.default_persona)
+                persona_uuid = str(record.get(args.persona_uuid_field) or "")
+                created_at = record.get(args.time_field) or datetime.now(timezone.utc).isoformat()
+                datetime.fromisoformat(created_at)
+                yield line_no, Exchange(
+                    user_name=user_name,
+                    user_message=str(record.get(args.message_field, "")),
+                    assistant_message=str(record.get(args.reply_field, "")),
+                    ai_name=ai_name,
+                    group_id=group_id_for(user_name, persona_uuid),
+                    created_at=created_at,
+                )
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Skipping line {line_no}: {e}")
+
+
+class Checkpoint:
+    """Tracks the highest line below which every exchange has been written"""
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.source = source
+        self.line = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("source") == source:
+                self.line = state.get("line", 0)
+        self._pending: list[int] = []
+        self._done: set[int] = set()
+        self._read_up_to = self.line
+
+    def started(self, line_no: int) -> None:
+        heapq.heappush(self._pending, line_no)
+        self._read_up_to = line_no
+
+    def finished(self, line_numbers: list[int]) -> None:
+        self._done.update(line_numbers)
+        while self._pending and self._pending[0] in self._done:
+            self._done.discard(heapq.heappop(self._pending))
+        self.line = (self._pending[0] - 1) if self._pending else self._read_up_to
+
+    def save(self) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"source": self.source, "line": self.line}, f)
+        os.replace(tmp, self.path)
+
+
+async def backfill(args) -> None:
+    service = await GraphitiService.create(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
+    checkpoint = Checkpoint(args.checkpoint or f"{args.path}.checkpoint.json", os.path.abspath(args.path))
+    if checkpoint.line:
+        print(f"Resuming after line {checkpoint.line}")
+
+    buffers: dict[str, list[tuple[int, Exchange]]] = {}
+    # Each bulk write and the (line number, exchange) chunk it is writing
+    in_flight: dict[asyncio.Task, list[tuple[int, Exchange]]] = {}
+    written = 0
+    failed = 0
+    started = last_report = time.monotonic()
+
+    async def collect(wait_for_all: bool = False):
+        nonlocal written, failed
+        while in_flight and (wait_for_all or len(in_flight) >= args.concurrency):
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                chunk = in_flight.pop(task)
+                line_numbers = [line_no for line_no, _ in chunk]
+                try:
+                    task.result()
+                except Exception as e:
+                    # Left unfinished, so the checkpoint stays before these lines and a rerun retries them
+                    failed += len(chunk)
+                    print(f"Error writing lines {min(line_numbers)}-{max(line_numbers)} ({chunk[0][1].group_id}): {e}")
+                    continue
+                written += len(chunk)
+                checkpoint.finished(line_numbers)
+            checkpoint.save()
+
+    async def submit(chunk: list[tuple[int, Exchange]]):
+        await collect()
+        task = asyncio.create_task(service.write_exchanges_bulk([exchange for _, exchange in chunk]))
+        in_flight[task] = chunk
+
+    try:
+        for line_no, exchange in read_exchanges(args.path, args, checkpoint.line):
+            checkpoint.started(line_no)
+            buffer = buffers.setdefault(exchange.group_id, [])
+            buffer.append((line_no, exchange))
+            if len(buffer) >= args.batch_size:
+                await submit(buffers.pop(exchange.group_id))
+            elif len(buffers) > args.max_buffered_groups:
+                # Too many partially filled groups: flush the one holding the oldest line
+                oldest = min(buffers, key=lambda group: buffers[group][0][0])
+                await submit(buffers.pop(oldest))
+
+            now = time.monotonic()
+            if now - last_report >= args.report_every:
+                print(f"line {line_no}: {written} exchanges written, {written / (now - started):.1f}/s")
+                last_report = now
+
+        for group_id in list(buffers):
+            await submit(buffers.pop(group_id))
+        await collect(wait_for_all=True)
+    finally:
+        # Writes still running after an interruption are not finished, so they are not checkpointed
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+        checkpoint.save()
+        await service.close()
+
+    elapsed = time.monotonic() - started
+    print(f"Done: {written} exchanges in {elapsed:.1f}s ({written / elapsed if elapsed else 0:.1f}/s)")
+    if failed:
+        print(f"{failed} exchanges failed; rerun the same command to retry them (from line {checkpoint.line + 1})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk ingest JSONL conversation transcripts into the graph")
+    parser.add_argument("path", help="JSONL file, one exchange per line")
+    parser.add_argument("--checkpoint", default="", help="progress file (default: <path>.checkpoint.json)")
+    parser.add_argument("--batch-size", type=int, default=20, help="exchanges per bulk write")
+    parser.add_argument("--concurrency", type=int, default=4, help="bulk writes in flight")
+    parser.add_argument("--max-buffered-groups", type=int, default=1000)
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    parser.add_argument("--user-field", default="user_name")
+    parser.add_argument("--message-field", default="user_message")
+    parser.add_argument("--reply-field", default="assistant_message")
+    parser.add_argument("--persona-field", default="ai_name")
+    parser.add_argument("--persona-uuid-field", default="persona_uuid")
+    parser.add_argument("--time-field", default="timestamp")
+    parser.add_argument("--default-persona", default="AI friend")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill(parse_args()))
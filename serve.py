@@ -0,0 +1,257 @@
+"""Multi-worker mode: N app.py processes behind one sticky front end.
+
+    python serve.py --workers 4
+
+Each browser session is pinned to one worker by a cookie (API clients without
+cookies are pinned by session_hash or thread_id), so in-process caches and the
+streaming queue stay on one process. Personas of sessions and conversation history
+live in SQLite files shared by all workers, and workers spool finished exchanges
+to SQLite where this process alone writes them to the graph.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import zlib
+from contextlib import asynccontextmanager
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from source.config import (
+    NEO4J_URI,
+    NEO4J_USER,
+    NEO4J_PASSWORD,
+    INGESTION_SPOOL_PATH,
+    EMBEDDING_CACHE_PATH,
+    LOCAL_INDEX_PATH,
+    CONSOLIDATION_INTERVAL,
+    SHUTDOWN_DRAIN_TIMEOUT,
+    LLM_MAX_CONCURRENCY,
+    LLM_BACKGROUND_CONCURRENCY,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+    SESSION_PATH,
+    SERVER_HOST,
+    SERVER_PORT,
+    WORKERS,
+    WORKER_BASE_PORT,
+)
+from source.tracing import tracer
+
+WORKER_COOKIE = "chat_worker"
+# Hop-by-hop headers are per connection and must not be forwarded
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "upgrade", "te", "trailer", "proxy-authorization", "proxy-authenticate", "host"}
+
+
+def worker_path(path: str, port: int) -> str:
+    # The dot keeps it apart from group directories, since group ids cannot contain one
+    return os.path.join(path, f"worker.{port}") if path else ""
+
+
+class WorkerPool:
+    """Starts the worker processes and restarts any that exit"""
+
+    def __init__(self, workers: int, base_port: int, command: list[str] | None = None):
+        self.ports = [base_port + i for i in range(workers)]
+        self.command = command or [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")]
+        self.processes: list[subprocess.Popen | None] = [None] * workers
+        self.restarts = 0
+
+    def _env(self, port: int) -> dict:
+        workers = len(self.ports)
+        return {
+            **os.environ,
+            # Provider limits apply to the deployment, so each worker gets its share
+            "LLM_MAX_CONCURRENCY": str(max(1, LLM_MAX_CONCURRENCY // workers)),
+            "LLM_BACKGROUND_CONCURRENCY": str(max(1, LLM_BACKGROUND_CONCURRENCY // workers)),
+            "LLM_REQUESTS_PER_MINUTE": str(LLM_REQUESTS_PER_MINUTE / workers),
+            "LLM_TOKENS_PER_MINUTE": str(LLM_TOKENS_PER_MINUTE / workers),
+            "SERVER_HOST": "127.0.0.1",
+            "SERVER_PORT": str(port),
+            "INGESTION_MODE": "spool",
+            "INGESTION_SPOOL_PATH": INGESTION_SPOOL_PATH,
+            "SESSION_BACKEND": "sqlite",
+            "SESSION_PATH": SESSION_PATH,
+            "CHECKPOINT_BACKEND": "sqlite",
+            # Memory-mapped caches allocate rows from in-process state, so each worker
+            # (and the drainer, which keeps the configured path) has its own directory
+            "EMBEDDING_CACHE_PATH": worker_path(EMBEDDING_CACHE_PATH, port),
+            "LOCAL_INDEX_PATH": worker_path(LOCAL_INDEX_PATH, port),
+        }
+
+    def _spawn(self, index: int) -> None:
+        self.processes[index] = subprocess.Popen(self.command, env=self._env(self.ports[index]))
+
+    def start(self) -> None:
+        for index in range(len(self.ports)):
+            self._spawn(index)
+
+    async def supervise(self, interval: float = 1.0) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self.processes):
+                if process is not None and process.poll() is not None:
+                    print(f"Worker on port {self.ports[index]} exited with {process.returncode}, restarting")
+                    self.restarts += 1
+                    tracer.count("worker_restarts_total")
+                    self._spawn(index)
+
+    async def wait_ready(self, timeout: float = 120.0) -> None:
+        async with httpx.AsyncClient() as client:
+            for port in self.ports:
+                for _ in range(int(timeout * 4)):
+                    try:
+                        await client.get(f"http://127.0.0.1:{port}/health/live")
+                        break
+                    except httpx.TransportError:
+                        await asyncio.sleep(0.25)
+                else:
+                    print(f"Worker on port {port} did not become ready")
+
+    def stop(self, timeout: float = 30.0) -> None:
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                try:
+                    process.wait(timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+class StickyProxy:
+    """Forwards every request to the worker that owns the caller's session"""
+
+    def __init__(self, pool: WorkerPool):
+        self.pool = pool
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=10.0), limits=httpx.Limits(max_connections=None))
+        self._round_robin = itertools.cycle(range(len(pool.ports)))
+
+    def worker_for(self, request: Request) -> tuple[int, bool]:
+        """Worker index for the request and whether the pinning cookie must be set"""
+        cookie = request.cookies.get(WORKER_COOKIE, "")
+        if cookie.isdigit() and int(cookie) < len(self.pool.ports):
+            return int(cookie), False
+        key = request.query_params.get("session_hash") or request.query_params.get("thread_id")
+        if key:
+            return zlib.crc32(key.encode()) % len(self.pool.ports), False
+        return next(self._round_robin), True
+
+    async def forward(self, request: Request):
+        index, pin = self.worker_for(request)
+        tracer.count("proxy_requests_total", worker=index)
+        url = httpx.URL(f"http://127.0.0.1:{self.pool.ports[index]}{request.url.path}", query=request.url.query.encode())
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in HOP_HEADERS]
+        upstream_request = self.client.build_request(request.method, url, headers=headers, content=request.stream())
+        try:
+            upstream = await self.client.send(upstream_request, stream=True)
+        except httpx.TransportError as e:
+            print(f"Error forwarding to worker {index}: {e}")
+            return PlainTextResponse("Worker unavailable", status_code=502)
+
+        response = StreamingResponse(
+            upstream.aiter_raw(),
+            status_code=upstream.status_code,
+            background=BackgroundTask(upstream.aclose),
+        )
+        # Raw pairs keep repeated headers such as set-cookie; the front end sets its own date and server
+        response.raw_headers = [
+            (k.encode("latin-1"), v.encode("latin-1"))
+            for k, v in upstream.headers.multi_items()
+            if k.lower() not in HOP_HEADERS | {"date", "server"}
+        ]
+        if pin:
+            response.set_cookie(WORKER_COOKIE, str(index), httponly=True, samesite="lax")
+        return response
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+async def _create_service():
+    from source.service import GraphitiService
+
+    return await GraphitiService.create(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
+
+
+async def _drain_spool(create_service) -> None:
+    """Centralized ingestion: the only process that writes spooled exchanges to the graph,
+    and so also the one that consolidates it"""
+    from source.spool import ExchangeSpool
+
+    while True:
+        try:
+            service = await create_service()
+            break
+        except Exception as e:
+            print(f"Error connecting ingestion drainer: {e}")
+            await asyncio.sleep(5)
+    jobs = [service.spool_drainer(ExchangeSpool(INGESTION_SPOOL_PATH)).run()]
+    if CONSOLIDATION_INTERVAL > 0:
+        try:
+            jobs.append(service.consolidator().run(CONSOLIDATION_INTERVAL))
+        except RuntimeError as e:
+            # The drainer keeps writing exchanges without it
+            print(f"Error starting consolidation: {e}")
+    try:
+        await asyncio.gather(*jobs)
+    finally:
+        await service.close()
+
+
+def create_front(workers: int, base_port: int, worker_command: list[str] | None = None, create_service=_create_service) -> Starlette:
+    """worker_command and create_service replace app.py and the Neo4j-backed drainer, as bench.load does"""
+    pool = WorkerPool(workers, base_port, worker_command)
+    proxy = StickyProxy(pool)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        pool.start()
+        await pool.wait_ready()
+        tasks = [asyncio.create_task(pool.supervise()), asyncio.create_task(_drain_spool(create_service))]
+        print(f"Serving {workers} workers on ports {pool.ports[0]}-{pool.ports[-1]}")
+        try:
+            yield
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await proxy.close()
+            # uvicorn waits for open connections, then the worker drains turns and ingestion, each up to SHUTDOWN_DRAIN_TIMEOUT
+            pool.stop(timeout=2 * SHUTDOWN_DRAIN_TIMEOUT + 10)
+
+    async def metrics(request: Request):
+        # Front end and drainer only; each worker serves its own /metrics on its port
+        return PlainTextResponse(tracer.render_prometheus())
+
+    methods = ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD"]
+    return Starlette(
+        routes=[
+            Route("/front/metrics", metrics),
+            Route("/{path:path}", proxy.forward, methods=methods),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the chat app as several worker processes behind one port")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--base-port", type=int, default=WORKER_BASE_PORT)
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    uvicorn.run(create_front(args.workers, args.base_port), host=args.host, port=args.port)
@@ -0,0 +1,173 @@
+"""Headless chat API, mounted by app.py under /api next to the UI.
+
+    POST /api/chat          one turn, JSON reply
+    POST /api/chat/stream   one turn as server-sent events (delta, done, error)
+    POST /api/chat/batch    many turns, replies in request order
+"""
+import asyncio
+import json
+import uuid
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from source.lifecycle import ServiceLifecycle, ServiceUnavailable
+from source.tracing import tracer
+
+
+class ChatTurn(BaseModel):
+    user_name: str = Field(..., min_length=1)
+    persona_uuid: str = Field(..., min_length=1)
+    message: str = Field(..., min_length=1)
+    system_prompt: str = ""
+    # A new conversation is started when omitted; the reply says which one was used
+    thread_id: str = ""
+
+
+class ChatReply(BaseModel):
+    thread_id: str
+    reply: str = ""
+    error: str = ""
+
+
+class BatchRequest(BaseModel):
+    turns: list[ChatTurn]
+    # "background" keeps a large batch from delaying interactive chat
+    priority: str = Field("interactive", pattern="^(interactive|background)$")
+
+
+class BatchReply(BaseModel):
+    results: list[ChatReply]
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def create_api(
+    lifecycle: ServiceLifecycle,
+    default_system_prompt: str = "",
+    batch_concurrency: int = 16,
+    batch_max_turns: int = 1000,
+) -> APIRouter:
+    router = APIRouter()
+
+    async def prepare(turns: list[ChatTurn]) -> dict[str, dict]:
+        """Resolve every distinct persona of the request once"""
+        if not lifecycle.accepting:
+            raise HTTPException(status_code=503, detail="Shutting down")
+        try:
+            service = await lifecycle.ensure_service()
+            await lifecycle.ensure_agent()
+        except ServiceUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        persona_uuids = sorted({t.persona_uuid for t in turns})
+        personas = await asyncio.gather(*(service.get_persona_by_uuid(p) for p in persona_uuids))
+        for turn in turns:
+            # Loads the group's memory into the local index, if enabled, once per user and persona
+            service.warm_memory(turn.user_name, turn.persona_uuid)
+        return dict(zip(persona_uuids, personas))
+
+    def state_for(turn: ChatTurn, persona: dict) -> dict:
+        return {
+            "messages": [{"role": "user", "content": turn.message}],
+            "user_name": turn.user_name,
+            "system_prompt": turn.system_prompt or default_system_prompt,
+            "ai_persona": persona,
+        }
+
+    async def run_turn(turn: ChatTurn, thread_id: str, persona: dict, lane: str) -> ChatReply:
+        agent = await lifecycle.ensure_agent()
+        try:
+            result = await agent.ainvoke(state_for(turn, persona), thread_id=thread_id, lane=lane)
+            return ChatReply(thread_id=thread_id, reply=result["messages"][-1].content)
+        except Exception as e:
+            print(f"Error in API turn for {turn.user_name}: {e}")
+            return ChatReply(thread_id=thread_id, error=str(e) or type(e).__name__)
+
+    @router.post("/chat", response_model=ChatReply)
+    async def chat(turn: ChatTurn):
+        from source.scheduler import INTERACTIVE, SchedulerOverloaded
+
+        personas = await prepare([turn])
+        persona = personas[turn.persona_uuid]
+        if not persona:
+            raise HTTPException(status_code=404, detail="Persona not found")
+        agent = await lifecycle.ensure_agent()
+        thread_id = turn.thread_id or uuid.uuid4().hex
+        tracer.count("api_turns_total", endpoint="chat")
+        try:
+            async with lifecycle.turn():
+                result = await agent.ainvoke(state_for(turn, persona), thread_id=thread_id, lane=INTERACTIVE)
+        except (SchedulerOverloaded, ServiceUnavailable) as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        return ChatReply(thread_id=thread_id, reply=result["messages"][-1].content)
+
+    @router.post("/chat/stream")
+    async def chat_stream(turn: ChatTurn):
+        personas = await prepare([turn])
+        persona = personas[turn.persona_uuid]
+        if not persona:
+            raise HTTPException(status_code=404, detail="Persona not found")
+        agent = await lifecycle.ensure_agent()
+        thread_id = turn.thread_id or uuid.uuid4().hex
+        ai_name = persona.get("full_name", persona.get("name", "AI friend"))
+        tracer.count("api_turns_total", endpoint="stream")
+
+        async def events():
+            parts = []
+            try:
+                # Shutdown waits for the stream to finish
+                async with lifecycle.turn():
+                    async for delta in agent.astream_response(state_for(turn, persona), thread_id=thread_id, ai_name=ai_name, deltas=True):
+                        parts.append(delta)
+                        yield _sse("delta", {"text": delta})
+            except Exception as e:
+                print(f"Error streaming API turn for {turn.user_name}: {e}")
+                yield _sse("error", {"thread_id": thread_id, "error": str(e) or type(e).__name__})
+                return
+            yield _sse("done", {"thread_id": thread_id, "reply": "".join(parts)})
+
+        # No proxy buffering, so every delta reaches the client as it is produced
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @router.post("/chat/batch", response_model=BatchReply)
+    async def chat_batch(batch: BatchRequest):
+        from source.scheduler import BACKGROUND, INTERACTIVE
+
+        if len(batch.turns) > batch_max_turns:
+            raise HTTPException(status_code=413, detail=f"At most {batch_max_turns} turns per batch")
+        personas = await prepare(batch.turns)
+        lane = BACKGROUND if batch.priority == "background" else INTERACTIVE
+        tracer.count("api_turns_total", len(batch.turns), endpoint="batch")
+
+        # Turns of one conversation run in order; different conversations run concurrently.
+        # As with /chat, a turn without a thread_id starts a conversation of its own
+        conversations: dict[tuple, list[int]] = {}
+        for position, turn in enumerate(batch.turns):
+            key = (turn.user_name, turn.persona_uuid, turn.thread_id, None if turn.thread_id else position)
+            conversations.setdefault(key, []).append(position)
+
+        results: list[ChatReply | None] = [None] * len(batch.turns)
+        limit = asyncio.Semaphore(batch_concurrency)
+
+        async def run_conversation(key: tuple, positions: list[int]) -> None:
+            _, persona_uuid, thread_id, _ = key
+            thread_id = thread_id or uuid.uuid4().hex
+            persona = personas[persona_uuid]
+            async with limit:
+                for position in positions:
+                    if not persona:
+                        results[position] = ChatReply(thread_id=thread_id, error="Persona not found")
+                        continue
+                    results[position] = await run_turn(batch.turns[position], thread_id, persona, lane)
+
+        try:
+            async with lifecycle.turn():
+                await asyncio.gather(*(run_conversation(key, positions) for key, positions in conversations.items()))
+        except ServiceUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        return BatchReply(results=results)
+
+    return router
@@ -0,0 +1,195 @@
+import difflib
+import hashlib
+import re
+import sys
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial edits share an entry"""
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(query.split())
+
+
+class RetrievalCache:
+    """LRU cache with TTL and a byte cap for formatted retrieval results"""
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, ttl: float = 300.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[float, str, int]] = OrderedDict()
+        self._by_group: dict[str, set[tuple]] = {}
+        # Bumped by every invalidation, so a search that started before one is not cached after it
+        self._generations: dict[str, int] = {}
+        self.size_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    @staticmethod
+    def make_key(group_ids: list[str] | None, center_uuid: str, query: str, *limits) -> tuple:
+        return tuple(sorted(group_ids or [])), center_uuid, normalize_query(query), limits
+
+    @staticmethod
+    def _entry_size(key: tuple, value: str) -> int:
+        return sys.getsizeof(value) + sum(sys.getsizeof(part) for part in key[:3])
+
+    def get(self, key: tuple) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, value, _ = entry
+        if time.monotonic() - stored_at > self.ttl:
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def generation(self, key: tuple) -> tuple:
+        """Read when the search for key starts and handed back to put"""
+        return tuple(self._generations.get(group_id, 0) for group_id in key[0])
+
+    def put(self, key: tuple, value: str, generation: tuple | None = None) -> None:
+        if generation is not None and generation != self.generation(key):
+            # One of the searched groups was written to while the search ran
+            self.stale_puts += 1
+            return
+        if key in self._entries:
+            self._remove(key)
+        size = self._entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic(), value, size)
+        self.size_bytes += size
+        for group_id in key[0]:
+            self._by_group.setdefault(group_id, set()).add(key)
+
+        while self.size_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate_group(self, group_id: str) -> None:
+        """Drop every entry that searched the given group"""
+        self._generations[group_id] = self._generations.get(group_id, 0) + 1
+        for key in self._by_group.pop(group_id, set()):
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def _remove(self, key: tuple) -> None:
+        _, _, size = self._entries.pop(key)
+        self.size_bytes -= size
+        for group_id in key[0]:
+            keys = self._by_group.get(group_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_group[group_id]
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "stale_puts": self.stale_puts,
+        }
+
+
+class ResponseCache:
+    """LRU cache with TTL for whole replies, matching near-identical messages within one prompt"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0, similarity: float = 0.9):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        # (persona, prompt, facts) -> normalized message -> (stored_at, reply), least recently used first
+        self._buckets: dict[tuple, OrderedDict[str, tuple[float, str]]] = {}
+        self._lru: OrderedDict[tuple, None] = OrderedDict()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_bucket(persona_uuid: str, system_prompt: str, facts: str) -> tuple:
+        fingerprint = hashlib.sha1(normalize_query(facts).encode()).hexdigest() if facts.strip() else ""
+        return persona_uuid, hashlib.sha1(" ".join(system_prompt.split()).encode()).hexdigest(), fingerprint
+
+    def _match(self, entries: OrderedDict[str, tuple[float, str]], message: str) -> str | None:
+        if message in entries:
+            return message
+        if self.similarity >= 1.0:
+            return None
+        best, best_ratio = None, self.similarity
+        for candidate in entries:
+            matcher = difflib.SequenceMatcher(None, message, candidate)
+            # quick_ratio is an upper bound, so most candidates are rejected without the full diff
+            if matcher.quick_ratio() >= best_ratio and (ratio := matcher.ratio()) >= best_ratio:
+                best, best_ratio = candidate, ratio
+        return best
+
+    def get(self, bucket: tuple, message: str) -> str | None:
+        message = normalize_query(message)
+        entries = self._buckets.get(bucket)
+        match = self._match(entries, message) if entries else None
+        if match is None:
+            self.misses += 1
+            return None
+        stored_at, reply = entries[match]
+        if time.monotonic() - stored_at > self.ttl:
+            self._remove((bucket, match))
+            self.misses += 1
+            return None
+        self._lru.move_to_end((bucket, match))
+        if match == message:
+            self.hits += 1
+        else:
+            self.near_hits += 1
+        return reply
+
+    def put(self, bucket: tuple, message: str, reply: str) -> None:
+        message = normalize_query(message)
+        if not message or not reply:
+            return
+        self._buckets.setdefault(bucket, OrderedDict())[message] = (time.monotonic(), reply)
+        self._lru[(bucket, message)] = None
+        self._lru.move_to_end((bucket, message))
+        while len(self._lru) > self.max_entries:
+            self._remove(next(iter(self._lru)))
+            self.evictions += 1
+
+    def _remove(self, key: tuple) -> None:
+        bucket, message = key
+        self._lru.pop(key, None)
+        entries = self._buckets.get(bucket)
+        if entries is not None:
+            entries.pop(message, None)
+            if not entries:
+                del self._buckets[bucket]
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.near_hits) / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,255 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple, empty_checkpoint
+
+Summarizer = Callable[[str, list[dict]], Awaitable[str]]
+
+
+@dataclass(slots=True)
+class ThreadState:
+    summary: str = ""
+    messages: list[dict] = field(default_factory=list)
+
+
+class ConversationStore:
+    """Conversation history per thread: a running summary plus a window of recent messages"""
+
+    def __init__(self, window: int = 20, compact_after: int = 40, max_threads: int = 1000):
+        self.window = window
+        self.compact_after = compact_after
+        self.max_threads = max_threads
+        # Hot threads stay in memory; the rest are reloaded from the backend on demand
+        self._threads: OrderedDict[str, ThreadState] = OrderedDict()
+        self._loading: dict[str, asyncio.Future] = {}
+        self._compacting: set[str] = set()
+
+    async def load(self, thread_id: str) -> ThreadState:
+        state = self._threads.get(thread_id)
+        if state is not None:
+            self._threads.move_to_end(thread_id)
+            return state
+        # Concurrent cold loads share one read, so no caller appends to a state that
+        # another load then replaces
+        pending = self._loading.get(thread_id)
+        if pending is None:
+            pending = self._loading[thread_id] = asyncio.ensure_future(self._load_cold(thread_id))
+        return await asyncio.shield(pending)
+
+    async def _load_cold(self, thread_id: str) -> ThreadState:
+        try:
+            state = await self._read(thread_id)
+            self._threads[thread_id] = state
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+            return state
+        finally:
+            del self._loading[thread_id]
+
+    async def history(self, thread_id: str) -> tuple[str, list[dict]]:
+        """Return the summary and the last `window` messages for a thread"""
+        state = await self.load(thread_id)
+        return state.summary, state.messages[-self.window:]
+
+    async def append(self, thread_id: str, messages: list[dict]) -> None:
+        state = await self.load(thread_id)
+        state.messages.extend(messages)
+        await self._write(thread_id, messages)
+
+    def needs_compaction(self, thread_id: str) -> bool:
+        state = self._threads.get(thread_id)
+        return state is not None and len(state.messages) > self.compact_after and thread_id not in self._compacting
+
+    async def compact(self, thread_id: str, summarizer: Summarizer) -> None:
+        """Fold everything but the last `window` messages into the thread summary"""
+        if not self.needs_compaction(thread_id):
+            return
+        self._compacting.add(thread_id)
+        try:
+            state = await self.load(thread_id)
+            old = state.messages[:-self.window]
+            summary = await summarizer(state.summary, old)
+            state.summary = summary
+            del state.messages[:len(old)]
+            await self._write_summary(thread_id, summary, len(old))
+        finally:
+            self._compacting.discard(thread_id)
+
+    async def flush(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        await self.flush()
+
+    async def _read(self, thread_id: str) -> ThreadState:
+        return ThreadState()
+
+    async def _write(self, thread_id: str, messages: list[dict]) -> None:
+        pass
+
+    async def _write_summary(self, thread_id: str, summary: str, compacted: int) -> None:
+        pass
+
+
+class MemoryConversationStore(ConversationStore):
+    """Process-local store; evicted threads are forgotten"""
+
+
+class SqliteConversationStore(ConversationStore):
+    """SQLite (WAL) store with batched writes, so history survives restarts"""
+
+    def __init__(self, path: str, batch_size: int = 32, flush_interval: float = 1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: list[tuple] = []
+        self._flush_task: asyncio.Task | None = None
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                thread_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_thread ON messages (thread_id, seq);
+            CREATE TABLE IF NOT EXISTS summaries (
+                thread_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def _execute(self, fn):
+        with self._lock:
+            result = fn(self._conn)
+            self._conn.commit()
+            return result
+
+    async def _read(self, thread_id: str) -> ThreadState:
+        # Pending writes for this thread would be missed by the read below
+        await self.flush()
+
+        def read(conn):
+            row = conn.execute("SELECT summary FROM summaries WHERE thread_id = ?", (thread_id,)).fetchone()
+            rows = conn.execute(
+                "SELECT role, content FROM messages WHERE thread_id = ? ORDER BY seq",
+                (thread_id,),
+            ).fetchall()
+            return ThreadState(
+                summary=row[0] if row else "",
+                messages=[{"role": role, "content": content} for role, content in rows],
+            )
+
+        return await asyncio.to_thread(self._execute, read)
+
+    async def _write(self, thread_id: str, messages: list[dict]) -> None:
+        now = time.time()
+        self._pending.extend((thread_id, m["role"], m["content"], now) for m in messages)
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        await asyncio.to_thread(
+            self._execute,
+            lambda conn: conn.executemany(
+                "INSERT INTO messages (thread_id, role, content, created_at) VALUES (?, ?, ?, ?)", rows
+            ),
+        )
+
+    async def _write_summary(self, thread_id: str, summary: str, compacted: int) -> None:
+        await self.flush()
+
+        def write(conn):
+            conn.execute(
+                "INSERT INTO summaries (thread_id, summary) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET summary = excluded.summary",
+                (thread_id, summary),
+            )
+            conn.execute(
+                "DELETE FROM messages WHERE seq IN "
+                "(SELECT seq FROM messages WHERE thread_id = ? ORDER BY seq LIMIT ?)",
+                (thread_id, compacted),
+            )
+
+        await asyncio.to_thread(self._execute, write)
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        self._conn.close()
+
+
+class ConversationCheckpointer(BaseCheckpointSaver):
+    """LangGraph checkpointer over a ConversationStore. A thread's checkpoint is its history
+    window, so the graph path resumes from the same turns, and within the same bounds, as
+    the streaming path. The store is written by the agent, which makes puts bookkeeping only"""
+
+    def __init__(self, store: ConversationStore):
+        super().__init__()
+        self.store = store
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        _, history = await self.store.history(thread_id)
+        if not history:
+            return None
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"messages": [
+            HumanMessage(content=m["content"]) if m["role"] == "user" else AIMessage(content=m["content"])
+            for m in history
+        ]}
+        checkpoint["channel_versions"] = {"messages": self.get_next_version(None, None)}
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": "", "checkpoint_id": checkpoint["id"]}}
+        return CheckpointTuple(config, checkpoint, {"source": "input", "step": -1, "parents": {}})
+
+    async def alist(self, config: RunnableConfig | None, **kwargs) -> AsyncIterator[CheckpointTuple]:
+        checkpoint = await self.aget_tuple(config) if config else None
+        if checkpoint is not None:
+            yield checkpoint
+
+    async def aput(self, config: RunnableConfig, checkpoint, metadata, new_versions) -> RunnableConfig:
+        configurable = config["configurable"]
+        return {"configurable": {
+            "thread_id": configurable["thread_id"],
+            "checkpoint_ns": configurable.get("checkpoint_ns", ""),
+            "checkpoint_id": checkpoint["id"],
+        }}
+
+    async def aput_writes(self, config: RunnableConfig, writes: list[tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        pass
+
+
+def create_store(backend: str, path: str = "", **kwargs) -> ConversationStore:
+    if backend == "sqlite":
+        return SqliteConversationStore(path, **kwargs)
+    if backend == "memory":
+        return MemoryConversationStore(**kwargs)
+    raise ValueError(f"Unknown checkpoint backend: {backend}")
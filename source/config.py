@@ -6,8 +6,121 @@ load_dotenv()
 NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "Password")
+# "neo4j" (server) or "kuzu" (embedded, needs `pip install kuzu`)
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "neo4j")
+KUZU_DB_PATH = os.getenv("KUZU_DB_PATH", "data/graph.kuzu")
+# Connection pool of the Neo4j driver; timeouts and lifetime are in seconds
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "100"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "60"))
+NEO4J_CONNECTION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "30"))
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "1000"))
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_BATCH_SIZE = int(os.getenv("INGESTION_BATCH_SIZE", "8"))
+INGESTION_BATCH_WAIT = float(os.getenv("INGESTION_BATCH_WAIT", "0.5"))
+INGESTION_SPILL_PATH = os.getenv("INGESTION_SPILL_PATH", "")
+# "local" writes episodes in-process; "spool" hands them to the shared drainer of serve.py
+INGESTION_MODE = os.getenv("INGESTION_MODE", "local")
+INGESTION_SPOOL_PATH = os.getenv("INGESTION_SPOOL_PATH", "data/ingestion.db")
+# Writes that fail are retried after INGESTION_RETRY_BACKOFF seconds, doubling per attempt.
+# After INGESTION_MAX_ATTEMPTS, spooled exchanges move to the spool's dead_exchanges table
+# and in-process ones to INGESTION_SPILL_PATH (if set) for the next replay
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", "5"))
+INGESTION_RETRY_BACKOFF = float(os.getenv("INGESTION_RETRY_BACKOFF", "5"))
+
+RETRIEVAL_EDGE_LIMIT = int(os.getenv("RETRIEVAL_EDGE_LIMIT", "8"))
+RETRIEVAL_NODE_LIMIT = int(os.getenv("RETRIEVAL_NODE_LIMIT", "4"))
+RETRIEVAL_EPISODE_LIMIT = int(os.getenv("RETRIEVAL_EPISODE_LIMIT", "3"))
+CONTEXT_FACTS_TOKENS = int(os.getenv("CONTEXT_FACTS_TOKENS", "600"))
+CONTEXT_SUMMARIES_TOKENS = int(os.getenv("CONTEXT_SUMMARIES_TOKENS", "250"))
+CONTEXT_EPISODES_TOKENS = int(os.getenv("CONTEXT_EPISODES_TOKENS", "350"))
+CONTEXT_EPISODE_MAX_TOKENS = int(os.getenv("CONTEXT_EPISODE_MAX_TOKENS", "150"))
+# Items whose words overlap a chosen fact, summary or episode line this much are left out
+CONTEXT_OVERLAP_THRESHOLD = float(os.getenv("CONTEXT_OVERLAP_THRESHOLD", "0.8"))
+RETRIEVAL_CACHE_MAX_BYTES = int(os.getenv("RETRIEVAL_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+RETRIEVAL_DEADLINE = float(os.getenv("RETRIEVAL_DEADLINE", "1.5"))
+PREFETCH_DEBOUNCE = float(os.getenv("PREFETCH_DEBOUNCE", "0.3"))
+# Opt-in in-process copy of active groups' facts for sub-millisecond search; PATH memory-maps
+# the embedding matrices, groups with more than MAX_ITEMS items stay on graph search
+LOCAL_INDEX_ENABLED = os.getenv("LOCAL_INDEX_ENABLED", "false").lower() == "true"
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "")
+LOCAL_INDEX_MAX_GROUPS = int(os.getenv("LOCAL_INDEX_MAX_GROUPS", "1000"))
+LOCAL_INDEX_MAX_ITEMS = int(os.getenv("LOCAL_INDEX_MAX_ITEMS", "20000"))
+LOCAL_INDEX_VECTOR_WEIGHT = float(os.getenv("LOCAL_INDEX_VECTOR_WEIGHT", "0.7"))
+# Opt-in reuse of first-turn replies; SIMILARITY is the difflib ratio two messages need to share a reply
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "1000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.9"))
+
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "sqlite")
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "data/checkpoints.db")
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "20"))
+HISTORY_COMPACT_AFTER = int(os.getenv("HISTORY_COMPACT_AFTER", "40"))
+MAX_THREADS_IN_MEMORY = int(os.getenv("MAX_THREADS_IN_MEMORY", "1000"))
+
+EMBEDDING_CACHE_ENTRIES = int(os.getenv("EMBEDDING_CACHE_ENTRIES", "10000"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embeddings")
+EMBEDDING_CACHE_CAPACITY = int(os.getenv("EMBEDDING_CACHE_CAPACITY", "100000"))
+
+# 0 disables the request or token rate limit
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_BACKGROUND_CONCURRENCY = int(os.getenv("LLM_BACKGROUND_CONCURRENCY", "4"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "256"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# The only retries of a chat or extraction call; the OpenAI clients are built with max_retries=0
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+
+# Consolidation folds all but the newest KEEP_RECENT episodes of a group into summaries of
+# BATCH episodes, and prunes facts invalidated more than PRUNE_AFTER_DAYS ago; 0 disables the loop
+CONSOLIDATION_INTERVAL = float(os.getenv("CONSOLIDATION_INTERVAL", "0"))
+CONSOLIDATION_KEEP_RECENT = int(os.getenv("CONSOLIDATION_KEEP_RECENT", "50"))
+CONSOLIDATION_BATCH = int(os.getenv("CONSOLIDATION_BATCH", "20"))
+CONSOLIDATION_PRUNE_AFTER_DAYS = float(os.getenv("CONSOLIDATION_PRUNE_AFTER_DAYS", "30"))
+CONSOLIDATION_PAUSE = float(os.getenv("CONSOLIDATION_PAUSE", "1.0"))
+CONSOLIDATION_STATE_PATH = os.getenv("CONSOLIDATION_STATE_PATH", "data/consolidation.json")
+
+# Bump SCHEMA_VERSION when the indexes change; "auto" skips the index build when the
+# graph's marker already has this version, "always" and "never" override the check
+SCHEMA_VERSION = int(os.getenv("SCHEMA_VERSION", "3"))
+INDEX_BUILD = os.getenv("INDEX_BUILD", "auto")
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+# Health probes (/health/live, /health/ready), reconnects and the drain on shutdown
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "10"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "2"))
+RECONNECT_BACKOFF_INITIAL = float(os.getenv("RECONNECT_BACKOFF_INITIAL", "1"))
+RECONNECT_BACKOFF_MAX = float(os.getenv("RECONNECT_BACKOFF_MAX", "30"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+
+TRACING_SINKS = os.getenv("TRACING_SINKS", "memory,prometheus")
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "7860"))
+WORKERS = int(os.getenv("WORKERS") or os.cpu_count() or 1)
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "7870"))
+# Headless chat API under /api, see source/api.py
+API_ENABLED = os.getenv("API_ENABLED", "true").lower() == "true"
+API_BATCH_CONCURRENCY = int(os.getenv("API_BATCH_CONCURRENCY", "16"))
+API_BATCH_MAX_TURNS = int(os.getenv("API_BATCH_MAX_TURNS", "1000"))
+
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4.1")
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "1800"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "10000"))
+# "sqlite" shares session state between the workers started by serve.py
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_PATH = os.getenv("SESSION_PATH", "data/sessions.db")
+STREAM_COALESCE_WINDOW = float(os.getenv("STREAM_COALESCE_WINDOW", "0.05"))
+STREAM_COALESCE_CHARS = int(os.getenv("STREAM_COALESCE_CHARS", "64"))
+# Personas shown per page in the agent selector, and rows per UNWIND in import_personas.py
+PERSONA_PAGE_SIZE = int(os.getenv("PERSONA_PAGE_SIZE", "50"))
+PERSONA_IMPORT_BATCH = int(os.getenv("PERSONA_IMPORT_BATCH", "500"))
+
 DEFAULT_SYSTEM_PROMPT = """
 You are a friendly, human-like conversational AI person. Keep responses concise.
 Do not mention you are an AI model. Use a casual, engaging tone with occasional humor.
@@ -36,6 +149,26 @@ Relevant facts about your conversation with {user_name}:
 User messages:
 """
 
+SUMMARY_PROMPT = """
+Summarize the conversation below between a user and an AI persona in a few sentences.
+Keep names, preferences, facts and open questions; drop small talk.
+
+Previous summary:
+{summary}
+
+Conversation:
+{conversation}
+"""
+
+CONSOLIDATION_PROMPT = """
+Condense these conversation excerpts between a user and an AI persona into one summary.
+Keep every distinct fact, preference, name, date and open question; drop greetings,
+small talk and repetitions. Write plain sentences in the order things happened.
+
+Excerpts:
+{episodes}
+"""
+
 AGENT_CREATOR = """
 CREATE (a:AgentEntity {
     uuid: $uuid,
@@ -59,8 +192,273 @@ MATCH (a:AgentEntity)
     ORDER BY a.created_at DESC
 """
 
+GET_PERSONAS_PAGE = """
+MATCH (a:AgentEntity) 
+    WHERE a.type = 'agent_persona'
+    RETURN a
+    ORDER BY a.created_at DESC, a.uuid
+    LIMIT $limit
+"""
+
+# Keyset paging: the page after persona $after in (created_at DESC, uuid) order, which
+# uses the (type, created_at) index instead of skipping over the earlier pages
+GET_PERSONAS_PAGE_AFTER = """
+MATCH (c:AgentEntity {uuid: $after})
+MATCH (a:AgentEntity)
+    WHERE a.type = 'agent_persona'
+    AND (a.created_at < c.created_at OR (a.created_at = c.created_at AND a.uuid > c.uuid))
+    RETURN a
+    ORDER BY a.created_at DESC, a.uuid
+    LIMIT $limit
+"""
+
+# Bulk import: one UNWIND per chunk; rows with an existing uuid are updated in place
+PERSONA_IMPORTER = """
+UNWIND $personas AS p
+MERGE (a:AgentEntity {uuid: p.uuid})
+    ON CREATE SET a.created_at = datetime(), a.type = 'agent_persona'
+SET a.name = p.name,
+    a.surname = p.surname,
+    a.full_name = p.full_name,
+    a.age = p.age,
+    a.profession = p.profession,
+    a.hobbies = p.hobbies,
+    a.additional_info = p.additional_info
+RETURN count(a) AS imported
+"""
+
+# $query is a Lucene query built by the store from the user's words
+SEARCH_PERSONAS = """
+CALL db.index.fulltext.queryNodes('agent_persona_search', $query) YIELD node AS a, score
+    WHERE a.type = 'agent_persona'
+    RETURN a
+    ORDER BY score DESC, a.uuid
+    SKIP $offset LIMIT $limit
+"""
+
 GET_PERSONA = """
 MATCH (a:AgentEntity) 
     WHERE a.uuid = $uuid AND a.type = 'agent_persona'
     RETURN a
 """
+
+USER_INDEX = """
+CREATE INDEX entity_name_group IF NOT EXISTS FOR (n:Entity) ON (n.name, n.group_id)
+"""
+
+USER_CONSTRAINT = """
+CREATE CONSTRAINT user_name_group IF NOT EXISTS FOR (n:User) REQUIRE (n.name, n.group_id) IS UNIQUE
+"""
+
+PERSONA_UUID_CONSTRAINT = """
+CREATE CONSTRAINT agent_persona_uuid IF NOT EXISTS FOR (a:AgentEntity) REQUIRE a.uuid IS UNIQUE
+"""
+
+PERSONA_TYPE_INDEX = """
+CREATE INDEX agent_persona_type IF NOT EXISTS FOR (a:AgentEntity) ON (a.type, a.created_at)
+"""
+
+PERSONA_SEARCH_INDEX = """
+CREATE FULLTEXT INDEX agent_persona_search IF NOT EXISTS FOR (a:AgentEntity) ON EACH [a.full_name, a.profession, a.hobbies]
+"""
+
+PING = """
+RETURN 1 AS ok
+"""
+
+GET_SCHEMA_VERSION = """
+MATCH (s:SchemaVersion {name: 'chatbot'})
+RETURN s.version AS version
+"""
+
+SET_SCHEMA_VERSION = """
+MERGE (s:SchemaVersion {name: 'chatbot'})
+SET s.version = $version, s.updated_at = datetime()
+"""
+
+# Oldest first, so an entity Graphiti extracted for the user wins over a later duplicate
+GET_USER = """
+MATCH (n:Entity {name: $name, group_id: $group_id})
+RETURN n.uuid AS uuid
+ORDER BY n.created_at, n.uuid
+LIMIT 1
+"""
+
+# The User label carries the (name, group_id) uniqueness constraint, so concurrent merges
+# of one user cannot create two nodes; Graphiti's own entities are left unconstrained
+MERGE_USER = """
+MERGE (n:Entity:User {name: $name, group_id: $group_id})
+    ON CREATE SET n.uuid = $uuid, n.summary = '', n.created_at = datetime(), n.name_embedding = $name_embedding
+RETURN n.uuid AS uuid
+"""
+
+CONSOLIDATION_GROUPS = """
+MATCH (ep:Episodic)
+    WHERE ep.group_id > $after
+WITH ep.group_id AS group_id, count(ep) AS episodes
+    WHERE episodes > $keep_recent
+RETURN group_id
+ORDER BY group_id
+LIMIT $limit
+"""
+
+GRAPH_SIZE = """
+OPTIONAL MATCH (ep:Episodic) WHERE $group_id IS NULL OR ep.group_id = $group_id
+WITH count(ep) AS episodes
+OPTIONAL MATCH (n:Entity) WHERE $group_id IS NULL OR n.group_id = $group_id
+WITH episodes, count(n) AS entities
+OPTIONAL MATCH (:Entity)-[e:RELATES_TO]->(:Entity) WHERE $group_id IS NULL OR e.group_id = $group_id
+RETURN episodes, entities, count(e) AS facts
+"""
+
+MERGE_DUPLICATE_FACTS = """
+MATCH (a:Entity)-[e:RELATES_TO {group_id: $group_id}]->(b:Entity)
+    WHERE e.expired_at IS NULL
+WITH a, b, toLower(trim(e.fact)) AS fact, e
+ORDER BY e.created_at
+WITH a, b, fact, collect(e) AS edges
+    WHERE size(edges) > 1
+WITH head(edges) AS keep, tail(edges) AS duplicates
+SET keep.episodes = reduce(acc = coalesce(keep.episodes, []), d IN duplicates | acc + [x IN coalesce(d.episodes, []) WHERE NOT x IN acc])
+FOREACH (d IN duplicates | DELETE d)
+RETURN sum(size(duplicates)) AS merged
+"""
+
+PRUNE_EXPIRED_FACTS = """
+MATCH (:Entity)-[e:RELATES_TO {group_id: $group_id}]->(:Entity)
+    WHERE e.expired_at IS NOT NULL AND e.expired_at < datetime() - duration({days: $days})
+DELETE e
+RETURN count(*) AS pruned
+"""
+
+GET_OLD_EPISODES = """
+MATCH (ep:Episodic {group_id: $group_id})
+    WHERE coalesce(ep.source_description, '') <> $summary_source
+WITH ep
+ORDER BY ep.valid_at DESC
+SKIP $keep_recent
+WITH ep
+ORDER BY ep.valid_at
+LIMIT $limit
+RETURN ep.uuid AS uuid, ep.content AS content
+"""
+
+REPLACE_EPISODES = """
+MATCH (ep:Episodic {group_id: $group_id})
+    WHERE ep.uuid IN $episode_uuids
+OPTIONAL MATCH (ep)-[:MENTIONS]->(n:Entity)
+WITH collect(DISTINCT ep) AS episodes, collect(DISTINCT n) AS mentioned, max(ep.valid_at) AS valid_at
+CREATE (s:Episodic {
+    uuid: $uuid,
+    name: $name,
+    group_id: $group_id,
+    content: $content,
+    source: 'text',
+    source_description: $summary_source,
+    entity_edges: reduce(acc = [], ep IN episodes | acc + [x IN coalesce(ep.entity_edges, []) WHERE NOT x IN acc]),
+    created_at: datetime(),
+    valid_at: valid_at
+})
+FOREACH (n IN mentioned | CREATE (s)-[:MENTIONS {uuid: randomUUID(), group_id: $group_id, created_at: datetime()}]->(n))
+FOREACH (ep IN episodes | DETACH DELETE ep)
+RETURN s.uuid AS uuid
+"""
+
+RELINK_FACT_EPISODES = """
+MATCH (:Entity)-[e:RELATES_TO {group_id: $group_id}]->(:Entity)
+    WHERE any(x IN coalesce(e.episodes, []) WHERE x IN $episode_uuids)
+SET e.episodes = [x IN e.episodes WHERE NOT x IN $episode_uuids] + $uuid
+"""
+
+GROUP_FACTS = """
+MATCH (a:Entity)-[e:RELATES_TO {group_id: $group_id}]->(b:Entity)
+    WHERE e.expired_at IS NULL
+RETURN e.uuid AS uuid, e.fact AS fact, e.fact_embedding AS embedding, e.created_at AS created_at,
+    e.valid_at AS valid_at, a.uuid AS source_node_uuid, b.uuid AS target_node_uuid
+LIMIT $limit
+"""
+
+GROUP_ENTITIES = """
+MATCH (n:Entity {group_id: $group_id})
+RETURN n.uuid AS uuid, n.name AS name, n.summary AS summary, n.name_embedding AS embedding, n.created_at AS created_at
+LIMIT $limit
+"""
+
+GROUP_EPISODES = """
+MATCH (ep:Episodic {group_id: $group_id})
+RETURN ep.uuid AS uuid, ep.content AS content, ep.created_at AS created_at, ep.valid_at AS valid_at
+LIMIT $limit
+"""
+
+# Kuzu needs declared tables and has no datetime() or composite indexes, so the
+# embedded backend uses its own variants of the queries above
+KUZU_SCHEMA = """
+CREATE NODE TABLE IF NOT EXISTS AgentEntity (
+    uuid STRING PRIMARY KEY,
+    name STRING,
+    surname STRING,
+    full_name STRING,
+    age INT64,
+    profession STRING,
+    hobbies STRING,
+    additional_info STRING,
+    created_at TIMESTAMP,
+    type STRING
+);
+CREATE NODE TABLE IF NOT EXISTS SchemaVersion (
+    name STRING PRIMARY KEY,
+    version INT64,
+    updated_at TIMESTAMP
+);
+"""
+
+KUZU_AGENT_CREATOR = """
+CREATE (a:AgentEntity {
+    uuid: $uuid,
+    name: $name,
+    surname: $surname,
+    full_name: $full_name,
+    age: $age,
+    profession: $profession,
+    hobbies: $hobbies,
+    additional_info: $additional_info,
+    created_at: current_timestamp(),
+    type: 'agent_persona'
+})
+RETURN a.uuid AS uuid
+"""
+
+KUZU_PERSONA_IMPORTER = """
+UNWIND $personas AS p
+MERGE (a:AgentEntity {uuid: p.uuid})
+    ON CREATE SET a.created_at = current_timestamp(), a.type = 'agent_persona'
+SET a.name = p.name,
+    a.surname = p.surname,
+    a.full_name = p.full_name,
+    a.age = p.age,
+    a.profession = p.profession,
+    a.hobbies = p.hobbies,
+    a.additional_info = p.additional_info
+RETURN count(a) AS imported
+"""
+
+# Without a full-text index, every word has to appear in one of the searched fields
+KUZU_SEARCH_PERSONAS = """
+MATCH (a:AgentEntity)
+    WHERE a.type = 'agent_persona'
+    AND all(word IN $words WHERE lower(a.full_name) CONTAINS word OR lower(a.profession) CONTAINS word OR lower(a.hobbies) CONTAINS word)
+    RETURN a
+    ORDER BY a.created_at DESC, a.uuid
+    SKIP $offset LIMIT $limit
+"""
+
+KUZU_SET_SCHEMA_VERSION = """
+MERGE (s:SchemaVersion {name: 'chatbot'})
+SET s.version = $version, s.updated_at = current_timestamp()
+"""
+
+KUZU_MERGE_USER = """
+MERGE (n:Entity {uuid: $uuid})
+    ON CREATE SET n.name = $name, n.group_id = $group_id, n.labels = ['Entity', 'User'], n.summary = '', n.created_at = current_timestamp(), n.name_embedding = $name_embedding
+RETURN n.uuid AS uuid
+"""
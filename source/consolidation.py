@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+import uuid
+
+from graphiti_core.prompts.models import Message
+from pydantic import BaseModel, Field
+
+from source.config import CONSOLIDATION_PROMPT
+from source.context import count_tokens
+from source.tracing import tracer
+
+SUMMARY_SOURCE = "Chatbot-consolidated"
+
+
+class EpisodeSummary(BaseModel):
+    summary: str = Field(..., description="Condensed summary of the conversation excerpts")
+
+
+class ConsolidationState:
+    """Remembers the last finished group, so an interrupted pass resumes after it"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.after = ""
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.after = json.load(f).get("after", "")
+
+    def save(self, after: str) -> None:
+        self.after = after
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"after": after}, f)
+        os.replace(tmp, self.path)
+
+
+class Consolidator:
+    """Background pass that keeps each group's memory compact: merges duplicate facts,
+    prunes long-invalidated ones and folds old episodes into summary episodes"""
+
+    def __init__(
+        self,
+        service,
+        keep_recent: int = 50,
+        batch_size: int = 20,
+        prune_after_days: float = 30.0,
+        pause: float = 1.0,
+        state_path: str = "",
+        groups_per_query: int = 100,
+    ):
+        self.service = service
+        self.store = service.store
+        self.keep_recent = keep_recent
+        self.batch_size = batch_size
+        self.prune_after_days = prune_after_days
+        # Sleep between groups and batches so the pass never competes with chat traffic
+        self.pause = pause
+        self.state = ConsolidationState(state_path)
+        self.groups_per_query = groups_per_query
+        # Counts of the current pass
+        self.totals = {"groups": 0, "merged": 0, "pruned": 0, "summarized": 0}
+
+    async def _summarize(self, contents: list[str]) -> str:
+        episodes = "\n---\n".join(contents)
+        prompt = CONSOLIDATION_PROMPT.format(episodes=episodes)
+        # Graphiti's client is admitted on the scheduler's background lane
+        response = await self.service.client.llm_client.generate_response(
+            [Message(role="user", content=prompt)],
+            response_model=EpisodeSummary,
+            max_tokens=max(256, count_tokens(episodes) // 2),
+        )
+        return response.get("summary", "")
+
+    async def consolidate_group(self, group_id: str) -> dict:
+        result = {"merged": 0, "pruned": 0, "summarized": 0}
+        with tracer.span("consolidate_group"):
+            result["merged"] = await self.store.merge_duplicate_facts(group_id)
+            result["pruned"] = await self.store.prune_expired_facts(group_id, self.prune_after_days)
+            while True:
+                episodes = await self.store.old_episodes(group_id, self.keep_recent, self.batch_size, SUMMARY_SOURCE)
+                # A lone leftover episode is not worth a summary of its own
+                if len(episodes) < 2:
+                    break
+                summary = await self._summarize([e['content'] for e in episodes])
+                if not summary:
+                    break
+                await self.store.replace_episodes(group_id, [e['uuid'] for e in episodes], {
+                    'uuid': str(uuid.uuid4()),
+                    'name': f"Summary of {len(episodes)} episodes",
+                    'content': summary,
+                    'summary_source': SUMMARY_SOURCE,
+                })
+                result["summarized"] += len(episodes)
+                await asyncio.sleep(self.pause)
+        # Searches over the group would still return the merged and replaced items
+        self.service.invalidate_group(group_id)
+        for key, value in result.items():
+            if value:
+                tracer.count("consolidation_items_total", value, action=key)
+        return result
+
+    async def run_once(self) -> dict:
+        """One resumable pass over every group that has grown past keep_recent episodes"""
+        self.totals = dict.fromkeys(self.totals, 0)
+        before = await self.store.graph_size()
+        while True:
+            groups = await self.store.consolidation_groups(self.state.after, self.keep_recent, self.groups_per_query)
+            if not groups:
+                break
+            for group_id in groups:
+                try:
+                    result = await self.consolidate_group(group_id)
+                except Exception as e:
+                    print(f"Error consolidating group {group_id}: {e}")
+                    result = {}
+                self.totals["groups"] += 1
+                for key, value in result.items():
+                    self.totals[key] += value
+                self.state.save(group_id)
+                await asyncio.sleep(self.pause)
+        # The pass is complete, the next one starts from the first group again
+        self.state.save("")
+        after = await self.store.graph_size()
+        for kind in ("episodes", "entities", "facts"):
+            tracer.gauge("graph_size", after[kind], kind=kind)
+        print(f"Consolidated graph: {dict(before)} -> {dict(after)}, {self.totals}")
+        return {"before": dict(before), "after": dict(after), **self.totals}
+
+    async def run(self, interval: float) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Error in consolidation pass: {e}")
+            await asyncio.sleep(interval)
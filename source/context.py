@@ -0,0 +1,133 @@
+import math
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # No tokenizer available (or its vocabulary cannot be fetched): fall back to an estimate
+        return None
+
+
+# Only short texts (facts, summaries, messages) repeat often enough to cache; long ones such
+# as whole prompts would each pin their string in the cache
+MAX_CACHED_CHARS = 512
+
+
+def _count(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+_count_cached = lru_cache(maxsize=65536)(_count)
+
+
+def count_tokens(text: str) -> int:
+    return _count_cached(text) if len(text) <= MAX_CACHED_CHARS else _count(text)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _encoding()
+    if encoding is None:
+        return text[:max_tokens * 4].rstrip() + "…"
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]).rstrip() + "…"
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+@dataclass(slots=True)
+class ContextItem:
+    text: str
+    rank: int
+    created_at: datetime | None = None
+
+
+class ContextAssembler:
+    """Builds the facts section of RESPONSE_PROMPT within a per-section token budget"""
+
+    SECTIONS = (("facts", "FACTS:"), ("summaries", "SUMMARIES:"), ("episodes", "CONTENTS:"))
+
+    def __init__(self, budgets: dict[str, int], episode_max_tokens: int = 150, recency_weight: float = 0.3, half_life_days: float = 30.0, overlap_threshold: float = 0.8):
+        self.budgets = budgets
+        self.episode_max_tokens = episode_max_tokens
+        # Share of an item's words already in one chosen item above which it is dropped
+        self.overlap_threshold = overlap_threshold
+        self.recency_weight = recency_weight
+        self.half_life_days = half_life_days
+
+    def _score(self, item: ContextItem, now: datetime) -> float:
+        # Search order is the relevance signal; recency decays with a half life
+        relevance = 1.0 / (1 + item.rank)
+        if item.created_at is None:
+            return relevance
+        created_at = item.created_at if item.created_at.tzinfo else item.created_at.replace(tzinfo=timezone.utc)
+        age_days = max((now - created_at).total_seconds() / 86400, 0.0)
+        return relevance + self.recency_weight * math.exp(-age_days * math.log(2) / self.half_life_days)
+
+    def _section_budgets(self, token_budget: int | None) -> dict[str, int]:
+        if token_budget is None:
+            return self.budgets
+        total = sum(self.budgets.values()) or 1
+        return {name: token_budget * budget // total for name, budget in self.budgets.items()}
+
+    def assemble(self, facts: list[ContextItem], summaries: list[ContextItem], episodes: list[ContextItem], token_budget: int | None = None) -> str:
+        now = datetime.now(timezone.utc)
+        budgets = self._section_budgets(token_budget)
+        seen: set[str] = set()
+        chosen_words: list[set[str]] = []
+
+        def is_new(text: str) -> bool:
+            """Whether text says something no chosen item in any section already says"""
+            key = _normalize(text)
+            if not key or key in seen:
+                return False
+            words = set(key.split())
+            # Near-duplicates, such as a fact restated inside an episode line, are mostly
+            # made of words one chosen item already has
+            if any(len(words & chosen) >= self.overlap_threshold * len(words) for chosen in chosen_words):
+                return False
+            seen.add(key)
+            chosen_words.append(words)
+            return True
+
+        def dedupe(items: list[ContextItem]) -> list[ContextItem]:
+            return [item for item in sorted(items, key=lambda i: self._score(i, now), reverse=True) if is_new(item.text)]
+
+        chosen_facts = dedupe(facts)
+        chosen_summaries = dedupe(summaries)
+
+        # Episode lines that repeat a fact, or another episode, carry nothing new
+        compressed = []
+        for item in episodes:
+            lines = []
+            for line in item.text.splitlines():
+                if is_new(line):
+                    lines.append(line)
+            if lines:
+                text = truncate_tokens("\n".join(lines), self.episode_max_tokens)
+                compressed.append(ContextItem(text, item.rank, item.created_at))
+        chosen_episodes = sorted(compressed, key=lambda i: self._score(i, now), reverse=True)
+
+        output = []
+        for (name, header), items in zip(self.SECTIONS, (chosen_facts, chosen_summaries, chosen_episodes)):
+            output.append(header)
+            remaining = budgets.get(name, 0)
+            for item in items:
+                cost = count_tokens(item.text)
+                if cost > remaining:
+                    continue
+                output.append(item.text)
+                remaining -= cost
+        return "\n".join(output) + "\n"
@@ -0,0 +1,204 @@
+import hashlib
+import os
+from collections import OrderedDict
+from collections.abc import Iterable
+
+import numpy as np
+from graphiti_core.embedder.client import EmbedderClient
+
+from source.tracing import tracer
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no advisory locks, the one-writer rule is then up to the deployment
+    fcntl = None
+
+
+class StoreInUse(RuntimeError):
+    """Raised when another process already writes to an embedding store directory"""
+
+
+class DiskEmbeddingStore:
+    """Append-only float32 matrix in a memory-mapped file plus a hash -> row index"""
+
+    def __init__(self, directory: str, dim: int, capacity: int = 100000):
+        self.dim = dim
+        self.capacity = capacity
+        os.makedirs(directory, exist_ok=True)
+        # New rows are numbered from this process's index, so a second writer would
+        # overwrite rows and interleave index lines; only one process may open a directory
+        self._lock_file = open(os.path.join(directory, "lock"), "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise StoreInUse(f"{directory} is in use by another process")
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.index_path = os.path.join(directory, "index.tsv")
+        with open(os.path.join(directory, "dim"), "w", encoding="utf-8") as f:
+            f.write(str(dim))
+
+        self.rows: dict[str, int] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                for line in f:
+                    key, _, row = line.rstrip("\n").partition("\t")
+                    if row:
+                        self.rows[key] = int(row)
+        self.capacity = max(self.capacity, len(self.rows))
+        self._open(self.capacity)
+        self._index_file = open(self.index_path, "a", encoding="utf-8", buffering=1)
+
+    def _open(self, capacity: int) -> None:
+        size = capacity * self.dim * 4
+        if not os.path.exists(self.vectors_path) or os.path.getsize(self.vectors_path) < size:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(size)
+        self.capacity = capacity
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    @staticmethod
+    def stored_dim(directory: str) -> int:
+        """Dimension of an existing store, or 0 if there is none"""
+        try:
+            with open(os.path.join(directory, "dim"), encoding="utf-8") as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return 0
+
+    def get(self, key: str) -> np.ndarray | None:
+        row = self.rows.get(key)
+        return None if row is None else np.array(self.vectors[row])
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        if key in self.rows or vector.shape != (self.dim,):
+            return
+        row = len(self.rows)
+        if row >= self.capacity:
+            self.vectors.flush()
+            self._open(self.capacity * 2)
+        self.vectors[row] = vector
+        # The vector is written before its index line, so a crash never indexes garbage
+        self.rows[key] = row
+        self._index_file.write(f"{key}\t{row}\n")
+
+    def close(self) -> None:
+        self.vectors.flush()
+        self._index_file.close()
+        self._lock_file.close()
+
+
+class CachedEmbedder(EmbedderClient):
+    """Wraps an embedder with a content-hash keyed LRU tier and an optional on-disk tier"""
+
+    def __init__(self, inner: EmbedderClient, memory_entries: int = 10000, disk_path: str = "", disk_capacity: int = 100000):
+        self.inner = inner
+        self.config = getattr(inner, "config", None)
+        self.memory_entries = memory_entries
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._disk_path = disk_path
+        self._disk_capacity = disk_capacity
+        self._disk: DiskEmbeddingStore | None = None
+        # Vectors from different models or dimensions must never share a key
+        model = getattr(self.config, "embedding_model", type(inner).__name__)
+        dim = getattr(self.config, "embedding_dim", 0)
+        self._namespace = f"{model}:{dim}:"
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256((self._namespace + text).encode()).hexdigest()[:32]
+
+    def _lookup(self, key: str) -> np.ndarray | None:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            tracer.count("embedding_cache_total", result="memory_hit")
+            return vector
+        if self._disk is not None:
+            vector = self._disk.get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                tracer.count("embedding_cache_total", result="disk_hit")
+                self._remember(key, vector, to_disk=False)
+                return vector
+        self.misses += 1
+        tracer.count("embedding_cache_total", result="miss")
+        return None
+
+    def _remember(self, key: str, vector: np.ndarray, to_disk: bool = True) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+        if to_disk and self._disk_path:
+            if self._disk is None:
+                # Opened lazily since the dimension is only known from the first vector
+                self._create_disk(len(vector))
+            if self._disk is not None:
+                self._disk.put(key, vector)
+
+    def _create_disk(self, dim: int) -> None:
+        try:
+            self._disk = DiskEmbeddingStore(self._disk_path, dim, self._disk_capacity)
+        except StoreInUse as e:
+            print(f"Error opening embedding cache, keeping embeddings in memory only: {e}")
+            self._disk_path = ""
+
+    def _open_disk(self) -> None:
+        if self._disk is not None or not self._disk_path:
+            return
+        dim = DiskEmbeddingStore.stored_dim(self._disk_path)
+        if dim:
+            self._create_disk(dim)
+
+    async def create(self, input_data: str | list[str] | Iterable[int] | Iterable[Iterable[int]]) -> list[float]:
+        if isinstance(input_data, list) and len(input_data) == 1 and isinstance(input_data[0], str):
+            input_data = input_data[0]
+        if not isinstance(input_data, str):
+            return await self.inner.create(input_data)
+
+        self._open_disk()
+        key = self._key(input_data)
+        vector = self._lookup(key)
+        if vector is None:
+            embedding = await self.inner.create(input_data)
+            vector = np.asarray(embedding, dtype=np.float32)
+            self._remember(key, vector)
+        return vector.tolist()
+
+    async def create_batch(self, input_data_list: list[str]) -> list[list[float]]:
+        self._open_disk()
+        keys = [self._key(text) for text in input_data_list]
+        vectors = [self._lookup(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Duplicates inside one batch are embedded once
+            unique = list(dict.fromkeys(input_data_list[i] for i in missing))
+            embeddings = await self.inner.create_batch(unique)
+            by_text = {text: np.asarray(e, dtype=np.float32) for text, e in zip(unique, embeddings)}
+            for i in missing:
+                vectors[i] = by_text[input_data_list[i]]
+                self._remember(keys[i], vectors[i])
+        return [vector.tolist() for vector in vectors]
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+    def metrics(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._disk.rows) if self._disk is not None else 0,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+        }
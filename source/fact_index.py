@@ -0,0 +1,382 @@
+import asyncio
+import math
+import os
+import re
+import shutil
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+from source.tracing import tracer
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text.lower())
+
+
+@dataclass(slots=True)
+class IndexedFact:
+    uuid: str
+    fact: str
+    source_node_uuid: str
+    target_node_uuid: str
+    created_at: datetime | None = None
+    valid_at: datetime | None = None
+
+
+@dataclass(slots=True)
+class IndexedNode:
+    uuid: str
+    name: str
+    summary: str
+    created_at: datetime | None = None
+
+
+@dataclass(slots=True)
+class IndexedEpisode:
+    uuid: str
+    content: str
+    created_at: datetime | None = None
+    valid_at: datetime | None = None
+
+
+class _Table:
+    """Items of one kind: unit-length float32 embeddings in one matrix plus a BM25 index"""
+
+    def __init__(self, vectors_path: str = "", k1: float = 1.2, b: float = 0.75):
+        self.vectors_path = vectors_path
+        self.k1 = k1
+        self.b = b
+        self.items: list = []
+        self.rows: dict[str, int] = {}
+        self.docs: list[Counter] = []
+        self.matrix: np.ndarray | None = None
+        self.dim = 0
+        # Rebuilt on the next search after any change
+        self._postings: dict[str, tuple[np.ndarray, np.ndarray]] | None = None
+        self._lengths: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _allocate(self, capacity: int) -> None:
+        old = self.matrix
+        if self.vectors_path:
+            # Memory-mapped like the embedding cache, grown by extending the file
+            if old is not None:
+                old.flush()
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(capacity * self.dim * 4)
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        else:
+            self.matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            if old is not None:
+                self.matrix[:len(old)] = old
+
+    def _ensure_capacity(self, row: int) -> None:
+        if row >= len(self.matrix):
+            self._allocate(max(row + 1, len(self.matrix) * 2))
+
+    def _set_vector(self, row: int, embedding) -> None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self.matrix is None:
+            self.dim = len(vector)
+            if self.vectors_path and os.path.exists(self.vectors_path):
+                os.remove(self.vectors_path)
+            self._allocate(max(64, row + 1))
+        self._ensure_capacity(row)
+        if vector.shape != (self.dim,):
+            self.matrix[row] = 0
+            return
+        norm = np.linalg.norm(vector)
+        self.matrix[row] = vector / norm if norm else vector
+
+    def upsert(self, item, text: str, embedding=None) -> None:
+        row = self.rows.get(item.uuid)
+        if row is None:
+            row = len(self.items)
+            self.rows[item.uuid] = row
+            self.items.append(item)
+            self.docs.append(Counter(tokenize(text)))
+        else:
+            self.items[row] = item
+            self.docs[row] = Counter(tokenize(text))
+        if embedding is not None and len(embedding):
+            self._set_vector(row, embedding)
+        elif self.matrix is not None:
+            self._ensure_capacity(row)
+            self.matrix[row] = 0
+        self._postings = None
+
+    def remove(self, uuid: str):
+        """Drop an item by moving the last row into its place; returns the removed item"""
+        row = self.rows.pop(uuid, None)
+        if row is None:
+            return None
+        removed = self.items[row]
+        last = len(self.items) - 1
+        if row != last:
+            self.items[row] = self.items[last]
+            self.docs[row] = self.docs[last]
+            self.rows[self.items[row].uuid] = row
+            if self.matrix is not None:
+                self.matrix[row] = self.matrix[last]
+        if self.matrix is not None:
+            self.matrix[last] = 0
+        self.items.pop()
+        self.docs.pop()
+        self._postings = None
+        return removed
+
+    def _build_postings(self) -> None:
+        docs: dict[str, list[int]] = {}
+        freqs: dict[str, list[int]] = {}
+        for row, doc in enumerate(self.docs):
+            for term, tf in doc.items():
+                docs.setdefault(term, []).append(row)
+                freqs.setdefault(term, []).append(tf)
+        self._postings = {
+            term: (np.array(rows, dtype=np.int32), np.array(freqs[term], dtype=np.float32))
+            for term, rows in docs.items()
+        }
+        self._lengths = np.array([sum(doc.values()) for doc in self.docs], dtype=np.float32)
+
+    def _bm25(self, terms: list[str]) -> np.ndarray:
+        if self._postings is None:
+            self._build_postings()
+        n = len(self.items)
+        scores = np.zeros(n, dtype=np.float32)
+        avg_length = float(self._lengths.mean()) or 1.0
+        for term in set(terms):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            rows, tf = posting
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * self._lengths[rows] / avg_length))
+        return scores
+
+    def search(self, query_vector: np.ndarray | None, terms: list[str], limit: int, vector_weight: float) -> list:
+        n = len(self.items)
+        if not n or limit <= 0:
+            return []
+        scores = self._bm25(terms)
+        top = scores.max()
+        if top > 0:
+            scores /= top
+        if self.matrix is not None and query_vector is not None and query_vector.shape == (self.dim,):
+            # Cosine of every item at once; rows are unit length and items without a vector are zero
+            scores = vector_weight * (self.matrix[:n] @ query_vector) + (1 - vector_weight) * scores
+        limit = min(limit, n)
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best])]
+        return [self.items[row] for row in best if scores[row] > 0]
+
+    def close(self) -> None:
+        self.matrix = None
+        if self.vectors_path and os.path.exists(self.vectors_path):
+            os.remove(self.vectors_path)
+
+
+class GroupIndex:
+    """The facts, entities and episodes of one group, searchable without a round trip"""
+
+    def __init__(self, directory: str = ""):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        def path(name: str) -> str:
+            return os.path.join(directory, f"{name}.f32") if directory else ""
+
+        self.facts = _Table(path("facts"))
+        self.nodes = _Table(path("nodes"))
+        self.episodes = _Table()
+        # Entity uuid -> entities it shares a fact with, counted so removals stay exact
+        self._adjacency: dict[str, Counter] = {}
+
+    def __len__(self) -> int:
+        return len(self.facts) + len(self.nodes) + len(self.episodes)
+
+    def _link(self, fact: IndexedFact, delta: int) -> None:
+        for a, b in ((fact.source_node_uuid, fact.target_node_uuid), (fact.target_node_uuid, fact.source_node_uuid)):
+            neighbours = self._adjacency.setdefault(a, Counter())
+            neighbours[b] += delta
+            if neighbours[b] <= 0:
+                del neighbours[b]
+
+    def add_fact(self, fact: IndexedFact, embedding=None) -> None:
+        previous = self.facts.remove(fact.uuid)
+        if previous is not None:
+            self._link(previous, -1)
+        self.facts.upsert(fact, fact.fact, embedding)
+        self._link(fact, 1)
+
+    def remove_fact(self, uuid: str) -> None:
+        previous = self.facts.remove(uuid)
+        if previous is not None:
+            self._link(previous, -1)
+
+    def add_node(self, node: IndexedNode, embedding=None) -> None:
+        self.nodes.upsert(node, f"{node.name} {node.summary}", embedding)
+
+    def add_episode(self, episode: IndexedEpisode) -> None:
+        self.episodes.upsert(episode, episode.content)
+
+    def linked_nodes(self, center_uuid: str, node_uuids: list[str]) -> set[str]:
+        neighbours = self._adjacency.get(center_uuid, {})
+        return {u for u in node_uuids if u in neighbours}
+
+    def search(self, query_vector: np.ndarray | None, query: str, edge_limit: int, node_limit: int, episode_limit: int, vector_weight: float):
+        terms = tokenize(query)
+        return SimpleNamespace(
+            edges=self.facts.search(query_vector, terms, edge_limit, vector_weight),
+            nodes=self.nodes.search(query_vector, terms, node_limit, vector_weight),
+            # Episodes have no embeddings, as in Graphiti's own episode search
+            episodes=self.episodes.search(None, terms, episode_limit, vector_weight),
+        )
+
+    def close(self) -> None:
+        self.facts.close()
+        self.nodes.close()
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _native(value):
+    # The neo4j driver returns its own DateTime type
+    return value.to_native() if hasattr(value, "to_native") else value
+
+
+class LocalIndex:
+    """In-process copies of active groups' memory, loaded on first use and evicted least recently used"""
+
+    def __init__(self, store, embedder, path: str = "", max_groups: int = 1000, max_items: int = 20000, vector_weight: float = 0.7):
+        self.store = store
+        self.embedder = embedder
+        self.path = path
+        self.max_groups = max_groups
+        self.max_items = max_items
+        self.vector_weight = vector_weight
+        self._groups: OrderedDict[str, GroupIndex] = OrderedDict()
+        self._loading: dict[str, asyncio.Task] = {}
+        # Groups too large (or unsupported by the backend) stay on graph search
+        self._skipped: set[str] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def get(self, group_id: str) -> GroupIndex | None:
+        index = self._groups.get(group_id)
+        if index is None:
+            self.misses += 1
+            return None
+        self._groups.move_to_end(group_id)
+        self.hits += 1
+        return index
+
+    def warm(self, group_id: str) -> None:
+        """Start loading the group in the background unless it is loaded or being loaded"""
+        if not group_id or group_id in self._groups or group_id in self._loading or group_id in self._skipped:
+            return
+        task = asyncio.create_task(self._load(group_id))
+        self._loading[group_id] = task
+
+        def done(finished: asyncio.Task) -> None:
+            if self._loading.get(group_id) is finished:
+                del self._loading[group_id]
+
+        task.add_done_callback(done)
+
+    async def _load(self, group_id: str) -> None:
+        try:
+            with tracer.span("local_index_load"):
+                memory = await self.store.group_memory(group_id, self.max_items + 1)
+        except Exception as e:
+            print(f"Error loading local index for {group_id}: {e}")
+            return
+        if sum(len(rows) for rows in memory.values()) > self.max_items:
+            self._skipped.add(group_id)
+            return
+
+        index = GroupIndex(os.path.join(self.path, group_id) if self.path else "")
+        for row in memory["facts"]:
+            index.add_fact(IndexedFact(
+                row['uuid'], row['fact'] or "", row['source_node_uuid'], row['target_node_uuid'],
+                _native(row['created_at']), _native(row['valid_at']),
+            ), row['embedding'])
+        for row in memory["nodes"]:
+            index.add_node(IndexedNode(row['uuid'], row['name'] or "", row['summary'] or "", _native(row['created_at'])), row['embedding'])
+        for row in memory["episodes"]:
+            index.add_episode(IndexedEpisode(row['uuid'], row['content'] or "", _native(row['created_at']), _native(row['valid_at'])))
+
+        self._groups[group_id] = index
+        self.loads += 1
+        while len(self._groups) > self.max_groups:
+            _, evicted = self._groups.popitem(last=False)
+            evicted.close()
+
+    def drop(self, group_id: str) -> None:
+        """Forget the group; it is reloaded from the graph on its next search"""
+        task = self._loading.pop(group_id, None)
+        if task is not None:
+            # The load may have read the graph before the change
+            task.cancel()
+        index = self._groups.pop(group_id, None)
+        if index is not None:
+            index.close()
+
+    def apply(self, group_id: str, results) -> None:
+        """Fold Graphiti's add_episode(_bulk) results into a loaded group"""
+        if group_id in self._loading:
+            self.drop(group_id)
+            return
+        index = self._groups.get(group_id)
+        if index is None:
+            return
+        for node in results.nodes:
+            if node.group_id == group_id:
+                index.add_node(IndexedNode(node.uuid, node.name, node.summary, node.created_at), node.name_embedding)
+        for edge in results.edges:
+            if edge.group_id != group_id:
+                continue
+            if edge.expired_at is not None:
+                # Superseded by the new episode
+                index.remove_fact(edge.uuid)
+            else:
+                index.add_fact(IndexedFact(
+                    edge.uuid, edge.fact, edge.source_node_uuid, edge.target_node_uuid, edge.created_at, edge.valid_at,
+                ), edge.fact_embedding)
+        episodes = results.episodes if hasattr(results, "episodes") else [results.episode]
+        for episode in episodes:
+            index.add_episode(IndexedEpisode(episode.uuid, episode.content, episode.created_at, episode.valid_at))
+        if len(index) > self.max_items:
+            self.drop(group_id)
+            self._skipped.add(group_id)
+
+    async def search(self, index: GroupIndex, query: str, edge_limit: int, node_limit: int, episode_limit: int):
+        query_vector = None
+        if edge_limit or node_limit:
+            # Served from the embedding cache for repeated queries
+            query_vector = np.asarray(await self.embedder.create(input_data=[query]), dtype=np.float32)
+            norm = np.linalg.norm(query_vector)
+            if norm:
+                query_vector /= norm
+        return index.search(query_vector, query, edge_limit, node_limit, episode_limit, self.vector_weight)
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "groups": len(self._groups),
+            "items": sum(len(index) for index in self._groups.values()),
+            "loading": len(self._loading),
+            "skipped": len(self._skipped),
+            "loads": self.loads,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
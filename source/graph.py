@@ -1,112 +1,297 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
 from typing import Annotated
 
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, add_messages, START, END
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage
-from graphiti_core.edges import EntityEdge
-from source.config import PERSONA_PROMPT, RESPONSE_PROMPT
+from langchain_core.messages import AIMessage, AIMessageChunk, SystemMessage
+from langchain_core.runnables import RunnableConfig
+from source.cache import ResponseCache
+from source.checkpoint import ConversationCheckpointer, ConversationStore, create_store
+from source.config import (
+    PERSONA_PROMPT,
+    RESPONSE_PROMPT,
+    SUMMARY_PROMPT,
+    RETRIEVAL_DEADLINE,
+    PREFETCH_DEBOUNCE,
+    CHECKPOINT_BACKEND,
+    CHECKPOINT_PATH,
+    HISTORY_WINDOW,
+    HISTORY_COMPACT_AFTER,
+    MAX_THREADS_IN_MEMORY,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_ENTRIES,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_SIMILARITY,
+)
+from source.context import count_tokens
+from source.scheduler import BACKGROUND, INTERACTIVE, LLMScheduler, llm_scheduler
+from source.service import group_id_for
+from source.tracing import tracer
 
 class AgentState(TypedDict):
     messages: Annotated[list, add_messages]
     user_name: str
-    user_node_uuid: str
     system_prompt: str
     ai_persona: dict
 
 
+@lru_cache(maxsize=1024)
+def _render_persona_prompt(persona_items: tuple) -> str:
+    persona = dict(persona_items)
+    name = persona.get('name', 'AI')
+    full_name = persona.get('full_name', name)
+    
+    return PERSONA_PROMPT.format(
+        full_name=full_name,
+        age=persona.get('age', ''),
+        profession=persona.get('profession', ''),
+        hobbies=persona.get('hobbies', 'various activities'),
+        additional_info=persona.get('additional_info', ''),
+    ).strip()
+
+
 class AgentRunner:
-    def __init__(self, service, model: str, temperature: float = 0.5):
+    def __init__(self, service, model: str, temperature: float = 0.5, llm=None, store: ConversationStore | None = None, scheduler: LLMScheduler | None = None, response_cache: ResponseCache | None = None):
         self.service = service
-        self.llm = ChatOpenAI(model=model, temperature=temperature) 
+        # One runner (and one pooled client) is shared by every session in the process
+        # Retries go through the scheduler, which also waits for a slot and the rate limits
+        self.llm = llm or ChatOpenAI(model=model, temperature=temperature, max_retries=0)
+        # Shared with Graphiti's extraction client, so chat and ingestion draw on one budget
+        self.scheduler = scheduler or llm_scheduler
+        self.response_cache = response_cache
+        if self.response_cache is None and RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(RESPONSE_CACHE_ENTRIES, RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIMILARITY)
         self.graph_builder = StateGraph(AgentState)
-        self.memory = MemorySaver()
+        # History lives in the conversation store, which also backs the graph's checkpointer,
+        # so the graph and the streaming path see the same turns
+        self.memory = store or create_store(
+            CHECKPOINT_BACKEND,
+            CHECKPOINT_PATH,
+            window=HISTORY_WINDOW,
+            compact_after=HISTORY_COMPACT_AFTER,
+            max_threads=MAX_THREADS_IN_MEMORY,
+        )
 
         self.graph_builder.add_node("agent", self.chatbot)
         self.graph_builder.add_edge(START, "agent")
         self.graph_builder.add_edge("agent", END)
 
-        self.graph = self.graph_builder.compile(checkpointer=self.memory)
+        self.graph = self.graph_builder.compile(checkpointer=ConversationCheckpointer(self.memory))
+
+        self.retrieval_deadline = RETRIEVAL_DEADLINE
+        self.prefetch_debounce = PREFETCH_DEBOUNCE
+        self.turn_timings: deque[dict] = deque(maxlen=1000)
+        # Last facts seen per group, used when retrieval misses its deadline
+        self._recent_facts: OrderedDict[str, str] = OrderedDict()
+        self._prefetches: dict[str, tuple[str, asyncio.Task]] = {}
+        self._background: set[asyncio.Task] = set()
 
     def _build_persona_prompt(self, persona: dict) -> str:
-        """Build persona-specific prompt"""
+        """Build persona-specific prompt, memoized per persona"""
         if not persona:
             return ""
-        
-        name = persona.get('name', 'AI')
-        full_name = persona.get('full_name', name)
-        
-        persona_prompt = PERSONA_PROMPT.format(
-            full_name=full_name,
-            age=persona.get('age', ''),
-            profession=persona.get('profession', ''),
-            hobbies=persona.get('hobbies', 'various activities'),
-            additional_info=persona.get('additional_info', ''),
-        ).strip()
-        return persona_prompt
-
-    async def chatbot(self, state: AgentState):
-        user_name = state["user_name"]
-        user_uuid = state["user_node_uuid"]
-        system_prompt = (state.get("system_prompt") or "").strip()
-        persona = state.get("ai_persona", {})
+        return _render_persona_prompt(tuple(sorted(persona.items())))
 
-        last_user_msg = ""
-        for m in reversed(state["messages"]):
-            role = m.get("role", m.get("type", "")) 
+    @staticmethod
+    def _last_user_message(messages: list) -> str:
+        for m in reversed(messages):
+            # Messages are plain dicts on the streaming path and message objects inside the graph
+            if isinstance(m, dict):
+                role, content = m.get("role", m.get("type", "")), m.get("content", "")
+            else:
+                role, content = getattr(m, "type", ""), getattr(m, "content", "")
             if role in ("user", "human"):
-                last_user_msg = m.get("content", "")
-                break
+                return content
+        return ""
 
+    @staticmethod
+    def _after_last_reply(messages: list) -> list:
+        for i in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[i], AIMessage):
+                return messages[i + 1:]
+        return messages
 
-        facts_string = await self.service.search_user_facts(
+    async def _retrieve_facts(self, user_name: str, persona: dict, last_user_msg: str) -> str:
+        persona_name = persona.get('full_name', persona.get('name', 'AI'))
+        group_id = group_id_for(user_name, persona.get('uuid', ''))
+        # The search is centered on the user's node in the group it searches
+        user_uuid = await self.service.get_or_create_user_uuid(user_name, persona.get('uuid', ''))
+        facts_string = await self.service.retrieve_informations(
             user_uuid,
-            f"{user_name}: {last_user_msg}",
-            num_results=8,
+            f"Current user {user_name} talking to {persona_name}: {last_user_msg}",
+            num_results=6,
+            group_ids=[group_id],
         )
+        self._recent_facts[group_id] = facts_string
+        self._recent_facts.move_to_end(group_id)
+        if len(self._recent_facts) > 1024:
+            self._recent_facts.popitem(last=False)
+        return facts_string
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def _facts_within_deadline(self, task: asyncio.Task, user_name: str, persona: dict) -> tuple[str, bool]:
+        """Wait for retrieval up to the deadline, falling back to the last facts for the group"""
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=self.retrieval_deadline), False
+        except asyncio.TimeoutError:
+            # The search keeps running and still warms the retrieval cache for the next turn
+            group_id = group_id_for(user_name, persona.get('uuid', ''))
+            return self._recent_facts.get(group_id, ""), True
+
+    def prefetch(self, thread_id: str, user_name: str, persona: dict, partial_message: str) -> None:
+        """Speculatively run retrieval for a message that is still being typed"""
+        # Sending clears the textbox; that change must not cancel the search the send will use
+        if not partial_message.strip() or not persona:
+            return
+        pending = self._prefetches.pop(thread_id, None)
+        if pending is not None and not pending[1].done():
+            pending[1].cancel()
+
+        async def debounced() -> str:
+            await asyncio.sleep(self.prefetch_debounce)
+            return await self._retrieve_facts(user_name, persona, partial_message)
+
+        task = self._spawn(debounced())
+        # Consumed exceptions keep a failed speculative search from being logged as unhandled
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._prefetches[thread_id] = (partial_message, task)
+
+    def _take_prefetch(self, thread_id: str, message: str) -> asyncio.Task | None:
+        pending = self._prefetches.pop(thread_id, None)
+        if pending is None:
+            return None
+        prefetched_message, task = pending
+        if prefetched_message == message and not task.cancelled():
+            return task
+        if not task.done():
+            task.cancel()
+        return None
+
+    async def _with_history(self, thread_id: str, system_message: SystemMessage, new_messages: list) -> list:
+        summary, history = await self.memory.history(thread_id)
+        messages = [system_message]
+        if summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+        return messages + history + list(new_messages)
+
+    async def _remember(self, thread_id: str, user_message: str, assistant_message: str) -> None:
+        await self.memory.append(thread_id, [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": assistant_message},
+        ])
+        if self.memory.needs_compaction(thread_id):
+            self._spawn(self.memory.compact(thread_id, self._summarize))
+
+    def _cache_bucket(self, persona: dict, system_prompt: str, persona_prompt: str, facts_string: str, messages: list, new_messages: list) -> tuple | None:
+        """Replies are only shared on a conversation's first turn, where only the prompt shapes them"""
+        if self.response_cache is None or len(messages) != len(new_messages) + 1:
+            return None
+        return ResponseCache.make_bucket(persona.get('uuid', ''), f"{system_prompt}\n{persona_prompt}", facts_string)
+
+    def _cached_reply(self, bucket: tuple | None, message: str) -> str | None:
+        if bucket is None:
+            return None
+        reply = self.response_cache.get(bucket, message)
+        tracer.count("response_cache_total", result="miss" if reply is None else "hit")
+        return reply
+
+    def _cache_reply(self, bucket: tuple | None, user_name: str, message: str, reply: str) -> None:
+        # The prompt names the user, and a reply that repeats the name must not reach other users
+        if bucket is not None and user_name and user_name.lower() not in reply.lower():
+            self.response_cache.put(bucket, message, reply)
+
+    @staticmethod
+    async def _replay(reply: str):
+        """A cached reply as word-sized chunks, shaped like the model's stream"""
+        for part in re.findall(r"\S*\s*", reply):
+            if part:
+                yield AIMessageChunk(content=part)
+
+    async def _summarize(self, summary: str, messages: list[dict]) -> str:
+        conversation = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = SUMMARY_PROMPT.format(summary=summary or "None", conversation=conversation)
+        response = await self.scheduler.run(BACKGROUND, lambda: self.llm.ainvoke(prompt), count_tokens(prompt))
+        self.scheduler.debit(count_tokens(response.content))
+        return response.content
+
+    async def chatbot(self, state: AgentState, config: RunnableConfig):
+        thread_id = config["configurable"]["thread_id"]
+        user_name = state["user_name"]
+        system_prompt = (state.get("system_prompt") or "").strip()
+        persona = state.get("ai_persona", {})
+
+        # The checkpoint restored the history window; the turn's input follows the last reply
+        new_messages = self._after_last_reply(state["messages"])
+        last_user_msg = self._last_user_message(new_messages)
+
+        facts_string = await self._retrieve_facts(user_name, persona, last_user_msg)
 
         persona_prompt = self._build_persona_prompt(persona)
 
-        response_prompt = RESPONSE_PROMPT.format(system_prompt, persona_prompt, user_name, facts_string)
+        response_prompt = RESPONSE_PROMPT.format(
+            system_prompt=system_prompt,
+            persona_prompt=persona_prompt,
+            user_name=user_name,
+            facts_string=facts_string
+        )
 
         system_message = SystemMessage(content=response_prompt)
 
-        messages = [system_message] + state["messages"]
-        response = await self.llm.ainvoke(messages)
+        messages = await self._with_history(thread_id, system_message, new_messages)
+        bucket = self._cache_bucket(persona, system_prompt, persona_prompt, facts_string, messages, new_messages)
+        cached = self._cached_reply(bucket, last_user_msg)
+        if cached is not None:
+            response = AIMessage(content=cached)
+        else:
+            prompt_tokens = count_tokens(response_prompt)
+            with tracer.span("llm_completion"):
+                lane = config["configurable"].get("lane", INTERACTIVE)
+                response = await self.scheduler.run(lane, lambda: self.llm.ainvoke(messages), prompt_tokens)
+            self.scheduler.debit(count_tokens(response.content))
+            self._cache_reply(bucket, user_name, last_user_msg, response.content)
+        await self._remember(thread_id, last_user_msg, response.content)
 
         ai_name = persona.get("full_name", "AI friend") if persona else "AI friend"
 
-        try:
-            import asyncio
-            asyncio.create_task(self.service.log_exchange(user_name, last_user_msg, response.content, ai_name))
-        except Exception:
-            await self.service.log_exchange(user_name, last_user_msg, response.content, ai_name)
+        # Queued on the service's ingestion pipeline, not written inline
+        await self.service.log_exchange(
+            user_name, last_user_msg, response.content, ai_name,
+            group_id=group_id_for(user_name, persona.get('uuid', '')),
+        )
 
         return {"messages": [response]}
     
-    async def astream_response(self, state, thread_id: str, ai_name: str = "AI friend"):
+    async def astream_response(self, state, thread_id: str, ai_name: str = "AI friend", deltas: bool = False):
+        """Stream the reply, yielding either the accumulated text or only the new tokens"""
         user_name = state["user_name"]
-        user_uuid = state["user_node_uuid"]
         persona = state.get("ai_persona", {})
         system_prompt=(state.get("system_prompt") or "").strip()
 
-        last_user_msg = ""
-        for m in reversed(state["messages"]):
-            role = m.get("role", m.get("type", "")) 
-            if role in ("user", "human"):
-                last_user_msg = m.get("content", "")
-                break
+        started = time.perf_counter()
+        last_user_msg = self._last_user_message(state["messages"])
         
-        # Search for facts but be more specific about the context
-        persona_name = persona.get('full_name', persona.get('name', 'AI'))
-        persona_prompt = self._build_persona_prompt(persona)
+        # Retrieval starts first (or was already started while the user typed)
+        # and overlaps with building the rest of the prompt
+        retrieval = self._take_prefetch(thread_id, last_user_msg)
+        if retrieval is None or (retrieval.done() and retrieval.exception() is not None):
+            retrieval = self._spawn(self._retrieve_facts(user_name, persona, last_user_msg))
+        with tracer.span("persona_prompt"):
+            persona_prompt = self._build_persona_prompt(persona)
 
-        facts_string = await self.service.retrieve_informations(
-            user_uuid,
-            f"Current user {user_name} talking to {persona_name}: {last_user_msg}",
-            num_results=6,
-        )
+        facts_string, timed_out = await self._facts_within_deadline(retrieval, user_name, persona)
+        retrieved = time.perf_counter()
+        if timed_out:
+            tracer.count("retrieval_deadline_exceeded_total")
 
         response_prompt = RESPONSE_PROMPT.format(
             system_prompt=system_prompt,
@@ -117,21 +302,53 @@ class AgentRunner:
 
         system_message = SystemMessage(content=response_prompt)
 
-        messages = [system_message] + state["messages"]
+        messages = await self._with_history(thread_id, system_message, state["messages"])
+        prompt_tokens = count_tokens(response_prompt)
+        bucket = self._cache_bucket(persona, system_prompt, persona_prompt, facts_string, messages, state["messages"])
+        cached = self._cached_reply(bucket, last_user_msg)
+        if cached is None:
+            tracer.observe("prompt_tokens", prompt_tokens)
+            chunks = self.scheduler.stream(INTERACTIVE, lambda: self.llm.astream(messages), prompt_tokens)
+        else:
+            # Replayed through the same loop so the UI sees the usual stream
+            chunks = self._replay(cached)
 
         # Stream the response
+        parts = []
         full_response = ""
-        async for chunk in self.llm.astream(messages):
+        llm_started = time.perf_counter()
+        async for chunk in chunks:
             if hasattr(chunk, 'content') and chunk.content:
-                full_response += chunk.content
-                yield full_response
+                if not parts:
+                    now = time.perf_counter()
+                    tracer.record_span("llm_first_token", now - llm_started)
+                    tracer.record_span("turn_first_token", now - started)
+                    self.turn_timings.append({
+                        "thread_id": thread_id,
+                        "retrieval_ms": (retrieved - started) * 1000,
+                        "retrieval_timed_out": timed_out,
+                        "ttft_ms": (now - started) * 1000,
+                    })
+                parts.append(chunk.content)
+                if deltas:
+                    yield chunk.content
+                else:
+                    full_response = "".join(parts)
+                    yield full_response
+        full_response = "".join(parts)
+        if cached is None:
+            tracer.record_span("llm_completion", time.perf_counter() - llm_started)
+            completion_tokens = count_tokens(full_response)
+            tracer.observe("completion_tokens", completion_tokens)
+            self.scheduler.debit(completion_tokens)
+            self._cache_reply(bucket, user_name, last_user_msg, full_response)
+        await self._remember(thread_id, last_user_msg, full_response)
 
         # Persist the exchange after streaming is complete
-        try:
-            import asyncio
-            asyncio.create_task(self.service.log_exchange(user_name, last_user_msg, full_response, ai_name))
-        except Exception:
-            await self.service.log_exchange(user_name, last_user_msg, full_response, ai_name)
+        await self.service.log_exchange(
+            user_name, last_user_msg, full_response, ai_name,
+            group_id=group_id_for(user_name, persona.get('uuid', '')),
+        )
 
-    async def ainvoke(self, state, thread_id: str):
-        return await self.graph.ainvoke(state, config={"configurable": {"thread_id": thread_id}})
+    async def ainvoke(self, state, thread_id: str, lane: str = INTERACTIVE):
+        return await self.graph.ainvoke(state, config={"configurable": {"thread_id": thread_id, "lane": lane}})
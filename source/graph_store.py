@@ -0,0 +1,324 @@
+import os
+import re
+import time
+
+from graphiti_core.driver.driver import GraphDriver, GraphProvider
+from graphiti_core.driver.neo4j_driver import Neo4jDriver
+from neo4j import AsyncGraphDatabase
+
+from source.config import (
+    NEO4J_MAX_POOL_SIZE,
+    NEO4J_ACQUISITION_TIMEOUT,
+    NEO4J_CONNECTION_TIMEOUT,
+    NEO4J_MAX_CONNECTION_LIFETIME,
+    AGENT_CREATOR,
+    GET_PERSONAS,
+    GET_PERSONAS_PAGE,
+    GET_PERSONAS_PAGE_AFTER,
+    GET_PERSONA,
+    PERSONA_IMPORTER,
+    SEARCH_PERSONAS,
+    GET_USER,
+    MERGE_USER,
+    USER_INDEX,
+    USER_CONSTRAINT,
+    PERSONA_UUID_CONSTRAINT,
+    PERSONA_TYPE_INDEX,
+    PERSONA_SEARCH_INDEX,
+    PING,
+    GET_SCHEMA_VERSION,
+    SET_SCHEMA_VERSION,
+    CONSOLIDATION_GROUPS,
+    GRAPH_SIZE,
+    MERGE_DUPLICATE_FACTS,
+    PRUNE_EXPIRED_FACTS,
+    GET_OLD_EPISODES,
+    REPLACE_EPISODES,
+    RELINK_FACT_EPISODES,
+    GROUP_FACTS,
+    GROUP_ENTITIES,
+    GROUP_EPISODES,
+    KUZU_SCHEMA,
+    KUZU_AGENT_CREATOR,
+    KUZU_PERSONA_IMPORTER,
+    KUZU_SEARCH_PERSONAS,
+    KUZU_SET_SCHEMA_VERSION,
+    KUZU_MERGE_USER,
+)
+from source.tracing import tracer, DEFAULT_BUCKETS
+
+
+class GraphStore:
+    """The app's own persona, user and schema queries, independent of the graph backend"""
+
+    # The consolidation queries expect facts as RELATES_TO relationships
+    supports_consolidation = True
+    # Snapshots a group's memory for the in-process fact index
+    supports_local_index = True
+
+    queries = {
+        "create_persona": AGENT_CREATOR,
+        "personas": GET_PERSONAS,
+        "personas_page": GET_PERSONAS_PAGE,
+        "personas_page_after": GET_PERSONAS_PAGE_AFTER,
+        "get_persona": GET_PERSONA,
+        "import_personas": PERSONA_IMPORTER,
+        "search_personas": SEARCH_PERSONAS,
+        "get_user": GET_USER,
+        "merge_user": MERGE_USER,
+        "ping": PING,
+        "get_schema_version": GET_SCHEMA_VERSION,
+        "set_schema_version": SET_SCHEMA_VERSION,
+        "consolidation_groups": CONSOLIDATION_GROUPS,
+        "graph_size": GRAPH_SIZE,
+        "merge_duplicate_facts": MERGE_DUPLICATE_FACTS,
+        "prune_expired_facts": PRUNE_EXPIRED_FACTS,
+        "old_episodes": GET_OLD_EPISODES,
+        "replace_episodes": REPLACE_EPISODES,
+        "relink_fact_episodes": RELINK_FACT_EPISODES,
+        "group_facts": GROUP_FACTS,
+        "group_entities": GROUP_ENTITIES,
+        "group_episodes": GROUP_EPISODES,
+    }
+
+    def __init__(self, driver: GraphDriver):
+        self.driver = driver
+
+    def _session(self, read: bool = False, **kwargs):
+        if isinstance(self.driver, TunedNeo4jDriver):
+            return self.driver.session(access_mode="READ" if read else "WRITE", **kwargs)
+        return self.driver.session()
+
+    async def _run(self, tx, name: str, params: dict | None = None) -> list[dict]:
+        """Run one named query inside an open transaction and time it per query"""
+        started = time.perf_counter()
+        result = await tx.run(self.queries[name], params or {})
+        records = await result.data()
+        tracer.observe("graph_query_seconds", time.perf_counter() - started, DEFAULT_BUCKETS, query=name)
+        return records
+
+    async def _query(self, name: str, params: dict | None = None, read: bool = False) -> list[dict]:
+        # Managed transactions retry transient errors, and read ones can go to any cluster member
+        async with self._session(read) as session:
+            work = lambda tx: self._run(tx, name, params)
+            return await (session.execute_read(work) if read else session.execute_write(work))
+
+    async def create_persona(self, persona: dict) -> str:
+        records = await self._query("create_persona", persona)
+        return records[0]['uuid'] if records else ""
+
+    async def personas_page(self, limit: int, after: str = "") -> list[dict]:
+        """Persona nodes, newest first, starting after the persona with uuid after"""
+        if after:
+            records = await self._query("personas_page_after", {'after': after, 'limit': limit}, read=True)
+        else:
+            records = await self._query("personas_page", {'limit': limit}, read=True)
+        return [record['a'] for record in records]
+
+    async def stream_personas(self, fetch_size: int = 500):
+        """Persona nodes, newest first, streamed from one query instead of paging with SKIP"""
+        started = time.perf_counter()
+        async with self._session(read=True, fetch_size=fetch_size) as session:
+            result = await session.run(self.queries["personas"])
+            async for record in result:
+                yield record['a']
+        tracer.observe("graph_query_seconds", time.perf_counter() - started, DEFAULT_BUCKETS, query="personas")
+
+    async def import_personas(self, personas: list[dict]) -> int:
+        """Create or update a chunk of personas with one UNWIND"""
+        records = await self._query("import_personas", {'personas': personas})
+        return records[0]['imported'] if records else 0
+
+    async def search_personas(self, query: str, offset: int, limit: int) -> list[dict]:
+        """Persona nodes matching every word of query as a prefix, best match first"""
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return []
+        # Words only, so no Lucene syntax from the user reaches the query
+        lucene = " AND ".join(f"{word}*" for word in words)
+        records = await self._query("search_personas", {'query': lucene, 'offset': offset, 'limit': limit}, read=True)
+        return [record['a'] for record in records]
+
+    async def get_persona(self, uuid: str) -> dict | None:
+        records = await self._query("get_persona", {'uuid': uuid}, read=True)
+        return records[0]['a'] if records else None
+
+    async def find_user(self, name: str, group_id: str) -> str:
+        records = await self._query("get_user", {'name': name, 'group_id': group_id}, read=True)
+        return records[0]['uuid'] if records else ""
+
+    async def merge_user(self, name: str, group_id: str, uuid: str, name_embedding: list[float]) -> str:
+        """The user's node in group_id, created with uuid unless another writer got there first"""
+        records = await self._query("merge_user", {'name': name, 'group_id': group_id, 'uuid': uuid, 'name_embedding': name_embedding})
+        return records[0]['uuid'] if records else ""
+
+    async def ping(self) -> None:
+        """Round trip through the connection pool, for the readiness probe"""
+        await self._query("ping", read=True)
+
+    async def schema_version(self) -> int | None:
+        records = await self._query("get_schema_version", read=True)
+        return records[0]['version'] if records else None
+
+    async def set_schema_version(self, version: int) -> None:
+        await self._query("set_schema_version", {'version': version})
+
+    async def consolidation_groups(self, after: str, keep_recent: int, limit: int) -> list[str]:
+        """Groups after the given one, in order, with more than keep_recent episodes"""
+        records = await self._query("consolidation_groups", {'after': after, 'keep_recent': keep_recent, 'limit': limit}, read=True)
+        return [record['group_id'] for record in records]
+
+    async def graph_size(self, group_id: str | None = None) -> dict:
+        records = await self._query("graph_size", {'group_id': group_id}, read=True)
+        return records[0] if records else {'episodes': 0, 'entities': 0, 'facts': 0}
+
+    async def merge_duplicate_facts(self, group_id: str) -> int:
+        records = await self._query("merge_duplicate_facts", {'group_id': group_id})
+        return (records[0]['merged'] or 0) if records else 0
+
+    async def prune_expired_facts(self, group_id: str, older_than_days: float) -> int:
+        records = await self._query("prune_expired_facts", {'group_id': group_id, 'days': older_than_days})
+        return records[0]['pruned'] if records else 0
+
+    async def old_episodes(self, group_id: str, keep_recent: int, limit: int, summary_source: str) -> list[dict]:
+        """Oldest raw episodes of the group beyond the newest keep_recent, oldest first"""
+        params = {'group_id': group_id, 'keep_recent': keep_recent, 'limit': limit, 'summary_source': summary_source}
+        return await self._query("old_episodes", params, read=True)
+
+    async def replace_episodes(self, group_id: str, episode_uuids: list[str], summary: dict) -> str:
+        """Swap episodes for one summary episode and point their facts at it, in one transaction"""
+        params = {'group_id': group_id, 'episode_uuids': episode_uuids, **summary}
+
+        async def work(tx):
+            records = await self._run(tx, "replace_episodes", params)
+            await self._run(tx, "relink_fact_episodes", params)
+            return records[0]['uuid'] if records else ""
+
+        async with self._session() as session:
+            return await session.execute_write(work)
+
+    async def group_memory(self, group_id: str, limit: int) -> dict[str, list[dict]]:
+        """Facts with embeddings, entities and episodes of one group, read as one snapshot"""
+        params = {'group_id': group_id, 'limit': limit}
+
+        async def work(tx):
+            return {
+                "facts": await self._run(tx, "group_facts", params),
+                "nodes": await self._run(tx, "group_entities", params),
+                "episodes": await self._run(tx, "group_episodes", params),
+            }
+
+        async with self._session(read=True) as session:
+            return await session.execute_read(work)
+
+    async def create_indexes(self) -> None:
+        # Schema changes cannot share a transaction with data, so these run auto-commit
+        async with self._session() as session:
+            for statement in (USER_INDEX, USER_CONSTRAINT, PERSONA_UUID_CONSTRAINT, PERSONA_TYPE_INDEX, PERSONA_SEARCH_INDEX):
+                await session.run(statement)
+
+
+class KuzuGraphStore(GraphStore):
+    """Embedded Kuzu: declared tables, and facts stored as RelatesToNode_ between entities"""
+
+    supports_consolidation = False
+    # The embedded database already searches in-process
+    supports_local_index = False
+
+    queries = {
+        **GraphStore.queries,
+        "create_persona": KUZU_AGENT_CREATOR,
+        "import_personas": KUZU_PERSONA_IMPORTER,
+        "search_personas": KUZU_SEARCH_PERSONAS,
+        "merge_user": KUZU_MERGE_USER,
+        "set_schema_version": KUZU_SET_SCHEMA_VERSION,
+    }
+
+    def __init__(self, driver: GraphDriver):
+        super().__init__(driver)
+        self._tables_created = False
+
+    async def _query(self, name: str, params: dict | None = None, read: bool = False) -> list[dict]:
+        if not self._tables_created:
+            await self.driver.execute_query(KUZU_SCHEMA)
+            self._tables_created = True
+        started = time.perf_counter()
+        records, _, _ = await self.driver.execute_query(self.queries[name], **(params or {}))
+        tracer.observe("graph_query_seconds", time.perf_counter() - started, DEFAULT_BUCKETS, query=name)
+        return records
+
+    async def stream_personas(self, fetch_size: int = 500):
+        # The embedded database is in-process, so paging costs no round trips
+        after = ""
+        while True:
+            nodes = await self.personas_page(fetch_size, after)
+            for node in nodes:
+                yield node
+            if len(nodes) < fetch_size:
+                return
+            after = nodes[-1]['uuid']
+
+    async def import_personas(self, personas: list[dict]) -> int:
+        return await super().import_personas([{**p, 'age': int(p['age'])} for p in personas])
+
+    async def search_personas(self, query: str, offset: int, limit: int) -> list[dict]:
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return []
+        records = await self._query("search_personas", {'words': words, 'offset': offset, 'limit': limit})
+        return [record['a'] for record in records]
+
+    async def create_persona(self, persona: dict) -> str:
+        # Gradio's number input hands over floats, the age column is an integer
+        return await super().create_persona({**persona, 'age': int(persona['age'])})
+
+    async def create_indexes(self) -> None:
+        # Kuzu has no secondary indexes; the full-text ones come from Graphiti
+        pass
+
+
+class TunedNeo4jDriver(Neo4jDriver):
+    """Neo4jDriver with an explicitly sized connection pool and read/write routed sessions"""
+
+    def __init__(self, uri: str, user: str | None, password: str | None, database: str = "neo4j"):
+        # Skip Neo4jDriver.__init__, which would open a second driver with default pool settings
+        GraphDriver.__init__(self)
+        self.client = AsyncGraphDatabase.driver(
+            uri=uri,
+            auth=(user or "", password or ""),
+            max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+            connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+            connection_timeout=NEO4J_CONNECTION_TIMEOUT,
+            max_connection_lifetime=NEO4J_MAX_CONNECTION_LIFETIME,
+        )
+        self._database = database
+
+    def session(self, database: str | None = None, access_mode: str = "WRITE", fetch_size: int | None = None):
+        kwargs = {"fetch_size": fetch_size} if fetch_size else {}
+        return self.client.session(database=database or self._database, default_access_mode=access_mode, **kwargs)
+
+    def pool_metrics(self) -> dict:
+        """Open and busy pool connections; the driver keeps its pool private, so this reads it defensively"""
+        pool = getattr(self.client, "_pool", None)
+        connections = [c for per_address in list(getattr(pool, "connections", {}).values()) for c in list(per_address)]
+        in_use = sum(1 for c in connections if getattr(c, "in_use", False))
+        return {"open": len(connections), "in_use": in_use, "max_size": NEO4J_MAX_POOL_SIZE}
+
+
+def create_graph_store(driver: GraphDriver) -> GraphStore:
+    if getattr(driver, "provider", None) == GraphProvider.KUZU:
+        return KuzuGraphStore(driver)
+    return GraphStore(driver)
+
+
+def create_graph_driver(backend: str, uri: str = "", user: str = "", password: str = "", kuzu_path: str = "") -> GraphDriver:
+    if backend == "neo4j":
+        return TunedNeo4jDriver(uri, user, password)
+    if backend == "kuzu":
+        # Optional dependency, only needed for the embedded backend
+        from graphiti_core.driver.kuzu_driver import KuzuDriver
+        directory = os.path.dirname(kuzu_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return KuzuDriver(db=kuzu_path)
+    raise ValueError(f"Unknown graph backend: {backend}")
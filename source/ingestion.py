@@ -0,0 +1,234 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from source.tracing import tracer, DEFAULT_BUCKETS
+
+
+@dataclass
+class Exchange:
+    user_name: str
+    user_message: str
+    assistant_message: str
+    ai_name: str = "AI friend"
+    group_id: str = ""
+    created_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def conversation_key(self) -> tuple[str, str, str]:
+        return self.group_id, self.user_name, self.ai_name
+
+
+class IngestionQueue:
+    """Bounded background pipeline that coalesces exchanges into episode writes.
+
+    Each conversation is pinned to one worker, so its exchanges are written in order.
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[list[Exchange]], Awaitable[None]],
+        max_size: int = 1000,
+        workers: int = 2,
+        batch_size: int = 8,
+        batch_wait: float = 0.5,
+        spill_path: str = "",
+        max_attempts: int = 5,
+        retry_backoff: float = 5.0,
+    ):
+        self.write_batch = write_batch
+        self.max_size = max_size
+        self.num_workers = max(1, workers)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.spill_path = spill_path
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+
+        # One queue per worker, sharing max_size between them
+        self._queues: list[asyncio.Queue] = []
+        self._workers: list[asyncio.Task] = []
+        # Per worker, the conversations of its current batch that are not written yet
+        self._in_flight: dict[int, list[list[Exchange]]] = {}
+        self._closing = False
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+        self.spilled = 0
+        self.batches = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def _ensure_started(self):
+        if not self._queues:
+            size = -(-self.max_size // self.num_workers)
+            self._queues = [asyncio.Queue(maxsize=size) for _ in range(self.num_workers)]
+            self._replay_spill()
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.num_workers)]
+
+    def _queue_for(self, exchange: Exchange) -> asyncio.Queue:
+        return self._queues[hash(exchange.conversation_key) % len(self._queues)]
+
+    def _depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def submit(self, exchange: Exchange) -> None:
+        """Enqueue an exchange, spilling to disk or waiting when the queue is full"""
+        if self._closing:
+            raise RuntimeError("Ingestion queue is shutting down")
+        self._ensure_started()
+        self.enqueued += 1
+        queue = self._queue_for(exchange)
+        if queue.full() and self.spill_path:
+            self._spill([exchange])
+            return
+        # Without a spill file the caller waits for room (backpressure)
+        await queue.put(exchange)
+        tracer.gauge("ingestion_queue_depth", self._depth())
+
+    def _spill(self, exchanges: list[Exchange], count: bool = True) -> None:
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for exchange in exchanges:
+                f.write(json.dumps(asdict(exchange)) + "\n")
+        if count:
+            self.spilled += len(exchanges)
+            tracer.count("ingestion_spilled_total", len(exchanges))
+
+    def _replay_spill(self) -> None:
+        """Move spilled exchanges back into the queue while there is room"""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        with open(self.spill_path, encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        os.remove(self.spill_path)
+
+        remaining = []
+        for line in lines:
+            exchange = Exchange(**json.loads(line))
+            # Lag is measured from the original enqueue, which is lost across restarts
+            exchange.enqueued_at = time.monotonic()
+            queue = self._queue_for(exchange)
+            if queue.full():
+                remaining.append(exchange)
+            else:
+                queue.put_nowait(exchange)
+        if remaining:
+            self._spill(remaining, count=False)
+
+    async def _next_batch(self, queue: asyncio.Queue) -> list[Exchange]:
+        try:
+            first = await asyncio.wait_for(queue.get(), timeout=self.batch_wait * 4)
+        except asyncio.TimeoutError:
+            self._replay_spill()
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write(self, exchanges: list[Exchange]) -> None:
+        """Write one conversation's exchanges, retrying with a doubling backoff. Retries hold
+        up only this worker's conversations, so later exchanges still follow in order"""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self.write_batch(exchanges)
+                self.processed += len(exchanges)
+                self.batches += 1
+                tracer.count("ingestion_exchanges_total", len(exchanges), result="ok")
+                return
+            except Exception as e:
+                print(f"Error ingesting exchanges (attempt {attempt}/{self.max_attempts}): {e}")
+            if attempt < self.max_attempts:
+                self.retried += len(exchanges)
+                tracer.count("ingestion_retries_total", len(exchanges))
+                await asyncio.sleep(min(self.retry_backoff * 2 ** (attempt - 1), 300.0))
+        self.failed += len(exchanges)
+        tracer.count("ingestion_exchanges_total", len(exchanges), result="failed")
+        # Kept for the next replay rather than lost, when there is a spill file
+        if self.spill_path:
+            self._spill(exchanges)
+
+    async def _worker(self, index: int):
+        queue = self._queues[index]
+        while True:
+            batch = await self._next_batch(queue)
+            if not batch:
+                continue
+
+            groups: dict[tuple[str, str, str], list[Exchange]] = {}
+            for exchange in batch:
+                groups.setdefault(exchange.conversation_key, []).append(exchange)
+
+            remaining = self._in_flight[index] = list(groups.values())
+            while remaining:
+                exchanges = remaining[0]
+                await self._write(exchanges)
+                lag = time.monotonic() - min(x.enqueued_at for x in exchanges)
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                tracer.observe("ingestion_lag_seconds", lag, buckets=DEFAULT_BUCKETS)
+                # Only dropped once written (or failed), so a cancelled write is spilled on close
+                remaining.pop(0)
+
+            tracer.gauge("ingestion_queue_depth", self._depth())
+
+            for _ in batch:
+                queue.task_done()
+
+    async def close(self, timeout: float = 30.0) -> None:
+        """Stop accepting exchanges, drain what is queued and stop the workers"""
+        self._closing = True
+        queued = []
+        if self._queues and self._workers:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout=timeout)
+            except asyncio.TimeoutError:
+                for queue in self._queues:
+                    while not queue.empty():
+                        queued.append(queue.get_nowait())
+                        queue.task_done()
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        # Keep whatever did not make it so the next start replays it, the batches the
+        # cancelled workers were writing ahead of the queue so conversations stay in order
+        leftovers = [x for groups in self._in_flight.values() for exchanges in groups for x in exchanges] + queued
+        self._in_flight.clear()
+        if leftovers:
+            if self.spill_path:
+                self._spill(leftovers)
+            print(f"Ingestion drain timed out, {len(leftovers)} exchanges left over")
+
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": self._depth(),
+            "queue_capacity": self.max_size,
+            "workers": len(self._workers),
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "spilled": self.spilled,
+            "batches": self.batches,
+            "last_lag_seconds": round(self.last_lag, 3),
+            "max_lag_seconds": round(self.max_lag, 3),
+        }
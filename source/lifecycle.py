@@ -0,0 +1,236 @@
+"""Service lifecycle of one app process.
+
+The graph service and the agent with its LLM clients are created once, however many
+requests ask for them at the same time. A supervisor probes the graph, retries a failed
+connect with backoff, and on shutdown the process stops taking turns, lets the ones in
+flight finish and drains ingestion before the connections are closed.
+"""
+import asyncio
+import random
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager
+
+from source.tracing import tracer
+
+STARTING = "starting"
+READY = "ready"
+DEGRADED = "degraded"
+DRAINING = "draining"
+STOPPED = "stopped"
+
+
+class ServiceUnavailable(Exception):
+    """Raised when the service cannot be created right now or the process is shutting down"""
+
+
+class ServiceLifecycle:
+    def __init__(
+        self,
+        create_service: Callable[[], Awaitable] | None,
+        create_agent: Callable[[object], Awaitable] | None,
+        probe_timeout: float = 2.0,
+        check_interval: float = 10.0,
+        backoff_initial: float = 1.0,
+        backoff_max: float = 30.0,
+        drain_timeout: float = 30.0,
+    ):
+        self._create_service = create_service
+        self._create_agent = create_agent
+        self.probe_timeout = probe_timeout
+        self.check_interval = check_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.drain_timeout = drain_timeout
+
+        self.service = None
+        self.agent = None
+        self.state = STARTING
+        self.last_error = ""
+        self.last_health: dict = {}
+        self.reconnects = 0
+        self._lock = asyncio.Lock()
+        self._attempted = False
+        self._backoff = backoff_initial
+        self._retry_at = 0.0
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._supervisor: asyncio.Task | None = None
+        self._started = time.monotonic()
+
+    @property
+    def accepting(self) -> bool:
+        return self.state not in (DRAINING, STOPPED)
+
+    def attach(self, service, agent=None) -> None:
+        """Use an already created service and agent, e.g. ones built around fakes"""
+        self.service = service
+        self.agent = agent
+        self.state = READY
+
+    async def ensure_service(self):
+        if self.service is not None:
+            return self.service
+        if not self.accepting:
+            raise ServiceUnavailable("Shutting down")
+        # Requests arriving while another one connects wait for it instead of connecting again
+        async with self._lock:
+            if self.service is None:
+                await self._connect()
+        return self.service
+
+    async def ensure_agent(self):
+        if self.agent is None:
+            service = await self.ensure_service()
+            async with self._lock:
+                if self.agent is None:
+                    self.agent = await self._create_agent(service)
+        return self.agent
+
+    async def _connect(self) -> None:
+        # Within the backoff window callers fail fast instead of piling onto a graph that is down
+        wait = self._retry_at - time.monotonic()
+        if wait > 0:
+            raise ServiceUnavailable(f"Graph unavailable, retrying in {wait:.0f}s: {self.last_error}")
+        self._attempted = True
+        try:
+            with tracer.span("ensure_service"):
+                self.service = await self._create_service()
+        except Exception as e:
+            self.last_error = str(e) or type(e).__name__
+            self._retry_at = time.monotonic() + self._next_backoff()
+            tracer.count("service_connect_failures_total")
+            raise ServiceUnavailable(f"Could not connect to the graph: {self.last_error}") from e
+        self._backoff = self.backoff_initial
+        self._retry_at = 0.0
+        self.last_error = ""
+        if self.accepting:
+            self.state = READY
+
+    def _next_backoff(self) -> float:
+        """Exponential backoff with jitter, so restarted workers do not retry in lockstep"""
+        delay = self._backoff * random.uniform(0.5, 1.0)
+        self._backoff = min(self._backoff * 2, self.backoff_max)
+        return delay
+
+    async def check(self) -> dict:
+        """Probe the graph and update the readiness state"""
+        health = await self.service.graph_health(self.probe_timeout)
+        self.last_health = health
+        if not self.accepting:
+            return health
+        if health["ok"]:
+            if self.state == DEGRADED:
+                # The driver's pool has opened fresh connections for the probe
+                print("Graph reachable again")
+                self.reconnects += 1
+                tracer.count("graph_reconnects_total")
+            self.state = READY
+            self._backoff = self.backoff_initial
+        else:
+            if self.state != DEGRADED:
+                print(f"Error probing the graph: {health['error']}")
+            self.state = DEGRADED
+            self.last_error = health["error"]
+        tracer.gauge("service_ready", 1 if self.state == READY else 0)
+        return health
+
+    async def supervise(self) -> None:
+        """Retries a failed connect with backoff, then probes the graph periodically; while it
+        is unreachable, probes back off from backoff_initial up to the check interval"""
+        while self.accepting:
+            delay = self.check_interval
+            if self.service is None:
+                # Nothing to retry until the warmup or a request has tried to connect
+                delay = self.backoff_initial
+                if self._attempted:
+                    try:
+                        await self.ensure_agent()
+                        continue
+                    except Exception as e:
+                        print(f"Error connecting to the graph: {e}")
+                        delay = max(self._retry_at - time.monotonic(), self.backoff_initial)
+            else:
+                try:
+                    health = await self.check()
+                except Exception as e:
+                    health = {"ok": False}
+                    print(f"Error checking service health: {e}")
+                if not health["ok"]:
+                    delay = min(self._next_backoff(), self.check_interval)
+            await asyncio.sleep(delay)
+
+    def start(self) -> None:
+        if self._supervisor is None:
+            self._supervisor = asyncio.create_task(self.supervise())
+
+    def liveness(self) -> dict:
+        """The process is alive while it serves requests, even with the graph unreachable,
+        since a restart would not bring the graph back"""
+        return {
+            "live": self.state != STOPPED,
+            "state": self.state,
+            "uptime_seconds": round(time.monotonic() - self._started, 1),
+            "turns_in_flight": self._in_flight,
+        }
+
+    async def readiness(self) -> dict:
+        """Ready when the agent is loaded, a fresh graph probe succeeds and ingestion has room"""
+        report = {"ready": False, "state": self.state, "agent_loaded": self.agent is not None, "turns_in_flight": self._in_flight}
+        if self.service is not None and self.accepting:
+            report["graph"] = await self.check()
+            ingestion = self.service.ingestion_metrics()
+            report["ingestion"] = {"queue_depth": ingestion["queue_depth"], "queue_capacity": ingestion["queue_capacity"]}
+            ingestion_full = 0 < ingestion["queue_capacity"] <= ingestion["queue_depth"]
+            report["state"] = self.state
+            report["ready"] = self.state == READY and self.agent is not None and not ingestion_full
+        if self.last_error:
+            report["error"] = self.last_error
+        return report
+
+    @asynccontextmanager
+    async def turn(self):
+        """Wraps one chat turn so the drain on shutdown waits for it"""
+        if not self.accepting:
+            raise ServiceUnavailable("Shutting down")
+        self._in_flight += 1
+        self._idle.clear()
+        tracer.gauge("turns_in_flight", self._in_flight)
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            tracer.gauge("turns_in_flight", self._in_flight)
+            if not self._in_flight:
+                self._idle.set()
+
+    async def drain(self, timeout: float | None = None) -> None:
+        """Stop taking turns, wait for the ones in flight, then flush history and ingestion
+        and close the graph connection"""
+        timeout = self.drain_timeout if timeout is None else timeout
+        self.state = DRAINING
+        tracer.gauge("service_ready", 0)
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        started = time.monotonic()
+        if self._in_flight:
+            print(f"Draining {self._in_flight} turns in flight")
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Error draining: {self._in_flight} turns still running after {timeout:.0f}s")
+        # Finished turns have queued their exchanges, which the service's close writes out
+        remaining = max(timeout - (time.monotonic() - started), 1.0)
+        if self.agent is not None:
+            try:
+                await self.agent.memory.close()
+            except Exception as e:
+                print(f"Error closing conversation history: {e}")
+        if self.service is not None:
+            try:
+                await self.service.close(timeout=remaining)
+            except Exception as e:
+                print(f"Error closing service: {e}")
+        self.state = STOPPED
+        print(f"Drained in {time.monotonic() - started:.1f}s")
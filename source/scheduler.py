@@ -0,0 +1,269 @@
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import openai
+from graphiti_core.llm_client import OpenAIClient
+from graphiti_core.llm_client.config import ModelSize
+from graphiti_core.llm_client.errors import RateLimitError as GraphitiRateLimitError
+
+from source.config import (
+    LLM_MAX_CONCURRENCY,
+    LLM_BACKGROUND_CONCURRENCY,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+    LLM_QUEUE_SIZE,
+    LLM_QUEUE_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_DELAY,
+)
+from source.context import count_tokens
+from source.tracing import DEFAULT_BUCKETS, tracer
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+LANES = (INTERACTIVE, BACKGROUND)
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+    GraphitiRateLimitError,
+)
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a lane's queue is full or a request waited longer than the queue timeout"""
+
+
+class TokenBucket:
+    """Refills at rate per second up to capacity; a rate of 0 disables the limit"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until amount is available"""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        # Requests larger than the bucket only wait for a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount: float) -> None:
+        if self.rate:
+            self._refill()
+            self.level -= amount
+
+    def debit(self, amount: float) -> None:
+        """Charge usage that was only known afterwards; the level may go negative"""
+        self.take(amount)
+
+
+class LLMScheduler:
+    """Admits LLM calls by lane priority within concurrency and request/token rate limits"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        background_concurrency: int = 4,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        queue_size: int = 256,
+        queue_timeout: float = 30.0,
+        max_retries: int = 3,
+        retry_base_delay: float = 0.5,
+    ):
+        self.max_concurrency = max_concurrency
+        # Background work never takes every slot, so interactive turns always find one
+        self.background_concurrency = max(1, min(background_concurrency, max_concurrency - 1 if max_concurrency > 1 else 1))
+        # Buckets hold ten seconds of budget, which bounds bursts after an idle period
+        self.requests = TokenBucket(requests_per_minute / 60, max(requests_per_minute / 6, 1))
+        self.tokens = TokenBucket(tokens_per_minute / 60, max(tokens_per_minute / 6, 1))
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+        self._waiters: dict[str, deque[tuple[asyncio.Future, int]]] = {lane: deque() for lane in LANES}
+        self._running: dict[str, int] = {lane: 0 for lane in LANES}
+        self._wakeup: asyncio.TimerHandle | None = None
+
+        self.admitted = {lane: 0 for lane in LANES}
+        self.rejected = {lane: 0 for lane in LANES}
+        self.retries = {lane: 0 for lane in LANES}
+        self.wait_total = {lane: 0.0 for lane in LANES}
+
+    def _has_slot(self, lane: str) -> bool:
+        if sum(self._running.values()) >= self.max_concurrency:
+            return False
+        return lane == INTERACTIVE or self._running[BACKGROUND] < self.background_concurrency
+
+    def _dispatch(self) -> None:
+        self._grant()
+        for lane in LANES:
+            tracer.gauge("llm_queue_depth", len(self._waiters[lane]), lane=lane)
+
+    def _grant(self) -> None:
+        """Grant slots to queued requests, interactive lane first"""
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            while waiters and waiters[0][0].done():
+                waiters.popleft()
+            while waiters and self._has_slot(lane):
+                future, tokens = waiters[0]
+                delay = max(self.requests.delay(1), self.tokens.delay(tokens))
+                if delay > 0:
+                    # Rate limited: lower lanes must not overtake the head of a higher one
+                    self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                    return
+                waiters.popleft()
+                if future.done():
+                    continue
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                self._running[lane] += 1
+                future.set_result(None)
+            if waiters:
+                return
+
+    @asynccontextmanager
+    async def slot(self, lane: str, tokens: int = 0):
+        """Hold one admitted request on a lane for the duration of the block"""
+        if len(self._waiters[lane]) >= self.queue_size:
+            self.rejected[lane] += 1
+            tracer.count("llm_rejected_total", lane=lane, reason="queue_full")
+            raise SchedulerOverloaded(f"LLM {lane} queue is full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append((future, tokens))
+        queued = time.perf_counter()
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Granted at the same moment the wait gave up
+                self._release(lane)
+            else:
+                future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected[lane] += 1
+                tracer.count("llm_rejected_total", lane=lane, reason="timeout")
+                raise SchedulerOverloaded(f"LLM {lane} request waited more than {self.queue_timeout}s") from None
+            raise
+
+        waited = time.perf_counter() - queued
+        self.admitted[lane] += 1
+        self.wait_total[lane] += waited
+        tracer.observe("llm_queue_wait_seconds", waited, DEFAULT_BUCKETS, lane=lane)
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def _release(self, lane: str) -> None:
+        self._running[lane] -= 1
+        self._dispatch()
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps retries from many callers from arriving together
+        return random.uniform(0, self.retry_base_delay * 2 ** attempt)
+
+    async def run(self, lane: str, call, tokens: int = 0):
+        """Await call() in a slot on the lane, retrying rate limits and transient errors"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.slot(lane, tokens):
+                    return await call()
+            except RETRYABLE_ERRORS:
+                if attempt >= self.max_retries:
+                    raise
+                self.retries[lane] += 1
+                tracer.count("llm_retries_total", lane=lane)
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def stream(self, lane: str, open_stream, tokens: int = 0):
+        """Yield chunks of open_stream() in a slot; only retried before the first chunk"""
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with self.slot(lane, tokens):
+                    async for chunk in open_stream():
+                        started = True
+                        yield chunk
+                return
+            except RETRYABLE_ERRORS:
+                if started or attempt >= self.max_retries:
+                    raise
+                self.retries[lane] += 1
+                tracer.count("llm_retries_total", lane=lane)
+            await asyncio.sleep(self._backoff(attempt))
+
+    def debit(self, tokens: int) -> None:
+        """Charge completion tokens once a response is known"""
+        self.tokens.debit(tokens)
+
+    def metrics(self) -> dict:
+        return {
+            lane: {
+                "queued": len(self._waiters[lane]),
+                "running": self._running[lane],
+                "admitted": self.admitted[lane],
+                "rejected": self.rejected[lane],
+                "retries": self.retries[lane],
+                "avg_wait_ms": round(self.wait_total[lane] / self.admitted[lane] * 1000, 2) if self.admitted[lane] else 0.0,
+            }
+            for lane in LANES
+        }
+
+
+class ScheduledOpenAIClient(OpenAIClient):
+    """Graphiti's OpenAI client with extraction calls admitted on the background lane"""
+
+    def __init__(self, *args, scheduler: LLMScheduler | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or llm_scheduler
+        # The scheduler retries rate limits and transient errors itself, so the SDK must not as well.
+        # Graphiti only re-prompts after invalid responses, which the scheduler does not retry
+        self.client = self.client.with_options(max_retries=0)
+
+    async def generate_response(self, messages, response_model=None, max_tokens=None, model_size=ModelSize.medium):
+        tokens = sum(count_tokens(m.content) for m in messages)
+        generate = super().generate_response
+
+        async def call():
+            # The parent appends instructions to the messages, so every attempt gets fresh copies
+            return await generate([m.model_copy() for m in messages], response_model, max_tokens, model_size)
+
+        response = await self.scheduler.run(BACKGROUND, call, tokens)
+        self.scheduler.debit(count_tokens(json.dumps(response, default=str)))
+        return response
+
+
+llm_scheduler = LLMScheduler(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    background_concurrency=LLM_BACKGROUND_CONCURRENCY,
+    requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+    queue_size=LLM_QUEUE_SIZE,
+    queue_timeout=LLM_QUEUE_TIMEOUT,
+    max_retries=LLM_MAX_RETRIES,
+    retry_base_delay=LLM_RETRY_BASE_DELAY,
+)
@@ -1,148 +1,564 @@
-from datetime import datetime, timezone
-import json
+import asyncio
+from datetime import datetime
+import re
+import time
 import uuid
 
 from graphiti_core import Graphiti
-from graphiti_core.edges import EntityEdge
+from graphiti_core.driver.driver import GraphDriver
+from graphiti_core.embedder.openai import OpenAIEmbedder
 from graphiti_core.nodes import EpisodeType
+from graphiti_core.utils.bulk_utils import RawEpisode
+from graphiti_core.search.search_config import (
+    SearchConfig,
+    EdgeSearchConfig,
+    NodeSearchConfig,
+    EpisodeSearchConfig,
+    EdgeSearchMethod,
+    NodeSearchMethod,
+    EpisodeSearchMethod,
+    EdgeReranker,
+    NodeReranker,
+    EpisodeReranker,
+)
+
+from source.config import (
+    GRAPH_BACKEND,
+    KUZU_DB_PATH,
+    SCHEMA_VERSION,
+    INDEX_BUILD,
+    INGESTION_QUEUE_SIZE,
+    INGESTION_WORKERS,
+    INGESTION_BATCH_SIZE,
+    INGESTION_BATCH_WAIT,
+    INGESTION_SPILL_PATH,
+    INGESTION_MODE,
+    INGESTION_SPOOL_PATH,
+    INGESTION_MAX_ATTEMPTS,
+    INGESTION_RETRY_BACKOFF,
+    RETRIEVAL_EDGE_LIMIT,
+    RETRIEVAL_NODE_LIMIT,
+    RETRIEVAL_EPISODE_LIMIT,
+    CONTEXT_FACTS_TOKENS,
+    CONTEXT_SUMMARIES_TOKENS,
+    CONTEXT_EPISODES_TOKENS,
+    CONTEXT_EPISODE_MAX_TOKENS,
+    CONTEXT_OVERLAP_THRESHOLD,
+    EMBEDDING_CACHE_ENTRIES,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_CAPACITY,
+    RETRIEVAL_CACHE_MAX_BYTES,
+    RETRIEVAL_CACHE_TTL,
+    CONSOLIDATION_KEEP_RECENT,
+    CONSOLIDATION_BATCH,
+    CONSOLIDATION_PRUNE_AFTER_DAYS,
+    CONSOLIDATION_PAUSE,
+    CONSOLIDATION_STATE_PATH,
+    LOCAL_INDEX_ENABLED,
+    LOCAL_INDEX_PATH,
+    LOCAL_INDEX_MAX_GROUPS,
+    LOCAL_INDEX_MAX_ITEMS,
+    LOCAL_INDEX_VECTOR_WEIGHT,
+)
+from source.cache import RetrievalCache
+from source.consolidation import Consolidator
+from source.context import ContextAssembler, ContextItem, count_tokens
+from source.embeddings import CachedEmbedder
+from source.fact_index import GroupIndex, LocalIndex
+from source.graph_store import GraphStore, create_graph_driver, create_graph_store
+from source.ingestion import Exchange, IngestionQueue
+from source.scheduler import ScheduledOpenAIClient
+from source.spool import ExchangeSpool, SpoolDrainer, SpoolIngestion
+from source.startup import startup
+from source.tracing import tracer
+
+
+def group_id_for(user_name: str, persona_uuid: str = "") -> str:
+    """Graph partition holding one user's memory with one persona"""
+    key = f"{user_name}-{persona_uuid}" if persona_uuid else user_name
+    # Graphiti only accepts alphanumerics, dashes and underscores in group ids
+    return re.sub(r"[^A-Za-z0-9_-]", "_", key.strip())
+
+
+def new_persona_uuid() -> str:
+    # Long enough that catalogs of many thousands of personas do not collide
+    return f"agent_{uuid.uuid4().hex[:12]}"
+
+
+def persona_from_node(node: dict) -> dict:
+    return {
+        'uuid': node['uuid'],
+        'name': node['name'],
+        'surname': node['surname'],
+        'full_name': node['full_name'],
+        'age': str(node['age']),
+        'profession': node['profession'],
+        'hobbies': node['hobbies'],
+        'additional_info': node.get('additional_info', '')
+    }
+
+
+def persona_display(persona: dict) -> str:
+    return f"{persona['name']} {persona['surname']} - {persona['profession']}"
 
-from source.config import AGENT_CREATOR, GET_PERSONAS, GET_PERSONA
 
 class GraphitiService:
-    def __init__(self, client: Graphiti):
+    def __init__(self, client: Graphiti, store: GraphStore | None = None):
         self.client = client
+        # Persona, user and schema queries for whichever backend the client's driver is
+        self.store = store or create_graph_store(client.driver)
+        self.retrieval_cache = RetrievalCache(max_bytes=RETRIEVAL_CACHE_MAX_BYTES, ttl=RETRIEVAL_CACHE_TTL)
+        self.local_index = None
+        if LOCAL_INDEX_ENABLED and self.store.supports_local_index:
+            self.local_index = LocalIndex(
+                self.store,
+                client.embedder,
+                path=LOCAL_INDEX_PATH,
+                max_groups=LOCAL_INDEX_MAX_GROUPS,
+                max_items=LOCAL_INDEX_MAX_ITEMS,
+                vector_weight=LOCAL_INDEX_VECTOR_WEIGHT,
+            )
+        if INGESTION_MODE == "spool":
+            # Multi-worker mode: one drainer process writes for every worker
+            self.ingestion = SpoolIngestion(ExchangeSpool(INGESTION_SPOOL_PATH), on_written=self.invalidate_group)
+        else:
+            self.ingestion = IngestionQueue(
+                self._write_exchanges,
+                max_size=INGESTION_QUEUE_SIZE,
+                workers=INGESTION_WORKERS,
+                batch_size=INGESTION_BATCH_SIZE,
+                batch_wait=INGESTION_BATCH_WAIT,
+                spill_path=INGESTION_SPILL_PATH,
+                max_attempts=INGESTION_MAX_ATTEMPTS,
+                retry_backoff=INGESTION_RETRY_BACKOFF,
+            )
+        self.context_assembler = ContextAssembler(
+            {
+                "facts": CONTEXT_FACTS_TOKENS,
+                "summaries": CONTEXT_SUMMARIES_TOKENS,
+                "episodes": CONTEXT_EPISODES_TOKENS,
+            },
+            episode_max_tokens=CONTEXT_EPISODE_MAX_TOKENS,
+            overlap_threshold=CONTEXT_OVERLAP_THRESHOLD,
+        )
+        self.last_retrieval_timings: dict[str, float] = {}
+
+        self._personas: dict[str, dict] = {}
+        self._persona_keys: dict[str, str] = {}
+        self._personas_loaded = False
+        self._persona_lock = asyncio.Lock()
+        self._user_uuids: dict[tuple[str, str], str] = {}
+        self._user_lookups: dict[tuple[str, str], asyncio.Future] = {}
 
     @classmethod
-    async def create(cls, uri: str, user: str, password: str):
-        client = Graphiti(uri, user, password)
-        await client.build_indices_and_constraints()
-        return cls(client)
-
-    async def get_or_create_user_uuid(self, user_name: str) -> str:
-        # Search for existing user
-        query = f"MATCH (n:Entity) WHERE n.name = '{user_name}' RETURN n LIMIT 1"
-        async with self.client.driver.session() as session:
-            result = await session.run(query)
-            records = await result.data()
-            if records:
-                return records[0]['n']['uuid']
-
-        # Create a seed episode to anchor the user node
-        await self.client.add_episode(
-            name="User Creation",
-            episode_body=f"{user_name} started a chat.",
-            source=EpisodeType.text,
-            reference_time=datetime.now(timezone.utc),
-            source_description="GradioChat",
+    async def create(cls, uri: str, user: str, password: str, graph_driver: GraphDriver | None = None):
+        embedder = CachedEmbedder(
+            OpenAIEmbedder(),
+            memory_entries=EMBEDDING_CACHE_ENTRIES,
+            disk_path=EMBEDDING_CACHE_PATH,
+            disk_capacity=EMBEDDING_CACHE_CAPACITY,
         )
+        with startup.phase("graphiti_client"):
+            driver = graph_driver or create_graph_driver(GRAPH_BACKEND, uri, user, password, KUZU_DB_PATH)
+            client = Graphiti(graph_driver=driver, llm_client=ScheduledOpenAIClient(), embedder=embedder)
+        service = cls(client)
+        with startup.phase("schema"):
+            await service._ensure_schema()
+        return service
+
+    async def _ensure_schema(self) -> None:
+        """Build indexes unless the graph's schema marker says they already exist"""
+        if INDEX_BUILD == "never":
+            return
+        if INDEX_BUILD == "auto" and await self.store.schema_version() == SCHEMA_VERSION:
+            return
+        await self.client.build_indices_and_constraints()
+        await self.store.create_indexes()
+        await self.store.set_schema_version(SCHEMA_VERSION)
+
+    async def get_or_create_user_uuid(self, user_name: str, persona_uuid: str) -> str:
+        """Resolve the user's entity node in the conversation's group, creating it if missing.
+        Graphiti extracts the user into that group, so the node is where its facts attach"""
+        key = (user_name, group_id_for(user_name, persona_uuid))
+        user_uuid = self._user_uuids.get(key)
+        if user_uuid:
+            tracer.count("user_resolution_total", result="cached")
+            return user_uuid
+
+        # Concurrent first turns share one lookup; Kuzu has no constraint to settle the race
+        pending = self._user_lookups.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._resolve_user(*key))
+            self._user_lookups[key] = pending
+            pending.add_done_callback(lambda _: self._user_lookups.pop(key, None))
+        user_uuid = await asyncio.shield(pending)
+        if user_uuid:
+            self._user_uuids[key] = user_uuid
+        return user_uuid
 
-        # Search again for the created user
-        async with self.client.driver.session() as session:
-            result = await session.run(query)
-            records = await result.data()
-            if records:
-                return records[0]['n']['uuid']
-        return ""
+    async def _resolve_user(self, user_name: str, group_id: str) -> str:
+        with tracer.span("get_or_create_user_uuid") as span:
+            user_uuid = await self.store.find_user(user_name, group_id)
+            span.attributes["created"] = not user_uuid
+            if not user_uuid:
+                # Embedded like Graphiti's entities, so extraction resolves the user to this node
+                name_embedding = await self.client.embedder.create(input_data=[user_name.replace("\n", " ")])
+                user_uuid = await self.store.merge_user(user_name, group_id, str(uuid.uuid4()), name_embedding)
+        tracer.count("user_resolution_total", result="created" if span.attributes["created"] else "found")
+        return user_uuid
 
     async def create_agent_persona(self, name: str, surname: str, age: int, profession: str, hobbies: str, additional_info: str = "") -> str:
         """Create an agent persona as AgentEntity and return its UUID"""
         try:
             full_name = f"{name} {surname}"
-            persona_uuid = f"agent_{uuid.uuid4().hex[:8]}"
+            persona_uuid = new_persona_uuid()
             
-            async with self.client.driver.session() as session:
-                result = await session.run(AGENT_CREATOR, {
-                    'uuid': persona_uuid,
-                    'name': name,
-                    'surname': surname,
-                    'full_name': full_name,
-                    'age': age,
-                    'profession': profession,
-                    'hobbies': hobbies,
-                    'additional_info': additional_info
-                })
-                records = await result.data()
-                if records:
-                    return records[0]['uuid']
+            persona = {
+                'uuid': persona_uuid,
+                'name': name,
+                'surname': surname,
+                'full_name': full_name,
+                'age': age,
+                'profession': profession,
+                'hobbies': hobbies,
+                'additional_info': additional_info,
+            }
+            created_uuid = await self.store.create_persona(persona)
+            if created_uuid:
+                if self._personas_loaded:
+                    self._index_persona(persona_from_node({**persona, 'uuid': created_uuid}))
+                return created_uuid
             return ""
         except Exception as e:
             print(f"Error creating agent persona: {e}")
             return ""
 
-    async def get_all_personas(self) -> list[dict]:
-        """Get all existing agent personas"""
+    async def import_personas(self, personas: list[dict]) -> int:
+        """Create or update one chunk of personas, as validated by import_personas.py, in one write"""
+        with tracer.span("import_personas", rows=len(personas)):
+            imported = await self.store.import_personas(personas)
+        tracer.count("personas_imported_total", imported)
+        if self._personas_loaded:
+            for persona in personas:
+                self._index_persona(persona_from_node(persona))
+        return imported
+
+    def _index_persona(self, persona: dict) -> None:
+        previous = self._personas.get(persona['uuid'])
+        # An update may rename the persona, so its old display key must stop resolving
+        if previous and self._persona_keys.get(persona_display(previous)) == persona['uuid']:
+            del self._persona_keys[persona_display(previous)]
+        self._personas[persona['uuid']] = persona
+        self._persona_keys[persona_display(persona)] = persona['uuid']
+
+    async def _ensure_persona_catalog(self, refresh: bool = False) -> None:
+        async with self._persona_lock:
+            if self._personas_loaded and not refresh:
+                return
+            personas: dict[str, dict] = {}
+            async for persona in self.iter_personas():
+                personas[persona['uuid']] = persona
+            # The catalog is kept oldest first so new personas are cheap appends
+            self._personas = dict(reversed(list(personas.items())))
+            self._persona_keys = {persona_display(p): p['uuid'] for p in self._personas.values()}
+            self._personas_loaded = True
+
+    async def iter_personas(self, page_size: int = 500):
+        """Stream personas from the graph, newest first, page_size records per fetch"""
+        async for node in self.store.stream_personas(page_size):
+            yield persona_from_node(node)
+
+    async def get_all_personas(self, refresh: bool = False) -> list[dict]:
+        """Get all existing agent personas, newest first"""
         try:
-            async with self.client.driver.session() as session:
-                result = await session.run(GET_PERSONAS)
-                records = await result.data()
-                
-                personas = []
-                for record in records:
-                    node = record['a']
-                    personas.append({
-                        'uuid': node['uuid'],
-                        'name': node['name'],
-                        'surname': node['surname'],
-                        'full_name': node['full_name'],
-                        'age': str(node['age']),
-                        'profession': node['profession'],
-                        'hobbies': node['hobbies'],
-                        'additional_info': node.get('additional_info', '')
-                    })
-                
-                return personas
+            await self._ensure_persona_catalog(refresh)
+            return list(reversed(self._personas.values()))
         except Exception as e:
             print(f"Error getting personas: {e}")
             return []
 
+    async def list_personas(self, limit: int = 50, after: str = "") -> list[dict]:
+        """Get one page of personas, newest first, starting after the persona with uuid after"""
+        if self._personas_loaded:
+            personas = list(reversed(self._personas.values()))
+            start = 0
+            if after:
+                uuids = [p['uuid'] for p in personas]
+                start = uuids.index(after) + 1 if after in uuids else len(personas)
+            return personas[start:start + limit]
+        # Paging the graph avoids loading a large catalog just to show its first page
+        try:
+            return [persona_from_node(node) for node in await self.store.personas_page(limit, after)]
+        except Exception as e:
+            print(f"Error listing personas: {e}")
+            return []
+
+    async def search_personas(self, query: str = "", offset: int = 0, limit: int = 50, after: str = "") -> list[dict]:
+        """Personas whose name, profession or hobbies match every word of query; newest first without one.
+
+        Without a query the page starts after the persona with uuid after, and offset is not used.
+        """
+        if not query.strip():
+            return await self.list_personas(limit, after)
+        try:
+            with tracer.span("search_personas"):
+                nodes = await self.store.search_personas(query, offset, limit)
+            return [persona_from_node(node) for node in nodes]
+        except Exception as e:
+            print(f"Error searching personas: {e}")
+            return []
+
+    async def get_persona_by_display(self, display: str) -> dict:
+        await self._ensure_persona_catalog()
+        persona_uuid = self._persona_keys.get(display)
+        return self._personas.get(persona_uuid, {}) if persona_uuid else {}
+
     async def get_persona_by_uuid(self, uuid: str) -> dict:
         """Get persona details by UUID"""
+        persona = self._personas.get(uuid)
+        if persona is not None:
+            return persona
         try:
-            
-            async with self.client.driver.session() as session:
-                result = await session.run(GET_PERSONA, {'uuid': uuid})
-                records = await result.data()
-                
-                if records:
-                    node = records[0]['a']
-                    return {
-                        'uuid': node['uuid'],
-                        'name': node['name'],
-                        'surname': node['surname'],
-                        'full_name': node['full_name'],
-                        'age': str(node['age']),
-                        'profession': node['profession'],
-                        'hobbies': node['hobbies'],
-                        'additional_info': node.get('additional_info', '')
-                    }
+            node = await self.store.get_persona(uuid)
+            if node:
+                persona = persona_from_node(node)
+                if self._personas_loaded:
+                    self._index_persona(persona)
+                return persona
             return {}
         except Exception as e:
             print(f"Error getting persona: {e}")
             return {}
 
-    async def retrieve_informations(self, center_uuid: str, query: str, num_results: int = 8) -> list[EntityEdge]:
-        results = await self.client.search_(
-            query,
+    async def retrieve_informations(
+        self,
+        center_uuid: str,
+        query: str,
+        num_results: int = 8,
+        group_ids: list[str] | None = None,
+        edge_limit: int | None = None,
+        node_limit: int | None = None,
+        episode_limit: int | None = None,
+        token_budget: int | None = None,
+    ) -> str:
+        """Search the user's memory and format it for the response prompt"""
+        edge_limit = RETRIEVAL_EDGE_LIMIT if edge_limit is None else edge_limit
+        node_limit = RETRIEVAL_NODE_LIMIT if node_limit is None else node_limit
+        episode_limit = RETRIEVAL_EPISODE_LIMIT if episode_limit is None else episode_limit
+        edge_limit, node_limit, episode_limit = (min(limit, num_results) for limit in (edge_limit, node_limit, episode_limit))
+
+        cache_key = self.retrieval_cache.make_key(
+            group_ids, center_uuid, query, edge_limit, node_limit, episode_limit, token_budget
+        )
+        cached = self.retrieval_cache.get(cache_key)
+        tracer.count("retrieval_cache_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+        generation = self.retrieval_cache.generation(cache_key)
+
+        started = time.perf_counter()
+        index = self._local_group_index(group_ids)
+        if index is not None:
+            results = await self.local_index.search(index, query, edge_limit, node_limit, episode_limit)
+        else:
+            # Centered on the user's node, Graphiti ranks facts and entities by graph distance to it
+            results = await self.client.search_(
+                query,
+                config=self._search_config(edge_limit, node_limit, episode_limit, centered=bool(center_uuid)),
+                group_ids=group_ids,
+                center_node_uuid=center_uuid or None,
+            )
+        tracer.count("retrieval_source_total", source="graph" if index is None else "local")
+        searched = time.perf_counter()
+
+        edges = results.edges
+        nodes = results.nodes
+        if center_uuid and index is not None:
+            edges, nodes = self._rerank_by_distance(center_uuid, edges, nodes, index)
+        reranked = time.perf_counter()
+
+        facts_string = self.context_assembler.assemble(
+            [ContextItem(e.fact, rank, e.valid_at or e.created_at) for rank, e in enumerate(edges[:edge_limit])],
+            [ContextItem(n.summary, rank, n.created_at) for rank, n in enumerate(nodes[:node_limit]) if n.summary],
+            [ContextItem(e.content, rank, e.valid_at or e.created_at) for rank, e in enumerate(results.episodes[:episode_limit])],
+            token_budget,
         )
+        formatted = time.perf_counter()
+
+        self.last_retrieval_timings = {
+            "search_ms": (searched - started) * 1000,
+            "rerank_ms": (reranked - searched) * 1000,
+            "format_ms": (formatted - reranked) * 1000,
+        }
+        tracer.record_span("retrieve_informations.search", searched - started)
+        tracer.record_span("retrieve_informations.rerank", reranked - searched)
+        tracer.record_span("retrieve_informations.format", formatted - reranked)
+        tracer.record_span("retrieve_informations", formatted - started)
+        tracer.observe("retrieval_facts_returned", min(len(edges), edge_limit))
+        tracer.observe("retrieval_tokens", count_tokens(facts_string))
+        self.retrieval_cache.put(cache_key, facts_string, generation)
+        return facts_string
+
+    def _local_group_index(self, group_ids: list[str] | None) -> GroupIndex | None:
+        """The in-process index of a single-group search, loading it for the next turn if cold"""
+        if self.local_index is None or not group_ids or len(group_ids) != 1:
+            return None
+        index = self.local_index.get(group_ids[0])
+        if index is None:
+            self.local_index.warm(group_ids[0])
+        return index
+
+    def warm_memory(self, user_name: str, persona_uuid: str) -> None:
+        """Start loading a session's memory into the local index before its first turn"""
+        if self.local_index is not None:
+            self.local_index.warm(group_id_for(user_name, persona_uuid))
+
+    def invalidate_group(self, group_id: str) -> None:
+        """The group's memory changed outside this process, so cached searches and its index are stale"""
+        self.retrieval_cache.invalidate_group(group_id)
+        if self.local_index is not None:
+            self.local_index.drop(group_id)
+
+    @staticmethod
+    def _search_config(edge_limit: int, node_limit: int, episode_limit: int, centered: bool = False) -> SearchConfig:
+        # Categories with a zero limit are left out so they cost nothing. node_distance keeps
+        # the rrf order among results at the same distance from the center node
+        return SearchConfig(
+            edge_config=EdgeSearchConfig(
+                search_methods=[EdgeSearchMethod.bm25, EdgeSearchMethod.cosine_similarity],
+                reranker=EdgeReranker.node_distance if centered else EdgeReranker.rrf,
+            ) if edge_limit else None,
+            node_config=NodeSearchConfig(
+                search_methods=[NodeSearchMethod.bm25, NodeSearchMethod.cosine_similarity],
+                reranker=NodeReranker.node_distance if centered else NodeReranker.rrf,
+            ) if node_limit else None,
+            episode_config=EpisodeSearchConfig(
+                search_methods=[EpisodeSearchMethod.bm25],
+                reranker=EpisodeReranker.rrf,
+            ) if episode_limit else None,
+            limit=max(edge_limit, node_limit, episode_limit, 1),
+        )
+
+    @staticmethod
+    def _rerank_by_distance(center_uuid: str, edges: list, nodes: list, index: GroupIndex) -> tuple[list, list]:
+        """Graphiti's node_distance reranking on the local index's adjacency: facts by their
+        source node's distance to the user node, keeping search order on ties"""
+        candidate_uuids = {node.uuid for node in nodes} | {edge.source_node_uuid for edge in edges}
+        if not candidate_uuids:
+            return edges, nodes
+        neighbours = index.linked_nodes(center_uuid, list(candidate_uuids))
 
-        result = "FACTS:\n"
-        for edge in results.edges:
-            result += edge.fact + "\n"
-        result += "SUMMARIES:\n"
-        for node in results.nodes:
-            result += node.summary + "\n"
-        result += "CONTENTS:\n"
-        for episode in results.episodes:
-            result += episode.content + "\n"
+        def distance(node_uuid: str) -> int:
+            if node_uuid == center_uuid:
+                return 0
+            return 1 if node_uuid in neighbours else 2
 
-        return result
+        edges = sorted(edges, key=lambda e: distance(e.source_node_uuid))
+        nodes = sorted(nodes, key=lambda n: distance(n.uuid))
+        return edges, nodes
 
-    async def log_exchange(self, user_name: str, user_message: str, assistant_message: str, ai_name: str = "AI friend") -> None:
+    async def log_exchange(self, user_name: str, user_message: str, assistant_message: str, ai_name: str = "AI friend", group_id: str = "") -> None:
+        """Queue an exchange for background ingestion into the graph"""
+        await self.ingestion.submit(Exchange(user_name, user_message, assistant_message, ai_name, group_id))
+
+    async def _write_exchanges(self, exchanges: list[Exchange]) -> None:
+        # All exchanges share the same user and AI, so they become a single episode
+        # and pay for one extraction pass instead of one per turn
+        first = exchanges[0]
+        episode_body = "\n".join(
+            f"User {e.user_name}: {e.user_message}\n{e.ai_name}: {e.assistant_message}" for e in exchanges
+        )
         # Include both user name and AI name to differentiate conversations
-        await self.client.add_episode(
-            name=f"Chat: {user_name} with {ai_name}",
-            episode_body=f"User {user_name}: {user_message}\n{ai_name}: {assistant_message}",
-            source=EpisodeType.message,
-            reference_time=datetime.now(timezone.utc),
-            source_description=f"Chatbot-{ai_name}",
+        with tracer.span("log_exchange", exchanges=len(exchanges)):
+            results = await self.client.add_episode(
+                name=f"Chat: {first.user_name} with {first.ai_name}",
+                episode_body=episode_body,
+                source=EpisodeType.message,
+                reference_time=datetime.fromisoformat(exchanges[-1].created_at),
+                source_description=f"Chatbot-{first.ai_name}",
+                group_id=first.group_id or None,
+            )
+        tracer.observe("ingestion_batch_exchanges", len(exchanges))
+        # The group's memory changed, so cached searches over it are stale
+        self.retrieval_cache.invalidate_group(first.group_id)
+        if self.local_index is not None:
+            self.local_index.apply(first.group_id, results)
+
+    async def write_exchanges_bulk(self, exchanges: list[Exchange]) -> None:
+        """Write exchanges of one group through Graphiti's bulk episode API"""
+        group_id = exchanges[0].group_id
+        episodes = [
+            RawEpisode(
+                name=f"Chat: {e.user_name} with {e.ai_name}",
+                content=f"User {e.user_name}: {e.user_message}\n{e.ai_name}: {e.assistant_message}",
+                source_description=f"Chatbot-{e.ai_name}",
+                source=EpisodeType.message,
+                reference_time=datetime.fromisoformat(e.created_at),
+            )
+            for e in exchanges
+        ]
+        with tracer.span("write_exchanges_bulk", exchanges=len(exchanges)):
+            results = await self.client.add_episode_bulk(episodes, group_id=group_id or None)
+        self.retrieval_cache.invalidate_group(group_id)
+        if self.local_index is not None and results is not None:
+            self.local_index.apply(group_id, results)
+
+    def spool_drainer(self, spool: ExchangeSpool) -> SpoolDrainer:
+        """Writer for exchanges spooled by the workers of a multi-worker deployment"""
+        return SpoolDrainer(
+            spool,
+            self._write_exchanges,
+            batch_size=INGESTION_BATCH_SIZE * INGESTION_WORKERS,
+            concurrency=INGESTION_WORKERS,
+            max_attempts=INGESTION_MAX_ATTEMPTS,
+            retry_backoff=INGESTION_RETRY_BACKOFF,
         )
+
+    def consolidator(self, **overrides) -> Consolidator:
+        """Background job that keeps the memory of long conversations compact"""
+        if not self.store.supports_consolidation:
+            raise RuntimeError(f"Memory consolidation needs the Neo4j backend, not {type(self.store).__name__}")
+        settings = {
+            "keep_recent": CONSOLIDATION_KEEP_RECENT,
+            "batch_size": CONSOLIDATION_BATCH,
+            "prune_after_days": CONSOLIDATION_PRUNE_AFTER_DAYS,
+            "pause": CONSOLIDATION_PAUSE,
+            "state_path": CONSOLIDATION_STATE_PATH,
+        }
+        return Consolidator(self, **{**settings, **overrides})
+
+    def ingestion_metrics(self) -> dict:
+        return self.ingestion.metrics()
+
+    def cache_metrics(self) -> dict:
+        return self.retrieval_cache.metrics()
+
+    def local_index_metrics(self) -> dict:
+        return self.local_index.metrics() if self.local_index is not None else {}
+
+    async def graph_health(self, timeout: float = 2.0) -> dict:
+        """Round trip to the graph within timeout, plus the connection pool's usage where the driver reports it"""
+        started = time.perf_counter()
+        health = {"ok": True}
+        try:
+            await asyncio.wait_for(self.store.ping(), timeout)
+        except Exception as e:
+            # A saturated pool shows up here too, as a ping that cannot get a connection in time
+            health = {"ok": False, "error": str(e) or type(e).__name__}
+        health["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        pool_metrics = getattr(self.store.driver, "pool_metrics", None)
+        if pool_metrics is not None:
+            health["pool"] = pool_metrics()
+        return health
+
+    def embedding_metrics(self) -> dict:
+        embedder = getattr(self.client, "embedder", None)
+        return embedder.metrics() if isinstance(embedder, CachedEmbedder) else {}
+
+    async def close(self, timeout: float = 30.0) -> None:
+        """Drain pending ingestion and close the graph connection"""
+        await self.ingestion.close(timeout=timeout)
+        await self.client.close()
+        embedder = getattr(self.client, "embedder", None)
+        if isinstance(embedder, CachedEmbedder):
+            embedder.close()
@@ -0,0 +1,115 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+
+@dataclass(slots=True)
+class SessionState:
+    persona: dict | None = None
+    last_seen: float = field(default_factory=time.monotonic)
+
+
+class SessionRegistry:
+    """Per-session state keyed by the Gradio session hash, with idle eviction"""
+
+    def __init__(self, idle_timeout: float = 1800.0, max_sessions: int = 10000):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        # Kept in last-seen order so eviction only ever looks at the front
+        self._sessions: OrderedDict[str, SessionState] = OrderedDict()
+        self.evicted = 0
+
+    def get(self, key: str) -> SessionState:
+        """Return the session for key, creating it if needed"""
+        self.evict_idle()
+        state = self._sessions.get(key)
+        if state is None:
+            state = SessionState()
+            self._sessions[key] = state
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._sessions.move_to_end(key)
+        state.last_seen = time.monotonic()
+        return state
+
+    def set_persona(self, key: str, persona: dict) -> None:
+        self.get(key).persona = persona
+
+    def drop(self, key: str) -> None:
+        self._sessions.pop(key, None)
+
+    def evict_idle(self) -> int:
+        cutoff = time.monotonic() - self.idle_timeout
+        evicted = 0
+        while self._sessions:
+            key, state = next(iter(self._sessions.items()))
+            if state.last_seen >= cutoff:
+                break
+            del self._sessions[key]
+            evicted += 1
+        self.evicted += evicted
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SqliteSessionRegistry(SessionRegistry):
+    """Keeps personas in a SQLite (WAL) file so every worker of a deployment can serve a session"""
+
+    def __init__(self, path: str, idle_timeout: float = 1800.0, max_sessions: int = 10000):
+        super().__init__(idle_timeout=idle_timeout, max_sessions=max_sessions)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, persona TEXT, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> SessionState:
+        known = key in self._sessions
+        state = super().get(key)
+        if not known:
+            # Sessions first seen here may have been started on another worker
+            row = self._conn.execute("SELECT persona FROM sessions WHERE key = ?", (key,)).fetchone()
+            if row and row[0]:
+                state.persona = json.loads(row[0])
+        return state
+
+    def set_persona(self, key: str, persona: dict) -> None:
+        super().set_persona(key, persona)
+        self._conn.execute(
+            "INSERT INTO sessions (key, persona, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET persona = excluded.persona, updated_at = excluded.updated_at",
+            (key, json.dumps(persona), time.time()),
+        )
+        self._conn.commit()
+
+    def drop(self, key: str) -> None:
+        super().drop(key)
+        self._conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+        self._conn.commit()
+
+    def evict_idle(self) -> int:
+        evicted = super().evict_idle()
+        if evicted:
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.idle_timeout,))
+            self._conn.commit()
+        return evicted
+
+
+def create_session_registry(backend: str, path: str = "", **kwargs) -> SessionRegistry:
+    if backend == "sqlite":
+        return SqliteSessionRegistry(path, **kwargs)
+    if backend == "memory":
+        return SessionRegistry(**kwargs)
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,259 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from typing import Awaitable, Callable
+
+from source.ingestion import Exchange
+from source.tracing import tracer, DEFAULT_BUCKETS
+
+
+def _conversation(exchange: Exchange) -> str:
+    return json.dumps(exchange.conversation_key)
+
+
+class ExchangeSpool:
+    """SQLite (WAL) table of exchanges shared by the workers of one deployment"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS exchanges (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                spooled_at REAL NOT NULL,
+                conversation TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                retry_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS exchanges_retry ON exchanges (retry_at);
+            CREATE TABLE IF NOT EXISTS written_groups (
+                group_id TEXT PRIMARY KEY,
+                written_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS dead_exchanges (
+                seq INTEGER PRIMARY KEY,
+                payload TEXT NOT NULL,
+                spooled_at REAL NOT NULL,
+                attempts INTEGER NOT NULL,
+                error TEXT NOT NULL,
+                failed_at REAL NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def _execute(self, fn):
+        with self._lock:
+            result = fn(self._conn)
+            self._conn.commit()
+            return result
+
+    async def put(self, exchange: Exchange) -> None:
+        payload = json.dumps(asdict(exchange))
+        await asyncio.to_thread(self._execute, lambda conn: conn.execute(
+            "INSERT INTO exchanges (payload, spooled_at, conversation) VALUES (?, ?, ?)",
+            (payload, time.time(), _conversation(exchange)),
+        ))
+
+    async def take(self, limit: int) -> list[tuple[int, Exchange, float]]:
+        """Oldest spooled exchanges; they stay in the spool until acknowledged. Conversations
+        waiting to retry a failed write are skipped whole, so their exchanges stay in order"""
+        rows = await asyncio.to_thread(self._execute, lambda conn: conn.execute(
+            "SELECT seq, payload, spooled_at FROM exchanges "
+            "WHERE conversation NOT IN (SELECT conversation FROM exchanges WHERE retry_at > ?) "
+            "ORDER BY seq LIMIT ?", (time.time(), limit)
+        ).fetchall())
+        return [(seq, Exchange(**json.loads(payload)), spooled_at) for seq, payload, spooled_at in rows]
+
+    async def fail(self, seqs: list[int], error: str, backoff: float, max_attempts: int) -> int:
+        """Record a failed write and hold the exchanges back for a doubling backoff; those
+        that used up max_attempts move to dead_exchanges. Returns how many were moved"""
+        now = time.time()
+        marks = ",".join("?" * len(seqs))
+
+        def fail(conn):
+            attempts = conn.execute(f"SELECT MAX(attempts) FROM exchanges WHERE seq IN ({marks})", seqs).fetchone()[0] or 0
+            retry_at = now + min(backoff * 2 ** attempts, 300.0)
+            conn.execute(
+                f"UPDATE exchanges SET attempts = attempts + 1, retry_at = ?, last_error = ? WHERE seq IN ({marks})",
+                (retry_at, error, *seqs),
+            )
+            exhausted = f"seq IN ({marks}) AND attempts >= ?"
+            conn.execute(
+                "INSERT OR REPLACE INTO dead_exchanges (seq, payload, spooled_at, attempts, error, failed_at) "
+                f"SELECT seq, payload, spooled_at, attempts, last_error, ? FROM exchanges WHERE {exhausted}",
+                (now, *seqs, max_attempts),
+            )
+            return conn.execute(f"DELETE FROM exchanges WHERE {exhausted}", (*seqs, max_attempts)).rowcount
+
+        return await asyncio.to_thread(self._execute, fail)
+
+    async def ack(self, seqs: list[int], group_ids: set[str]) -> None:
+        now = time.time()
+
+        def ack(conn):
+            conn.executemany("DELETE FROM exchanges WHERE seq = ?", [(seq,) for seq in seqs])
+            conn.executemany(
+                "INSERT INTO written_groups (group_id, written_at) VALUES (?, ?) "
+                "ON CONFLICT(group_id) DO UPDATE SET written_at = excluded.written_at",
+                [(group_id, now) for group_id in group_ids],
+            )
+
+        await asyncio.to_thread(self._execute, ack)
+
+    async def written_since(self, since: float) -> list[tuple[str, float]]:
+        return await asyncio.to_thread(self._execute, lambda conn: conn.execute(
+            "SELECT group_id, written_at FROM written_groups WHERE written_at > ?", (since,)
+        ).fetchall())
+
+    async def depth(self) -> int:
+        return await asyncio.to_thread(self._execute, lambda conn: conn.execute(
+            "SELECT COUNT(*) FROM exchanges"
+        ).fetchone()[0])
+
+    async def dead_letters(self) -> int:
+        return await asyncio.to_thread(self._execute, lambda conn: conn.execute(
+            "SELECT COUNT(*) FROM dead_exchanges"
+        ).fetchone()[0])
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class SpoolIngestion:
+    """Drop-in for IngestionQueue in workers: exchanges go to the shared spool instead of
+    being written in-process, and retrieval caches follow writes made by the drainer"""
+
+    def __init__(self, spool: ExchangeSpool, on_written: Callable[[str], None] | None = None, poll_interval: float = 2.0):
+        self.spool = spool
+        self.on_written = on_written
+        self.poll_interval = poll_interval
+        self._watermark = time.time()
+        self._poller: asyncio.Task | None = None
+        self._closing = False
+        self.enqueued = 0
+
+    async def submit(self, exchange: Exchange) -> None:
+        if self._closing:
+            raise RuntimeError("Ingestion queue is shutting down")
+        if self._poller is None and self.on_written is not None:
+            self._poller = asyncio.create_task(self._poll())
+        await self.spool.put(exchange)
+        self.enqueued += 1
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                for group_id, written_at in await self.spool.written_since(self._watermark):
+                    self.on_written(group_id)
+                    self._watermark = max(self._watermark, written_at)
+            except Exception as e:
+                print(f"Error polling ingestion spool: {e}")
+
+    async def close(self, timeout: float = 30.0) -> None:
+        self._closing = True
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+        self.spool.close()
+
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": 0,
+            "queue_capacity": 0,
+            "workers": 0,
+            "enqueued": self.enqueued,
+            "processed": 0,
+            "failed": 0,
+            "retried": 0,
+            "spilled": 0,
+            "batches": 0,
+            "last_lag_seconds": 0.0,
+            "max_lag_seconds": 0.0,
+        }
+
+
+class SpoolDrainer:
+    """Single consumer that writes spooled exchanges to the graph for all workers.
+    Conversations are written concurrently, each one's exchanges in order"""
+
+    def __init__(
+        self,
+        spool: ExchangeSpool,
+        write_batch: Callable[[list[Exchange]], Awaitable[None]],
+        batch_size: int = 32,
+        poll_interval: float = 0.5,
+        concurrency: int = 4,
+        max_attempts: int = 5,
+        retry_backoff: float = 5.0,
+    ):
+        self.spool = spool
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.processed = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.max_lag = 0.0
+
+    async def _write_conversation(self, key: tuple[str, str, str], group: list[tuple[int, Exchange, float]], limit: asyncio.Semaphore) -> None:
+        exchanges = [exchange for _, exchange, _ in group]
+        seqs = [seq for seq, _, _ in group]
+        async with limit:
+            try:
+                await self.write_batch(exchanges)
+            except Exception as e:
+                # Kept in the spool and retried with backoff; the conversation waits meanwhile
+                self.failed += len(exchanges)
+                tracer.count("ingestion_exchanges_total", len(exchanges), result="failed")
+                print(f"Error ingesting exchanges: {e}")
+                dead = await self.spool.fail(seqs, str(e) or type(e).__name__, self.retry_backoff, self.max_attempts)
+                if dead:
+                    self.dead_lettered += dead
+                    tracer.count("ingestion_exchanges_total", dead, result="dead_letter")
+                    print(f"Gave up on {dead} exchanges of group {key[0]} after {self.max_attempts} attempts")
+                return
+        self.processed += len(exchanges)
+        tracer.count("ingestion_exchanges_total", len(exchanges), result="ok")
+        lag = time.time() - min(spooled_at for _, _, spooled_at in group)
+        self.max_lag = max(self.max_lag, lag)
+        tracer.observe("ingestion_lag_seconds", lag, buckets=DEFAULT_BUCKETS)
+        await self.spool.ack(seqs, {key[0]})
+
+    async def drain_once(self) -> int:
+        rows = await self.spool.take(self.batch_size)
+        if not rows:
+            return 0
+        groups: dict[tuple[str, str, str], list[tuple[int, Exchange, float]]] = {}
+        for row in rows:
+            groups.setdefault(row[1].conversation_key, []).append(row)
+
+        limit = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._write_conversation(key, group, limit) for key, group in groups.items()))
+        tracer.gauge("ingestion_queue_depth", await self.spool.depth())
+        return len(rows)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                drained = await self.drain_once()
+            except Exception as e:
+                print(f"Error draining ingestion spool: {e}")
+                drained = 0
+            if drained < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
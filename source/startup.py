@@ -0,0 +1,40 @@
+import time
+from contextlib import contextmanager
+
+from source.tracing import tracer
+
+
+class StartupReport:
+    """Durations of the start-up phases of this process, in the order they finished"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.milestones: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, duration: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+        tracer.gauge("startup_phase_seconds", self.phases[name], phase=name)
+
+    def milestone(self, name: str) -> None:
+        """Time since the process started importing the app, e.g. when the UI is served"""
+        if name not in self.milestones:
+            self.milestones[name] = time.perf_counter() - self.started
+            tracer.gauge("startup_milestone_seconds", self.milestones[name], milestone=name)
+
+    def render(self) -> str:
+        lines = ["Startup report:"]
+        lines.extend(f"  {name:<24} {duration * 1000:9.1f} ms" for name, duration in self.phases.items())
+        lines.extend(f"  @{name:<23} {at * 1000:9.1f} ms" for name, at in self.milestones.items())
+        return "\n".join(lines)
+
+
+startup = StartupReport()
@@ -0,0 +1,50 @@
+import asyncio
+import time
+from typing import AsyncIterator
+
+
+async def _next(deltas: AsyncIterator[str]) -> str:
+    return await anext(deltas)
+
+
+async def coalesce(deltas: AsyncIterator[str], window: float = 0.05, max_chars: int = 64) -> AsyncIterator[str]:
+    """Group token deltas so the UI is updated at most once per window or per max_chars"""
+    deltas = aiter(deltas)
+    buffer: list[str] = []
+    size = 0
+    last_flush = None
+    # The next delta is awaited as a task, so a window can end without cancelling the stream
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(_next(deltas))
+            timeout = max(0.0, last_flush + window - time.monotonic()) if buffer else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                # A slow stream must not hold buffered text past the window
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                last_flush = time.monotonic()
+                continue
+            try:
+                delta = pending.result()
+            except StopAsyncIteration:
+                pending = None
+                break
+            pending = None
+            buffer.append(delta)
+            size += len(delta)
+            now = time.monotonic()
+            # The first delta goes out immediately so time to first token is not delayed
+            if last_flush is None or size >= max_chars or now - last_flush >= window:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                last_flush = now
+    finally:
+        if pending is not None:
+            pending.cancel()
+    if buffer:
+        yield "".join(buffer)
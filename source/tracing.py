@@ -0,0 +1,195 @@
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from source.config import TRACING_SINKS
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    start: float
+    duration: float = 0.0
+    attributes: dict = field(default_factory=dict)
+    error: str = ""
+
+
+class Sink:
+    """Receives finished spans and metric updates"""
+
+    def span(self, span: Span) -> None:
+        pass
+
+    def count(self, name: str, value: float, labels: tuple) -> None:
+        pass
+
+    def observe(self, name: str, value: float, labels: tuple, buckets: tuple) -> None:
+        pass
+
+    def gauge(self, name: str, value: float, labels: tuple) -> None:
+        pass
+
+
+class InMemorySink(Sink):
+    """Keeps the most recent spans for inspection and tests"""
+
+    def __init__(self, max_spans: int = 10000):
+        self.spans: deque[Span] = deque(maxlen=max_spans)
+        self.counters: dict[tuple, float] = {}
+        self.gauges: dict[tuple, float] = {}
+
+    def span(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def count(self, name: str, value: float, labels: tuple) -> None:
+        self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def gauge(self, name: str, value: float, labels: tuple) -> None:
+        self.gauges[(name, labels)] = value
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class PrometheusSink(Sink):
+    """Aggregates spans and metrics and renders them in the Prometheus text format"""
+
+    def __init__(self, prefix: str = "chatbot"):
+        self.prefix = prefix
+        self.counters: dict[str, dict[tuple, float]] = {}
+        self.gauges: dict[str, dict[tuple, float]] = {}
+        self.histograms: dict[str, dict[tuple, _Histogram]] = {}
+
+    def span(self, span: Span) -> None:
+        labels = (("stage", span.name),)
+        self.observe("span_seconds", span.duration, labels, DEFAULT_BUCKETS)
+        if span.error:
+            self.count("span_errors_total", 1, labels)
+
+    def count(self, name: str, value: float, labels: tuple) -> None:
+        series = self.counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: str, value: float, labels: tuple, buckets: tuple) -> None:
+        series = self.histograms.setdefault(name, {})
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = _Histogram(buckets)
+        histogram.observe(value)
+
+    def gauge(self, name: str, value: float, labels: tuple) -> None:
+        self.gauges.setdefault(name, {})[labels] = value
+
+    @staticmethod
+    def _labels(labels: tuple, extra: tuple = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+    def render(self) -> str:
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} counter")
+            lines.extend(f"{metric}{self._labels(labels)} {value}" for labels, value in series.items())
+        for name, series in sorted(self.gauges.items()):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.extend(f"{metric}{self._labels(labels)} {value}" for labels, value in series.items())
+        for name, series in sorted(self.histograms.items()):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{metric}_bucket{self._labels(labels, (('le', bound),))} {cumulative}")
+                lines.append(f"{metric}_bucket{self._labels(labels, (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{metric}_sum{self._labels(labels)} {histogram.sum}")
+                lines.append(f"{metric}_count{self._labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """Spans, counters, gauges and histograms fanned out to pluggable sinks"""
+
+    def __init__(self, sinks: list[Sink] | None = None):
+        self.sinks = sinks if sinks is not None else []
+
+    def add_sink(self, sink: Sink) -> None:
+        self.sinks.append(sink)
+
+    def find_sink(self, sink_type: type) -> Sink | None:
+        return next((sink for sink in self.sinks if isinstance(sink, sink_type)), None)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time a block; attributes may be added to the yielded span while it runs"""
+        span = Span(name, time.perf_counter(), attributes=attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+            for sink in self.sinks:
+                sink.span(span)
+
+    def record_span(self, name: str, duration: float, **attributes) -> None:
+        """Report a stage that was timed elsewhere"""
+        span = Span(name, time.perf_counter() - duration, duration, attributes)
+        for sink in self.sinks:
+            sink.span(span)
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        for sink in self.sinks:
+            sink.count(name, value, key)
+
+    def observe(self, name: str, value: float, buckets: tuple = SIZE_BUCKETS, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        for sink in self.sinks:
+            sink.observe(name, value, key, buckets)
+
+    def gauge(self, name: str, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        for sink in self.sinks:
+            sink.gauge(name, value, key)
+
+    def render_prometheus(self) -> str:
+        sink = self.find_sink(PrometheusSink)
+        return sink.render() if sink is not None else ""
+
+
+def create_tracer(sink_names: str) -> Tracer:
+    sinks: list[Sink] = []
+    for name in filter(None, (part.strip() for part in sink_names.split(","))):
+        if name == "memory":
+            sinks.append(InMemorySink())
+        elif name == "prometheus":
+            sinks.append(PrometheusSink())
+        else:
+            raise ValueError(f"Unknown tracing sink: {name}")
+    return Tracer(sinks)
+
+
+tracer = create_tracer(TRACING_SINKS)
@@ -0,0 +1,52 @@
+import time
+
+from source.cache import RetrievalCache
+
+
+def _key(cache: RetrievalCache, group: str = "g1", query: str = "hello"):
+    return cache.make_key([group], "", query, 8, 4, 3)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    cache = RetrievalCache(ttl=10)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.put(_key(cache), "facts")
+    assert cache.get(_key(cache)) == "facts"
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get(_key(cache)) is None
+
+
+def test_trivially_different_queries_share_an_entry():
+    cache = RetrievalCache()
+    cache.put(_key(cache, query="Hello, world!"), "facts")
+    assert cache.get(_key(cache, query="hello   world")) == "facts"
+
+
+def test_invalidation_drops_the_group_only():
+    cache = RetrievalCache()
+    cache.put(_key(cache, "g1"), "one")
+    cache.put(_key(cache, "g2"), "two")
+    cache.invalidate_group("g1")
+    assert cache.get(_key(cache, "g1")) is None
+    assert cache.get(_key(cache, "g2")) == "two"
+
+
+def test_search_that_raced_an_invalidation_is_not_cached():
+    cache = RetrievalCache()
+    key = _key(cache)
+    generation = cache.generation(key)
+    cache.invalidate_group("g1")
+    cache.put(key, "stale", generation)
+    assert cache.get(key) is None
+    assert cache.stale_puts == 1
+
+
+def test_byte_cap_evicts_least_recently_used():
+    cache = RetrievalCache(max_bytes=10_000)
+    for i in range(100):
+        cache.put(_key(cache, query=f"q{i}"), "x" * 500)
+    assert cache.size_bytes <= 10_000
+    assert cache.evictions > 0
+    assert cache.get(_key(cache, query="q0")) is None
+    assert cache.get(_key(cache, query="q99")) is not None
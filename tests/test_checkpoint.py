@@ -0,0 +1,74 @@
+import asyncio
+
+from source.checkpoint import ConversationCheckpointer, MemoryConversationStore, SqliteConversationStore
+
+
+def test_history_survives_a_restart(tmp_path):
+    path = str(tmp_path / "sessions.db")
+
+    async def write():
+        store = SqliteConversationStore(path, flush_interval=10)
+        await store.append("t1", [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}])
+        await store.close()
+
+    async def read():
+        store = SqliteConversationStore(path)
+        history = await store.history("t1")
+        await store.close()
+        return history
+
+    asyncio.run(write())
+    assert asyncio.run(read()) == ("", [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}])
+
+
+def test_concurrent_cold_loads_share_one_read():
+    store = MemoryConversationStore()
+    reads = []
+
+    async def read(thread_id):
+        reads.append(thread_id)
+        await asyncio.sleep(0.01)
+        return await MemoryConversationStore._read(store, thread_id)
+
+    store._read = read
+
+    async def run():
+        await asyncio.gather(*(store.append("t1", [{"role": "user", "content": str(i)}]) for i in range(5)))
+        return await store.history("t1")
+
+    _, messages = asyncio.run(run())
+    assert reads == ["t1"]
+    assert len(messages) == 5
+
+
+def test_compaction_keeps_the_window(tmp_path):
+    store = SqliteConversationStore(str(tmp_path / "sessions.db"), window=2, compact_after=4)
+
+    async def summarize(summary, messages):
+        return summary + "".join(m["content"] for m in messages)
+
+    async def run():
+        await store.append("t1", [{"role": "user", "content": str(i)} for i in range(6)])
+        await store.compact("t1", summarize)
+        await store.close()
+        reopened = SqliteConversationStore(store.path)
+        history = await reopened.history("t1")
+        await reopened.close()
+        return history
+
+    summary, messages = asyncio.run(run())
+    assert summary == "0123"
+    assert [m["content"] for m in messages] == ["4", "5"]
+
+
+def test_checkpointer_reads_history_from_the_store():
+    store = MemoryConversationStore()
+    checkpointer = ConversationCheckpointer(store)
+
+    async def run():
+        await store.append("t1", [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}])
+        return await checkpointer.aget_tuple({"configurable": {"thread_id": "t1"}})
+
+    checkpoint = asyncio.run(run())
+    messages = checkpoint.checkpoint["channel_values"]["messages"]
+    assert [(m.type, m.content) for m in messages] == [("human", "hi"), ("ai", "hello")]
@@ -0,0 +1,36 @@
+from source.context import ContextAssembler, ContextItem
+
+
+def _assemble(facts=(), summaries=(), episodes=(), **kwargs):
+    assembler = ContextAssembler({"facts": 500, "summaries": 500, "episodes": 500}, **kwargs)
+    items = lambda texts: [ContextItem(text, rank) for rank, text in enumerate(texts)]
+    return assembler.assemble(items(facts), items(summaries), items(episodes)).splitlines()
+
+
+def test_exact_duplicates_are_dropped_across_sections():
+    lines = _assemble(facts=["Ada likes tea."], summaries=["ada likes tea"])
+    assert lines == ["FACTS:", "Ada likes tea.", "SUMMARIES:", "CONTENTS:"]
+
+
+def test_episode_lines_restating_a_fact_are_dropped():
+    lines = _assemble(facts=["Ada likes green tea"], episodes=["Ada likes green tea!\nuser: what about coffee?"])
+    assert lines[-1] == "user: what about coffee?"
+    assert lines.count("Ada likes green tea!") == 0
+
+
+def test_item_adding_detail_is_kept():
+    lines = _assemble(facts=["Ada likes tea", "Ada likes tea from Assam in the morning"])
+    assert "Ada likes tea from Assam in the morning" in lines
+
+
+def test_overlap_threshold_is_configurable():
+    facts = ["Ada works at CERN in Geneva", "Ada works at CERN"]
+    assert "Ada works at CERN" not in _assemble(facts=facts)
+    assert "Ada works at CERN" in _assemble(facts=facts, overlap_threshold=1.01)
+
+
+def test_section_budget_is_respected():
+    assembler = ContextAssembler({"facts": 5, "summaries": 0, "episodes": 0})
+    facts = [ContextItem(f"fact number {i} about something else entirely", i) for i in range(5)]
+    lines = assembler.assemble(facts, [], []).splitlines()
+    assert len(lines) < 4
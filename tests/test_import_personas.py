@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from import_personas import persona_from_row, read_personas
+
+VALID = {"name": "Kai", "surname": "Smith", "age": "34", "profession": "Engineer", "hobbies": ["chess", "hiking"]}
+
+
+def test_valid_row():
+    persona = persona_from_row(VALID)
+    assert persona["age"] == 34
+    assert persona["hobbies"] == "chess, hiking"
+    assert persona["full_name"] == "Kai Smith"
+    assert persona["uuid"]
+
+
+@pytest.mark.parametrize("changes, error", [
+    ({"name": " "}, "name is missing"),
+    ({"age": "old"}, "age is not a number"),
+    ({"age": None}, "age is not a number"),
+    ({"age": "inf"}, "age is not a number"),
+    ({"age": "1e400"}, "age is not a number"),
+    ({"age": "nan"}, "age is not a number"),
+    ({"age": 0}, "age is out of range"),
+    ({"age": 151}, "age is out of range"),
+    ({"uuid": "a b"}, "uuid has characters"),
+    ({"profession": "x" * 2001}, "longer than"),
+])
+def test_invalid_rows_raise_value_error(changes, error):
+    with pytest.raises(ValueError, match=error):
+        persona_from_row({**VALID, **changes})
+
+
+def test_given_uuid_is_kept():
+    assert persona_from_row({**VALID, "uuid": "agent_1"})["uuid"] == "agent_1"
+
+
+def test_invalid_lines_are_reported_and_skipped(tmp_path):
+    path = tmp_path / "personas.jsonl"
+    path.write_text("\n".join([
+        json.dumps(VALID),
+        "not json",
+        json.dumps([1, 2]),
+        "",
+        json.dumps({**VALID, "age": "inf"}),
+        json.dumps({**VALID, "name": "Ada"}),
+    ]) + "\n")
+    errors = []
+    personas = list(read_personas(str(path), lambda line_no, e: errors.append(line_no)))
+    assert [(line_no, p["name"]) for line_no, p in personas] == [(1, "Kai"), (6, "Ada")]
+    assert errors == [2, 3, 5]
+
+
+def test_start_line_skips_earlier_rows(tmp_path):
+    path = tmp_path / "personas.csv"
+    path.write_text("name,surname,age\nKai,Smith,34\nAda,Lovelace,36\n")
+    personas = list(read_personas(str(path), lambda line_no, e: None, start_line=3))
+    assert [(line_no, p["name"]) for line_no, p in personas] == [(3, "Ada")]
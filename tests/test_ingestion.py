@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+from source.ingestion import Exchange, IngestionQueue
+
+
+def _exchange(user: str, message: str) -> Exchange:
+    return Exchange(user, message, "reply", group_id=f"group_{user}")
+
+
+def test_conversations_are_written_in_order_across_workers():
+    written = []
+
+    async def write(batch):
+        await asyncio.sleep(0.001)
+        written.extend((x.user_name, x.user_message) for x in batch)
+
+    async def run():
+        queue = IngestionQueue(write, workers=4, batch_size=3, batch_wait=0.01)
+        for i in range(10):
+            for user in ("a", "b", "c"):
+                await queue.submit(_exchange(user, f"m{i}"))
+        await queue.close(timeout=5)
+        return queue
+
+    queue = asyncio.run(run())
+    for user in ("a", "b", "c"):
+        assert [m for u, m in written if u == user] == [f"m{i}" for i in range(10)]
+    assert queue.processed == 30
+
+
+def test_failed_write_is_retried():
+    calls = []
+
+    async def write(batch):
+        calls.append(len(batch))
+        if len(calls) < 3:
+            raise RuntimeError("graph unavailable")
+
+    async def run():
+        queue = IngestionQueue(write, workers=1, batch_wait=0.01, retry_backoff=0.001, max_attempts=3)
+        await queue.submit(_exchange("a", "hi"))
+        await queue.close(timeout=5)
+        return queue
+
+    queue = asyncio.run(run())
+    assert len(calls) == 3
+    assert queue.processed == 1 and queue.failed == 0 and queue.retried == 2
+
+
+def test_exhausted_retries_are_spilled_and_replayed(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    healthy = False
+    written = []
+
+    async def write(batch):
+        if not healthy:
+            raise RuntimeError("graph unavailable")
+        written.extend(x.user_message for x in batch)
+
+    async def run(queue):
+        await queue.submit(_exchange("a", "hi"))
+        await queue.close(timeout=5)
+
+    first = IngestionQueue(write, workers=1, batch_wait=0.01, retry_backoff=0.001, max_attempts=2, spill_path=str(spill))
+    asyncio.run(run(first))
+    assert first.failed == 1
+    assert [json.loads(line)["user_message"] for line in spill.read_text().splitlines()] == ["hi"]
+
+    # The next queue replays the spill file on start
+    healthy = True
+    second = IngestionQueue(write, workers=1, batch_wait=0.01, spill_path=str(spill))
+    asyncio.run(run(second))
+    assert written == ["hi", "hi"]
+    assert not spill.exists()
+
+
+def test_close_spills_the_batch_being_written_ahead_of_the_queue(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+
+    async def write(batch):
+        await asyncio.sleep(10)
+
+    async def run():
+        queue = IngestionQueue(write, workers=1, batch_size=2, batch_wait=0.01, spill_path=str(spill))
+        for i in range(5):
+            await queue.submit(_exchange("a", f"m{i}"))
+        await asyncio.sleep(0.1)
+        await queue.close(timeout=0.1)
+
+    asyncio.run(run())
+    assert [json.loads(line)["user_message"] for line in spill.read_text().splitlines()] == [f"m{i}" for i in range(5)]
+
+
+def test_full_queue_spills_instead_of_blocking(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+
+    async def run():
+        release = asyncio.Event()
+
+        async def write(batch):
+            await release.wait()
+
+        queue = IngestionQueue(write, max_size=2, workers=1, batch_size=1, batch_wait=0.01, spill_path=str(spill))
+        for i in range(6):
+            await queue.submit(_exchange("a", f"m{i}"))
+        spilled = queue.spilled
+        release.set()
+        await queue.close(timeout=5)
+        return spilled
+
+    assert asyncio.run(run()) > 0
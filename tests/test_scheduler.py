@@ -0,0 +1,113 @@
+import asyncio
+
+import openai
+import pytest
+
+from source.scheduler import BACKGROUND, INTERACTIVE, LLMScheduler, SchedulerOverloaded
+
+
+def test_background_never_takes_every_slot():
+    scheduler = LLMScheduler(max_concurrency=3, background_concurrency=5)
+    peak = {"background": 0}
+    running = {"background": 0}
+
+    async def background_call():
+        running["background"] += 1
+        peak["background"] = max(peak["background"], running["background"])
+        await asyncio.sleep(0.02)
+        running["background"] -= 1
+
+    async def interactive_call():
+        return "ok"
+
+    async def run():
+        background = [asyncio.create_task(scheduler.run(BACKGROUND, background_call)) for _ in range(6)]
+        await asyncio.sleep(0.005)
+        # An interactive call is admitted while background work is queued
+        result = await asyncio.wait_for(scheduler.run(INTERACTIVE, interactive_call), timeout=0.015)
+        await asyncio.gather(*background)
+        return result
+
+    assert asyncio.run(run()) == "ok"
+    assert peak["background"] == 2
+
+
+def test_full_queue_is_rejected():
+    scheduler = LLMScheduler(max_concurrency=1, queue_size=1)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+
+        running = asyncio.create_task(scheduler.run(INTERACTIVE, slow))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(scheduler.run(INTERACTIVE, slow))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerOverloaded):
+            await scheduler.run(INTERACTIVE, slow)
+        release.set()
+        await asyncio.gather(running, queued)
+
+    asyncio.run(run())
+    assert scheduler.rejected[INTERACTIVE] == 1
+
+
+def test_queue_timeout_is_rejected():
+    scheduler = LLMScheduler(max_concurrency=1, queue_timeout=0.01)
+
+    async def run():
+        release = asyncio.Event()
+        running = asyncio.create_task(scheduler.run(INTERACTIVE, release.wait))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerOverloaded):
+            await scheduler.run(INTERACTIVE, release.wait)
+        release.set()
+        await running
+
+    asyncio.run(run())
+
+
+def test_transient_errors_are_retried_up_to_max_retries():
+    scheduler = LLMScheduler(max_retries=2, retry_base_delay=0)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise openai.APIConnectionError(request=None)
+
+    with pytest.raises(openai.APIConnectionError):
+        asyncio.run(scheduler.run(INTERACTIVE, call))
+    assert len(attempts) == 3
+    assert scheduler.retries[INTERACTIVE] == 2
+
+
+def test_other_errors_are_not_retried():
+    scheduler = LLMScheduler(max_retries=2, retry_base_delay=0)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.run(INTERACTIVE, call))
+    assert len(attempts) == 1
+
+
+def test_stream_is_not_retried_after_the_first_chunk():
+    scheduler = LLMScheduler(max_retries=2, retry_base_delay=0)
+    opened = []
+
+    async def open_stream():
+        opened.append(1)
+        yield "a"
+        raise openai.APIConnectionError(request=None)
+
+    async def run():
+        return [chunk async for chunk in scheduler.stream(INTERACTIVE, open_stream)]
+
+    with pytest.raises(openai.APIConnectionError):
+        asyncio.run(run())
+    assert len(opened) == 1
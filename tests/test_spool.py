@@ -0,0 +1,65 @@
+import asyncio
+
+from source.ingestion import Exchange
+from source.spool import ExchangeSpool, SpoolDrainer
+
+
+def _exchange(user: str, message: str) -> Exchange:
+    return Exchange(user, message, "reply", group_id=f"group_{user}")
+
+
+def test_failed_conversation_waits_for_its_backoff(tmp_path):
+    spool = ExchangeSpool(str(tmp_path / "spool.db"))
+
+    async def run():
+        await spool.put(_exchange("a", "first"))
+        await spool.put(_exchange("b", "other"))
+        await spool.put(_exchange("a", "second"))
+        rows = await spool.take(10)
+        failed = [seq for seq, exchange, _ in rows if exchange.user_name == "a"]
+        await spool.fail(failed, "boom", backoff=60, max_attempts=5)
+        # Only the other conversation is handed out while "a" backs off
+        return [exchange.user_message for _, exchange, _ in await spool.take(10)]
+
+    assert asyncio.run(run()) == ["other"]
+    spool.close()
+
+
+def test_exchanges_move_to_dead_letters_after_max_attempts(tmp_path):
+    spool = ExchangeSpool(str(tmp_path / "spool.db"))
+    drainer = SpoolDrainer(spool, None, max_attempts=2, retry_backoff=0)
+
+    async def write(batch):
+        raise RuntimeError("boom")
+
+    drainer.write_batch = write
+
+    async def run():
+        await spool.put(_exchange("a", "hi"))
+        await drainer.drain_once()
+        await drainer.drain_once()
+        return await spool.depth(), await spool.dead_letters()
+
+    assert asyncio.run(run()) == (0, 1)
+    assert drainer.dead_lettered == 1
+    spool.close()
+
+
+def test_acknowledged_exchanges_leave_the_spool(tmp_path):
+    spool = ExchangeSpool(str(tmp_path / "spool.db"))
+    written = []
+
+    async def write(batch):
+        written.extend(x.user_message for x in batch)
+
+    drainer = SpoolDrainer(spool, write)
+
+    async def run():
+        for i in range(3):
+            await spool.put(_exchange("a", f"m{i}"))
+        await drainer.drain_once()
+        return await spool.depth()
+
+    assert asyncio.run(run()) == 0
+    assert written == ["m0", "m1", "m2"]
+    spool.close()
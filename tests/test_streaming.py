@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+from source.streaming import coalesce
+
+
+async def _deltas(timeline):
+    for delta, pause in timeline:
+        await asyncio.sleep(pause)
+        yield delta
+
+
+def _collect(timeline, **kwargs):
+    async def run():
+        started = time.monotonic()
+        return [(chunk, time.monotonic() - started) async for chunk in coalesce(_deltas(timeline), **kwargs)]
+
+    return asyncio.run(run())
+
+
+def test_first_delta_is_not_delayed():
+    chunks = _collect([("a", 0), ("b", 0), ("c", 0)], window=1.0)
+    assert chunks[0][0] == "a"
+    assert "".join(chunk for chunk, _ in chunks) == "abc"
+
+
+def test_buffer_is_flushed_when_the_window_ends_during_a_pause():
+    chunks = _collect([("a", 0), ("b", 0.01), ("c", 0.5)], window=0.05)
+    assert [chunk for chunk, _ in chunks] == ["a", "b", "c"]
+    # "b" went out when its window ended, not when "c" arrived
+    assert chunks[1][1] < 0.3
+
+
+def test_max_chars_flushes_early():
+    chunks = _collect([("a", 0)] + [("xxxx", 0)] * 4, window=10, max_chars=8)
+    assert [chunk for chunk, _ in chunks] == ["a", "xxxxxxxx", "xxxxxxxx"]